@@ -12,6 +12,8 @@ from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
 from gtfs_scheduler import GTFSScheduler
 from email_fetcher import EmailFetcher
+from gtfs_stream import scan_feed
+from feed_registry import FeedRegistry
 
 # Configure logging
 logging.basicConfig(
@@ -50,8 +52,17 @@ def gtfs_manager():
         'email_credentials': scheduler.config.get('email_credentials', {'use_env_vars': True})
     }
     
-    # Get list of recent GTFS updates
+    # Get list of recent GTFS updates, with repeated downloads of the same
+    # payload collapsed and the feed that is currently loaded marked as live
     update_files = []
+    registry = FeedRegistry()
+    live_entry = None
+    try:
+        registry.collapse_duplicates(scheduler.update_directory)
+        live_entry = registry.live_entry()
+    except Exception as e:
+        logger.warning(f"Could not update the feed registry: {str(e)}")
+    
     if os.path.exists(scheduler.update_directory):
         for filename in os.listdir(scheduler.update_directory):
             if filename.endswith('.json'):
@@ -64,7 +75,8 @@ def gtfs_manager():
                     'filename': filename,
                     'size': f"{file_size:.2f} MB",
                     'date': update_time.strftime("%Y-%m-%d %H:%M:%S"),
-                    'path': file_path
+                    'path': file_path,
+                    'live': bool(live_entry) and os.path.abspath(live_entry['path']) == os.path.abspath(file_path)
                 })
         
         # Sort by date (newest first)
@@ -74,6 +86,7 @@ def gtfs_manager():
         'admin_gtfs.html', 
         config=config,
         updates=update_files,
+        live_feed=live_entry,
         active_page="gtfs",
         title="GTFS Manager"
     )
@@ -341,6 +354,14 @@ def upload_gtfs_file():
         
         file.save(file_path)
         
+        # Skip the import entirely if this exact payload is already loaded
+        registry = FeedRegistry()
+        entry, _ = registry.register(file_path)
+        if registry.is_live(entry['sha256']):
+            flash(f"File is identical to the live feed {entry['filename']}, nothing to update", 'info')
+            return redirect(url_for('admin_gtfs.gtfs_manager'))
+        file_path = entry['path']
+        
         # Process the file
         try:
             # Gmail credentials from environment variables
@@ -386,18 +407,14 @@ def get_file_info(filename):
         if not os.path.exists(file_path):
             return jsonify({'success': False, 'error': 'File not found'}), 404
         
-        # Parse the file to get basic info
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        # Stream through the file once to get basic info
+        feed_stats = scan_feed(file_path)
         
         # Extract basic stats
         stats = {
             'filename': filename,
             'size': os.path.getsize(file_path) / (1024 * 1024),  # Size in MB
-            'routes': len(data.get('routes', [])),
-            'vessels': len(set(v.get('vessel') for v in data.get('routes', []))),
-            'ports': len(set([r.get('origin_port_name') for r in data.get('routes', [])] + 
-                           [r.get('destination_port_name') for r in data.get('routes', [])]))
+            **feed_stats.to_dict()
         }
         
         return jsonify({'success': True, 'stats': stats})
@@ -557,18 +574,22 @@ def force_greeka_update():
             flash('No GTFS attachments found in Greeka webmail emails', 'warning')
             return redirect(url_for('admin_gtfs.gtfs_manager'))
         
+        # Collapse repeated downloads of the same payload onto one file. A forced
+        # update still reloads the newest feed even if it is already live. Files
+        # are ordered by their newest download, not by the mtime of the kept copy.
+        registry = FeedRegistry()
+        all_attachments = list(dict.fromkeys(
+            registry.register(file_path)[0]['path']
+            for file_path in sorted(all_attachments, key=os.path.getmtime, reverse=True)
+        ))
+        
         # Find the newest valid file
         newest_file = None
-        newest_time = None
         
         for file_path in all_attachments:
-            if not fetcher.validate_gtfs_json(file_path):
-                continue
-            
-            file_time = os.path.getmtime(file_path)
-            if newest_time is None or file_time > newest_time:
-                newest_time = file_time
+            if fetcher.validate_gtfs_json(file_path):
                 newest_file = file_path
+                break
         
         if not newest_file:
             flash('No valid GTFS files found in Greeka webmail attachments', 'warning')
@@ -683,18 +704,22 @@ def force_gmail_update():
             flash('No GTFS attachments found in emails', 'warning')
             return redirect(url_for('admin_gtfs.gtfs_manager'))
         
+        # Collapse repeated downloads of the same payload onto one file. A forced
+        # update still reloads the newest feed even if it is already live. Files
+        # are ordered by their newest download, not by the mtime of the kept copy.
+        registry = FeedRegistry()
+        all_attachments = list(dict.fromkeys(
+            registry.register(file_path)[0]['path']
+            for file_path in sorted(all_attachments, key=os.path.getmtime, reverse=True)
+        ))
+        
         # Find the newest valid file
         newest_file = None
-        newest_time = None
         
         for file_path in all_attachments:
-            if not fetcher.validate_gtfs_json(file_path):
-                continue
-            
-            file_time = os.path.getmtime(file_path)
-            if newest_time is None or file_time > newest_time:
-                newest_time = file_time
+            if fetcher.validate_gtfs_json(file_path):
                 newest_file = file_path
+                break
         
         if not newest_file:
             flash('No valid GTFS files found in attachments', 'warning')
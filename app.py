@@ -5,6 +5,7 @@ from datetime import datetime
 import subprocess
 import threading
 import time
+import uuid
 
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
@@ -85,6 +86,15 @@ def initialize_databases():
     except Exception as e:
         logger.error(f"Error checking database tables: {str(e)}")
     
+    # Bring databases created by older versions up to the current schema
+    try:
+        from sqlite_loader import migrate_database
+        created = migrate_database(DB_PATH)
+        if created:
+            logger.info(f"Added missing indexes to {DB_PATH}: {', '.join(created)}")
+    except Exception as e:
+        logger.error(f"Error migrating database schema: {str(e)}")
+    
     # Initialize historical database
     if not os.path.exists(HISTORICAL_DB_PATH) or os.path.getsize(HISTORICAL_DB_PATH) == 0:
         logger.info("Initializing historical ferry database...")
@@ -203,10 +213,10 @@ def chat():
         user_message = data.get("message", "")
         conversation_id = data.get("conversation_id", None)
         
-        # Initialize or retrieve conversation history
-        if not conversation_id:
-            conversation_id = datetime.now().strftime("%Y%m%d%H%M%S")
-            session[conversation_id] = []
+        # Start a new conversation with a random ID, unique across workers;
+        # its history lives in the shared conversation store
+        if not isinstance(conversation_id, str) or not conversation_id or len(conversation_id) > 128:
+            conversation_id = uuid.uuid4().hex
         
         # Process the query with ferry agent
         response = ferry_agent.query(user_message, conversation_id)
@@ -287,18 +297,49 @@ def update_historical_data():
 def get_ports():
     """Get a list of all available ports."""
     try:
+        from port_directory import get_port_directory
         search_term = request.args.get("search", "")
+        ports = get_port_directory().search(search_term)
+        return jsonify({"ports": ports})
+    except Exception as e:
+        logger.error(f"Error retrieving ports: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/fare-calendar", methods=["GET"])
+def fare_calendar():
+    """
+    Get the fare calendar of a port pair, for a month (?month=YYYY-MM) or a
+    date window (?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD).
+    """
+    try:
+        from tools.ferry_tools import month_range, query_fare_calendar
+        
+        origin = request.args.get("origin", "")
+        destination = request.args.get("destination", "")
+        if not origin or not destination:
+            return jsonify({"error": "origin and destination are required"}), 400
         
-        if ferry_agent:
-            port_info = ferry_agent.get_port_information(search_term)
-            # Split the port info string into a list of ports
-            ports = [{"code": line.split(":")[0].strip(), "name": line.split(":")[1].strip()} 
-                     for line in port_info.split("\n") if ":" in line]
-            return jsonify({"ports": ports})
+        month = request.args.get("month")
+        if month:
+            start_date, end_date = month_range(month)
         else:
-            return jsonify({"error": "Ferry agent not initialized"}), 500
+            start_date = request.args.get("start_date")
+            end_date = request.args.get("end_date")
+            if not start_date or not end_date:
+                return jsonify({"error": "month or start_date and end_date are required"}), 400
+        
+        days = query_fare_calendar(origin, destination, start_date, end_date)
+        return jsonify({
+            "origin": origin.upper(),
+            "destination": destination.upper(),
+            "start_date": start_date,
+            "end_date": end_date,
+            "days": days
+        })
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {str(e)}"}), 400
     except Exception as e:
-        logger.error(f"Error retrieving ports: {str(e)}")
+        logger.error(f"Error retrieving fare calendar: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
 def update_database_status():
@@ -330,19 +371,58 @@ def _get_database_counts():
     cursor.execute("SELECT COUNT(*) FROM routes")
     table_counts["routes"] = cursor.fetchone()[0]
     
-    cursor.execute("SELECT COUNT(*) FROM dates_and_vessels")
+    # Counted on the tables behind the compatibility views: one departures row
+    # per dated sailing, stored as one service calendar per route and vessel
+    cursor.execute("SELECT COUNT(*) FROM departures")
     table_counts["dates_and_vessels"] = cursor.fetchone()[0]
     
-    cursor.execute("SELECT COUNT(*) FROM vessels_and_indicative_prices")
+    cursor.execute("SELECT COUNT(*) FROM service_calendars")
+    table_counts["service_calendars"] = cursor.fetchone()[0]
+    
+    cursor.execute("SELECT COUNT(*) FROM route_vessel_prices")
     table_counts["vessels_and_prices"] = cursor.fetchone()[0]
     
-    cursor.execute("SELECT COUNT(*) FROM vessels_and_accommodation_prices")
+    cursor.execute("SELECT COUNT(*) FROM route_accommodation_prices")
     table_counts["accommodation_prices"] = cursor.fetchone()[0]
     
+    cursor.execute("SELECT COUNT(*) FROM ports")
+    table_counts["ports"] = cursor.fetchone()[0]
+    
     conn.close()
     
     return table_counts
 
+@app.route("/api/fast-path-stats", methods=["GET"])
+def fast_path_stats():
+    """Get the hit rate and latencies of the chat fast path and the agent."""
+    try:
+        from fast_path import get_fast_path_stats
+        return jsonify(get_fast_path_stats())
+    except Exception as e:
+        logger.error(f"Error retrieving fast path stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/cache-stats", methods=["GET"])
+def cache_stats():
+    """Get the size and hit rate of the in-process caches."""
+    try:
+        from caching import get_cache_stats
+        return jsonify(get_cache_stats())
+    except Exception as e:
+        logger.error(f"Error retrieving cache stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/session-stats", methods=["GET"])
+def session_stats():
+    """Get the number and footprint of the chat sessions in the conversation store."""
+    try:
+        if ferry_agent is None:
+            return jsonify({"error": "Ferry agent not initialized"}), 500
+        return jsonify(ferry_agent.sessions.stats())
+    except Exception as e:
+        logger.error(f"Error retrieving session stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/database-status", methods=["GET"])
 def database_status():
     """Get the status of the database."""
@@ -382,11 +462,14 @@ def database_status():
             except Exception as e:
                 logger.error(f"Error reading update log: {str(e)}")
         
+        from db import get_pool_stats
+        
         return jsonify({
             "status": "online",
             "table_counts": table_counts,
             "historical_counts": historical_counts,
-            "last_update": last_update
+            "last_update": last_update,
+            "connection_pool": get_pool_stats()
         })
     except Exception as e:
         logger.error(f"Error checking database status: {str(e)}")
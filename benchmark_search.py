@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Benchmark route search latency: the original per-row accommodation lookups
+against the departures table with one set-based accommodation query.
+
+The legacy path reproduces the original search_ferry_routes: a fresh connection
+per query, a routes/dates/prices join, and one accommodation query per result
+row matched with vessel LIKE '%name%'. The current path is
+tools.ferry_tools.find_departures on the pooled connections.
+
+Run from the directory holding gtfs.db:
+
+    python benchmark_search.py --pairs 10 --repeat 20
+"""
+
+import sqlite3
+import argparse
+import statistics
+import time
+
+from db import DB_PATH
+from tools.ferry_tools import find_departures
+from utils import format_schedule_response
+
+LEGACY_SEARCH_QUERY = """
+SELECT
+    r.route_id,
+    r.origin_port_code as origin_code,
+    r.origin_port_name as origin_name,
+    r.destination_port_code as destination_code,
+    r.destination_port_name as destination_name,
+    r.departure_time,
+    r.arrival_time,
+    r.duration,
+    r.company as company_name,
+    r.company_code as company_code,
+    substr(dv.vessel, instr(dv.vessel, '___') + 3) as vessel_name,
+    dv.schedule_date as date,
+    vip.indicative_price
+FROM
+    routes r
+JOIN
+    dates_and_vessels dv ON r.route_id = dv.route_id
+LEFT JOIN
+    vessels_and_indicative_prices vip ON r.route_id = vip.route_id AND vip.vessel = dv.vessel
+WHERE
+    r.origin_port_code = :origin
+    AND r.destination_port_code = :destination
+    AND dv.schedule_date = :date
+ORDER BY
+    r.departure_time
+"""
+
+LEGACY_ACCOMMODATION_QUERY = """
+SELECT
+    substr(vap.accommodation_type, 0, instr(vap.accommodation_type, '___')) as code,
+    substr(vap.accommodation_type, instr(vap.accommodation_type, '___') + 3) as name,
+    vap.price
+FROM
+    vessels_and_accommodation_prices vap
+WHERE
+    vap.route_id = :route_id
+    AND vap.vessel LIKE '%' || :vessel_name || '%'
+"""
+
+def legacy_query(query, params, counter):
+    """Run one query on a fresh connection, as the original db.execute_query did."""
+    counter['queries'] += 1
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+
+def legacy_search(origin, destination, date, counter):
+    """The original search_ferry_routes: one search query plus one query per row."""
+    routes = []
+    for row in legacy_query(LEGACY_SEARCH_QUERY, {"origin": origin, "destination": destination, "date": date},
+                            counter):
+        route_data = {
+            "route_id": row[0],
+            "origin_port_name": row[2],
+            "destination_port_name": row[4],
+            "departure_time": row[5],
+            "arrival_time": row[6],
+            "duration": row[7] or 0,
+            "company_name": row[8],
+            "vessel_name": row[10],
+            "date": row[11],
+            "indicative_price": row[12] or 0
+        }
+        acc_results = legacy_query(LEGACY_ACCOMMODATION_QUERY,
+                                   {"route_id": route_data["route_id"], "vessel_name": route_data["vessel_name"]},
+                                   counter)
+        route_data["accommodations"] = [{"code": r[0], "name": r[1], "price": r[2]} for r in acc_results]
+        routes.append(format_schedule_response(route_data))
+    return routes
+
+def busiest_pairs(limit):
+    """Return the (origin, destination, date) combinations with the most sailings."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        return conn.execute("""
+            SELECT origin_port_code, destination_port_code, schedule_date, COUNT(*) AS sailings
+            FROM departures
+            GROUP BY origin_port_code, destination_port_code, schedule_date
+            ORDER BY sailings DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+    finally:
+        conn.close()
+
+def time_ms(func, repeat):
+    """Median wall time of func() in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+def canonical(routes):
+    """Order-insensitive form of a result list, for comparing the two paths."""
+    return sorted(repr(sorted(route.items())) for route in routes)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ferry route search latency")
+    parser.add_argument("--pairs", type=int, default=10, help="Number of busiest port pairs to search")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed repetitions per pair")
+    args = parser.parse_args()
+
+    print(f"{'pair':<24}{'sailings':>9}{'legacy ms':>11}{'queries':>9}{'new ms':>9}{'speedup':>9}  match")
+    legacy_total = new_total = 0.0
+    for origin, destination, date, sailings in busiest_pairs(args.pairs):
+        counter = {'queries': 0}
+        legacy_routes = legacy_search(origin, destination, date, counter)
+        new_routes = find_departures(origin, destination, date)
+        match = canonical(legacy_routes) == canonical(new_routes)
+
+        legacy_ms = time_ms(lambda: legacy_search(origin, destination, date, {'queries': 0}), args.repeat)
+        new_ms = time_ms(lambda: find_departures(origin, destination, date), args.repeat)
+        legacy_total += legacy_ms
+        new_total += new_ms
+
+        pair = f"{origin}-{destination} {date}"
+        print(f"{pair:<24}{sailings:>9}{legacy_ms:>11.2f}{counter['queries']:>9}{new_ms:>9.2f}"
+              f"{legacy_ms / new_ms:>8.1f}x  {'yes' if match else 'NO'}")
+
+    if new_total:
+        print(f"\nTotal: legacy {legacy_total:.2f} ms, new {new_total:.2f} ms ({legacy_total / new_total:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+In-process caches shared by the chat layer.
+
+TTLCache is a thread-safe LRU cache whose entries also expire after a time to
+live, bounded by entry count and by the byte size reported for each entry.
+
+The answer cache sits in front of FerryAgent.query. It is keyed on the
+normalized intent of a message (resolved port codes, absolute date, question
+type and qualifiers, see fast_path.normalize_intent) plus the ferry data
+version and the identity of the historical database file, which the agent
+reads when a route has no current sailings, so rewordings of a popular
+question share one agent answer. Only the
+intents whose answer the key fully determines (CACHEABLE_INTENTS) are cached:
+context-dependent follow-ups and messages with constraints the intent doesn't
+capture have no normalized intent, and the catch-all 'route' intent covers
+too many different questions about a port pair.
+
+The SQL result cache sits behind FerryAgent.run_ferry_query. It is keyed on
+the canonical form of the SQL the model wrote (see canonicalize_sql) plus the
+data version, so the near-identical queries the model regenerates for the same
+question, in one agent turn or across sessions, run once. Rows are pickled for
+byte accounting, and zlib-compressed when large.
+
+Loaders call notify_data_change() when they finish, which runs the callbacks
+registered with on_data_change(); both caches clear themselves that way. A
+reload in another process changes the data version or the historical file
+identity instead.
+"""
+
+import logging
+import pickle
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from config import HISTORICAL_DB_PATH
+from db import file_identity, get_data_version
+
+logger = logging.getLogger(__name__)
+
+# Answer cache bounds
+ANSWER_CACHE_SIZE = 2048
+ANSWER_CACHE_TTL_SECONDS = 6 * 3600
+ANSWER_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Intents whose answer is fully set by the answer cache key
+CACHEABLE_INTENTS = ("departures", "cheapest", "fastest", "dates")
+
+# SQL result cache bounds; results over SQL_CACHE_MAX_ENTRY_BYTES are not cached
+SQL_CACHE_SIZE = 1024
+SQL_CACHE_TTL_SECONDS = 6 * 3600
+SQL_CACHE_MAX_BYTES = 32 * 1024 * 1024
+SQL_CACHE_MAX_ENTRY_BYTES = 4 * 1024 * 1024
+
+# Pickled results at least this large are stored zlib-compressed
+SQL_COMPRESS_MIN_BYTES = 2048
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with a time to live per entry and optional byte budget.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry and mark it as recently used, or default."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if entry[1] is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> bool:
+        """
+        Store an entry, evicting the least recently used ones over the bounds.
+
+        Args:
+            key: Cache key
+            value: Value to store
+            size: Bytes the entry accounts for against max_bytes
+
+        Returns:
+            bool: False if the entry alone exceeds max_bytes and was not stored
+        """
+        if self.max_bytes is not None and size > self.max_bytes:
+            return False
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self.bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self.bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Drop every entry; the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the size and hit/miss counters of the cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+_data_change_callbacks = []
+
+def on_data_change(callback: Callable[[str], None]) -> Callable[[str], None]:
+    """Register a callback run with the source name ('ferry' or 'historical') after a data load."""
+    _data_change_callbacks.append(callback)
+    return callback
+
+def notify_data_change(source: str):
+    """Run the data change callbacks; called by the loaders when they finish."""
+    logger.info(f"{source} data changed, invalidating caches")
+    for callback in list(_data_change_callbacks):
+        try:
+            callback(source)
+        except Exception as e:
+            logger.error(f"Error in data change callback {callback}: {str(e)}")
+
+_answers = TTLCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS, ANSWER_CACHE_MAX_BYTES)
+on_data_change(lambda source: _answers.clear())
+
+def answer_key(text: str) -> Optional[tuple]:
+    """
+    The answer cache key of a message, or None when it must not be cached.
+    Questions without a date are answered for today, so today's date is part
+    of their key.
+    """
+    from fast_path import normalize_intent
+
+    intent = normalize_intent(text)
+    if intent is None or intent["intent"] not in CACHEABLE_INTENTS:
+        return None
+    date = intent["date"] or datetime.now().strftime("%Y-%m-%d")
+    return (intent["intent"], intent["origin"], intent["destination"], date,
+            tuple(intent["qualifiers"]), get_data_version(), file_identity(HISTORICAL_DB_PATH))
+
+def get_answer(key: tuple) -> Optional[str]:
+    """Return the cached answer for a key, or None."""
+    return _answers.get(key)
+
+def store_answer(key: tuple, answer: str):
+    """Cache an agent answer."""
+    _answers.put(key, answer, len(answer.encode("utf-8")))
+
+# One SQL token per match; whitespace and comments are dropped
+SQL_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>\|\||<=|>=|<>|!=|==|<<|>>|.)
+""", re.S | re.X)
+
+# Results of queries using these change without a data reload
+VOLATILE_SQL_PATTERN = re.compile(r"\b(?:random|randomblob|current_date|current_time|current_timestamp|"
+                                  r"changes|total_changes|last_insert_rowid)\b|'(?:now|localtime)'")
+
+def canonicalize_sql(sql: str) -> str:
+    """
+    Canonical form of an SQL statement: comments and trailing semicolons
+    dropped, tokens separated by single spaces, keywords and identifiers
+    lower-cased (SQLite compares them case-insensitively) and numbers in one
+    spelling. String literals keep their case, as SQLite compares them
+    case-sensitively.
+    """
+    tokens = []
+    for match in SQL_TOKEN_PATTERN.finditer(sql):
+        kind, token = match.lastgroup, match.group()
+        if kind in ("space", "comment"):
+            continue
+        if kind == "word":
+            token = token.lower()
+        elif kind == "number":
+            token = repr(float(token)) if any(char in token for char in ".eE") else str(int(token))
+        tokens.append(token)
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    return " ".join(tokens)
+
+class SQLResultCache:
+    """
+    Result rows of read-only queries by canonical SQL and data version, stored
+    pickled, and compressed when large, with the stored bytes accounted per entry.
+    """
+
+    def __init__(self):
+        self.cache = TTLCache(SQL_CACHE_SIZE, SQL_CACHE_TTL_SECONDS, SQL_CACHE_MAX_BYTES)
+        self._lock = threading.Lock()
+        self.uncacheable = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def execute(self, sql: str, execute: Callable[[str], list]) -> list:
+        """
+        Return the rows of a query, running it with execute() only on a miss.
+
+        Args:
+            sql: SQL text as written by the model
+            execute: Function running the SQL and returning its rows
+
+        Returns:
+            list: Result rows
+        """
+        canonical = canonicalize_sql(sql)
+        if VOLATILE_SQL_PATTERN.search(canonical):
+            with self._lock:
+                self.uncacheable += 1
+            return execute(sql)
+
+        key = (canonical, get_data_version())
+        entry = self.cache.get(key)
+        if entry is not None:
+            compressed, payload = entry
+            return pickle.loads(zlib.decompress(payload) if compressed else payload)
+
+        rows = execute(sql)
+        payload = pickle.dumps(rows, protocol=pickle.HIGHEST_PROTOCOL)
+        raw_size = len(payload)
+        compressed = raw_size >= SQL_COMPRESS_MIN_BYTES
+        if compressed:
+            payload = zlib.compress(payload)
+        if len(payload) <= SQL_CACHE_MAX_ENTRY_BYTES and self.cache.put(key, (compressed, payload), len(payload)):
+            with self._lock:
+                self.compressed += compressed
+                self.raw_bytes += raw_size
+                self.stored_bytes += len(payload)
+        return rows
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache counters plus how much compression saved over all stored results."""
+        stats = self.cache.stats()
+        with self._lock:
+            stats.update({
+                "uncacheable": self.uncacheable,
+                "compressed_results": self.compressed,
+                "compression_ratio": round(self.raw_bytes / self.stored_bytes, 2) if self.stored_bytes else None
+            })
+        return stats
+
+_sql_results = SQLResultCache()
+on_data_change(lambda source: _sql_results.clear())
+
+def cached_query(sql: str, execute: Callable[[str], list]) -> list:
+    """Run a read-only query through the SQL result cache."""
+    return _sql_results.execute(sql, execute)
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Return the counters of the caches."""
+    return {"answers": _answers.stats(), "sql_results": _sql_results.stats()}
@@ -9,9 +9,30 @@ DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///ferry_data.db")
 # Default data file path
 DEFAULT_DATA_PATH = "./attached_assets/GTFS_data_v5.json"
 
-# Maximum conversation history to maintain
+# Historical operating periods, used when a route has no current sailings
+HISTORICAL_DB_PATH = "previous_db.db"
+
+# Content-hash registry of downloaded and imported GTFS feeds
+FEED_REGISTRY_PATH = "feed_registry.json"
+
+# Answer structured searches from in-memory NumPy columns (needs numpy);
+# set TIMETABLE_ENGINE_ENABLED=false to always query SQLite
+TIMETABLE_ENGINE_ENABLED = os.environ.get("TIMETABLE_ENGINE_ENABLED", "true").lower() == "true"
+
+# Answer simple route questions (port pair with a date, cheapest, dates available)
+# from the search tools before calling the agent; set FAST_PATH_ENABLED=false to
+# send every message to the agent
+FAST_PATH_ENABLED = os.environ.get("FAST_PATH_ENABLED", "true").lower() == "true"
+
+# Maximum conversation history to maintain: recent messages kept verbatim per
+# session, older turns are summarized (see session_store.py)
 MAX_CONVERSATION_HISTORY = 10
 
+# Where conversations are kept: "sqlite" shares them between worker processes
+# through CONVERSATIONS_DB_PATH, "memory" keeps them in each process
+CONVERSATION_BACKEND = os.environ.get("CONVERSATION_BACKEND", "sqlite").lower()
+CONVERSATIONS_DB_PATH = os.environ.get("CONVERSATIONS_DB_PATH", "conversations.db")
+
 # Agent configuration
 AGENT_VERBOSE = True
 AGENT_TEMPERATURE = 0.1
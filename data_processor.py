@@ -3,8 +3,12 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 
+from caching import notify_data_change
 from config import DEFAULT_DATA_PATH
 from sqlite_loader import load_data
+from delta_loader import DeltaNotAvailable, apply_delta
+from gtfs_stream import FEED_ERRORS
+from feed_registry import FeedRegistry
 
 logger = logging.getLogger(__name__)
 
@@ -36,21 +40,71 @@ def load_ferry_data(file_path: str = DEFAULT_DATA_PATH) -> List[Dict[str, Any]]:
         logger.error(f"Failed to load ferry data from {file_path}: {str(e)}")
         raise
 
-def update_ferry_data(file_path: str = DEFAULT_DATA_PATH) -> str:
+def record_live_feed(file_path: str) -> None:
+    """Mark a feed as the one currently loaded in the database."""
+    try:
+        FeedRegistry().mark_live(file_path)
+    except Exception as e:
+        logger.warning(f"Could not record {file_path} in the feed registry: {str(e)}")
+
+def update_ferry_data(file_path: str = DEFAULT_DATA_PATH, mode: str = 'auto') -> str:
     """
     Update the database with the latest ferry data.
-    This function will clear existing data and reload from the specified file.
+    
+    Args:
+        file_path: Path to the GTFS JSON feed
+        mode: 'delta' applies only the routes, dates and prices that changed since the
+            previous load, 'full' rebuilds every table from the feed, and 'auto' tries
+            a delta first and falls back to a full reload when no previous snapshot
+            is available or the delta fails.
+    
+    Returns:
+        str: Status message including the change summary for delta updates
+    
+    Raises:
+        FeedFormatError, json.JSONDecodeError, UnicodeDecodeError: If the feed itself is
+            malformed or fails validation; the database is left unchanged
+        RuntimeError: If the feed could not be loaded for any other reason
     """
     try:
+        if mode in ('auto', 'delta'):
+            try:
+                logger.info(f"Applying ferry data from {file_path} as a delta...")
+                summary = apply_delta(json_path=file_path, db_path='gtfs.db')
+                
+                update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                with open("data_updates.log", "a") as f:
+                    f.write(f"{update_time} - INFO - Applied delta update from {file_path}: {summary}\n")
+                
+                record_live_feed(file_path)
+                notify_data_change("ferry")
+                logger.info(f"Ferry data delta update completed: {summary}")
+                return f"Successfully applied delta update from {file_path}: {summary}"
+            except DeltaNotAvailable as e:
+                if mode == 'delta':
+                    raise
+                logger.info(f"Delta update not possible ({str(e)}), falling back to a full reload")
+            except FEED_ERRORS:
+                # A full reload would reject the feed for the same reason
+                raise
+            except Exception as e:
+                if mode == 'delta':
+                    raise
+                logger.warning(f"Delta update failed ({str(e)}), falling back to a full reload", exc_info=True)
+        
         # Use SQLite loader to load data directly into the database
         logger.info(f"Loading ferry data from {file_path} into the database...")
-        result = load_data(json_path=file_path, db_path='gtfs.db')
+        result = load_data(json_path=file_path, db_path='gtfs.db', strict=True)
+        if result.startswith("Error"):
+            raise RuntimeError(result)
         
         # Log the successful update
         update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         with open("data_updates.log", "a") as f:
             f.write(f"{update_time} - INFO - Successfully updated ferry data from {file_path}\n")
         
+        record_live_feed(file_path)
+        notify_data_change("ferry")
         logger.info("Ferry data update completed successfully.")
         return f"Successfully updated ferry data using SQLite loader from {file_path}"
     
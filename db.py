@@ -1,5 +1,7 @@
+import os
 import sqlite3
 import logging
+import threading
 from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
@@ -7,44 +9,172 @@ logger = logging.getLogger(__name__)
 # Path to SQLite database
 DB_PATH = 'gtfs.db'
 
+# Connection pool configuration
+POOL_MAX_IDLE = 8  # Idle connections kept open between queries
+STATEMENT_CACHE_SIZE = 256  # Prepared statements cached per connection
+# Readers open the database read-only with the plain rollback journal. Full reloads
+# rename a new file over it; delta updates write it in place in one transaction.
+POOL_PRAGMAS = [
+    "PRAGMA mmap_size=268435456",  # Map up to 256 MB of the database file
+    "PRAGMA cache_size=-16000",  # ~16 MB page cache per connection
+    "PRAGMA query_only=ON",  # Pooled connections are strictly read-only
+]
+
+def file_identity(path):
+    """Return an identity for a database file (inode and mtime), or None if it is missing."""
+    try:
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_mtime_ns)
+    except OSError:
+        return None
+
+class ConnectionPool:
+    """
+    Thread-aware pool of long-lived, read-only connections to the ferry database.
+
+    Each connection is handed to exactly one thread at a time and returned to the
+    pool afterwards, so the schema parse, page cache and prepared statements are
+    reused across queries. Calling invalidate() (e.g. after a data reload) bumps the
+    pool generation; idle connections are closed immediately and connections that
+    are checked out are closed when they are returned.
+    
+    Every checkout also compares the identity of the database file with the one the
+    pooled connections were opened on, so a file swapped in by another process (or
+    thread) is picked up on the next checkout without an explicit invalidate().
+    """
+
+    def __init__(self, db_path, max_idle=POOL_MAX_IDLE):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._file_id = self._stat_file()
+        self._hits = 0
+        self._misses = 0
+        self._discarded = 0
+        self._invalidations = 0
+
+    def _stat_file(self):
+        """Return an identity for the current database file (inode and mtime)."""
+        return file_identity(self.db_path)
+
+    def check_file(self):
+        """Invalidate the pool if the database file was replaced or modified."""
+        file_id = self._stat_file()
+        if file_id != self._file_id:
+            logger.info(f"{self.db_path} changed on disk, reconnecting pooled readers")
+            self.invalidate(file_id)
+
+    def _connect(self):
+        """Open a new read-only connection and apply the per-connection PRAGMAs."""
+        conn = sqlite3.connect(
+            f"file:{self.db_path}?mode=ro",
+            uri=True,
+            check_same_thread=False,  # Connections move between threads via the pool
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        for pragma in POOL_PRAGMAS:
+            try:
+                conn.execute(pragma)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not apply '{pragma}': {str(e)}")
+        return conn
+
+    def acquire(self):
+        """Check a connection out of the pool, opening a new one on a miss."""
+        self.check_file()
+        with self._lock:
+            generation = self._generation
+            if self._idle:
+                self._hits += 1
+                return self._idle.pop(), generation
+            self._misses += 1
+        return self._connect(), generation
+
+    def release(self, conn, generation):
+        """Return a connection to the pool, closing it if it is stale or surplus."""
+        with self._lock:
+            if generation == self._generation and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._discarded += 1
+        conn.close()
+
+    def invalidate(self, file_id=None):
+        """Drop every pooled connection so the next checkout sees fresh data."""
+        with self._lock:
+            self._file_id = file_id or self._stat_file()
+            self._generation += 1
+            self._invalidations += 1
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        logger.info(f"Connection pool invalidated (generation {self._generation})")
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def stats(self):
+        """Return pool hit/miss counters."""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / total, 4) if total else 0.0,
+                "idle": len(self._idle),
+                "discarded": self._discarded,
+                "invalidations": self._invalidations,
+                "generation": self._generation
+            }
+
+_pool = ConnectionPool(DB_PATH)
+
 @contextmanager
 def get_db_connection():
-    """Get a connection to the SQLite database."""
+    """Check out a pooled, read-only connection to the SQLite database."""
     conn = None
+    generation = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row  # Enable row factory
+        conn, generation = _pool.acquire()
         yield conn
     except sqlite3.Error as e:
         logger.error(f"Database connection error: {str(e)}")
         raise
     finally:
         if conn:
-            conn.close()
+            _pool.release(conn, generation)
 
 def execute_query(query_string, params=None):
-    """Execute a raw SQL query and return results."""
+    """Execute a raw SQL query and return results as a list of tuples."""
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
             if params:
-                cursor.execute(query_string, params)
+                cursor = conn.execute(query_string, params)
             else:
-                cursor.execute(query_string)
-                
-            results = cursor.fetchall()
-            
-            # Convert sqlite3.Row objects to tuples for better compatibility
-            tuple_results = []
-            for row in results:
-                tuple_results.append(tuple(row))
-            
-            return tuple_results
+                cursor = conn.execute(query_string)
+
+            # Pooled connections use the default row factory, so rows are already tuples
+            return cursor.fetchall()
     except sqlite3.Error as e:
         logger.error(f"Error executing query: {str(e)}")
         raise
 
+def invalidate_pool():
+    """Invalidate pooled connections after the underlying data has been replaced."""
+    _pool.invalidate()
+
+def get_data_version():
+    """Return a token that changes every time the ferry data is reloaded."""
+    _pool.check_file()
+    return _pool.generation
+
+def get_pool_stats():
+    """Return connection pool hit/miss counters."""
+    return _pool.stats()
+
 def get_connection():
     """Get a database connection."""
     return sqlite3.connect(DB_PATH)
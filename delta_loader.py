@@ -0,0 +1,276 @@
+"""
+Incremental GTFS updates.
+
+Successive feeds mostly repeat the same itineraries with a shifted date window.
+Instead of rebuilding every table, the delta loader fingerprints each feed item
+by its natural key (itinerary number, operator, ports and stop numbers), compares
+it with the fingerprints stored by the previous load, and applies only the routes,
+dates and prices that were added, removed or changed.
+
+Unlike a full reload, which builds a side file and swaps it in, the diff is
+applied to the live database in place, in a single transaction. Copying the
+database first would make every delta cost as much I/O as the whole file, while
+a typical delta only touches a few percent of the routes. Readers keep seeing the
+previous data until the commit: dirty pages are held in memory rather than spilled
+to the file, so the write lock that blocks readers is only taken while committing.
+Pooled readers notice the new file mtime and reconnect.
+"""
+
+import os
+import sqlite3
+import logging
+import time
+
+from db import invalidate_pool
+from gtfs_stream import FeedStats, iter_routes
+from sqlite_loader import (
+    INSERT_STATEMENTS, BatchInserter, DimensionCache, RouteKeyer, build_route_rows, calendar_rows,
+    calendar_schedule, create_indexes, create_tables, normalize_legacy_tables, rebuild_departures,
+    rebuild_fare_calendar, route_content_hash, route_schedule, validate_row_counts
+)
+
+logger = logging.getLogger(__name__)
+
+# Re-run ANALYZE when at least this share of the routes changed
+ANALYZE_CHANGE_RATIO = 0.1
+
+# Seconds to wait for other writers, or for readers to finish while committing
+WRITE_LOCK_TIMEOUT = 30
+
+class DeltaNotAvailable(Exception):
+    """Raised when the live database has no fingerprints to diff against."""
+
+def _new_summary():
+    """Return an empty change summary."""
+    return {
+        'routes_added': 0,
+        'routes_removed': 0,
+        'routes_changed': 0,
+        'routes_unchanged': 0,
+        'dates_added': 0,
+        'dates_removed': 0,
+        'dates_changed': 0,
+        'prices_added': 0,
+        'prices_removed': 0,
+        'prices_changed': 0
+    }
+
+def _delete_routes(cursor, route_ids):
+    """Delete routes and all of their child rows."""
+    params = [(route_id,) for route_id in route_ids]
+    cursor.executemany("DELETE FROM service_calendars WHERE route_id = ?", params)
+    cursor.executemany("DELETE FROM route_vessel_prices WHERE route_id = ?", params)
+    cursor.executemany("DELETE FROM route_accommodation_prices WHERE route_id = ?", params)
+    cursor.executemany("DELETE FROM route_fingerprints WHERE route_id = ?", params)
+    cursor.executemany("DELETE FROM routes WHERE route_id = ?", params)
+
+def _diff_rows(old, new):
+    """
+    Compare two {key: value} mappings.
+
+    Returns:
+        tuple: (added keys, removed keys, changed keys)
+    """
+    added = [key for key in new if key not in old]
+    removed = [key for key in old if key not in new]
+    changed = [key for key in new if key in old and old[key] != new[key]]
+    return added, removed, changed
+
+def _apply_route_change(cursor, route_id, item, dimensions, summary):
+    """Rewrite one changed route and patch only the child rows that differ."""
+    rows = build_route_rows(item, route_id, dimensions)
+
+    route_row = rows['routes'][0]
+    cursor.execute('''
+        UPDATE routes SET
+            route_number = ?, company = ?, company_code = ?, origin_port_name = ?, origin_port_code = ?,
+            destination_port_name = ?, destination_port_code = ?, departure_time = ?, arrival_time = ?,
+            origin_port_stop = ?, destination_port_stop = ?, departure_offset = ?, arrival_offset = ?, duration = ?
+        WHERE route_id = ?
+    ''', route_row[1:] + (route_id,))
+
+    # Dates: schedule_date -> vessel_id, rewritten as whole calendars when any differ
+    cursor.execute("SELECT vessel_id, start_date, end_date, days FROM service_calendars WHERE route_id = ?",
+                   (route_id,))
+    old_dates = calendar_schedule(cursor.fetchall())
+    new_dates = route_schedule(item, dimensions)
+    added, removed, changed = _diff_rows(old_dates, new_dates)
+    if added or removed or changed:
+        cursor.execute("DELETE FROM service_calendars WHERE route_id = ?", (route_id,))
+        cursor.executemany(INSERT_STATEMENTS['service_calendars'], rows['service_calendars'])
+    summary['dates_added'] += len(added)
+    summary['dates_removed'] += len(removed)
+    summary['dates_changed'] += len(changed)
+
+    # Indicative prices: vessel_id -> price
+    cursor.execute("SELECT vessel_id, indicative_price FROM route_vessel_prices WHERE route_id = ?", (route_id,))
+    old_prices = dict(cursor.fetchall())
+    new_prices = {row[1]: row[2] for row in rows['route_vessel_prices']}
+    added, removed, changed = _diff_rows(old_prices, new_prices)
+    cursor.executemany("DELETE FROM route_vessel_prices WHERE route_id = ? AND vessel_id = ?",
+                       [(route_id, vessel_id) for vessel_id in removed])
+    cursor.executemany("INSERT OR REPLACE INTO route_vessel_prices (route_id, vessel_id, indicative_price) "
+                       "VALUES (?, ?, ?)",
+                       [(route_id, vessel_id, new_prices[vessel_id]) for vessel_id in added + changed])
+    summary['prices_added'] += len(added)
+    summary['prices_removed'] += len(removed)
+    summary['prices_changed'] += len(changed)
+
+    # Accommodation prices: (vessel_id, accommodation_id) -> price
+    cursor.execute("SELECT vessel_id, accommodation_id, price FROM route_accommodation_prices "
+                   "WHERE route_id = ?", (route_id,))
+    old_accommodations = {(row[0], row[1]): row[2] for row in cursor.fetchall()}
+    new_accommodations = {(row[1], row[2]): row[3] for row in rows['route_accommodation_prices']}
+    added, removed, changed = _diff_rows(old_accommodations, new_accommodations)
+    cursor.executemany("DELETE FROM route_accommodation_prices "
+                       "WHERE route_id = ? AND vessel_id = ? AND accommodation_id = ?",
+                       [(route_id,) + key for key in removed])
+    cursor.executemany("INSERT OR REPLACE INTO route_accommodation_prices "
+                       "(route_id, vessel_id, accommodation_id, price) VALUES (?, ?, ?, ?)",
+                       [(route_id,) + key + (new_accommodations[key],) for key in added + changed])
+    summary['prices_added'] += len(added)
+    summary['prices_removed'] += len(removed)
+    summary['prices_changed'] += len(changed)
+
+def apply_delta(json_path, db_path='gtfs.db'):
+    """
+    Apply a GTFS feed to the database as a diff against the previously loaded feed.
+
+    Args:
+        json_path (str): Path to the JSON data file
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        dict: Change summary with counts of added, removed and changed routes, dates and prices
+
+    Raises:
+        DeltaNotAvailable: If the live database has no fingerprints from a previous load
+        FeedFormatError, json.JSONDecodeError, UnicodeDecodeError: If the feed cannot be loaded
+    """
+    started = time.perf_counter()
+
+    if not os.path.exists(db_path):
+        raise DeltaNotAvailable(f"{db_path} does not exist")
+
+    conn = sqlite3.connect(db_path, timeout=WRITE_LOCK_TIMEOUT, isolation_level=None)
+    try:
+        cursor = conn.cursor()
+        # The live file is written directly, so keep the rollback journal on disk
+        # and fsync on commit. With cache spilling off, the file itself is only
+        # written (and readers only blocked) while the transaction commits.
+        cursor.execute("PRAGMA journal_mode=DELETE")
+        cursor.execute("PRAGMA synchronous=FULL")
+        cursor.execute("PRAGMA cache_spill=OFF")
+        cursor.execute("BEGIN IMMEDIATE")
+        create_tables(cursor)
+        normalized = normalize_legacy_tables(cursor)
+
+        cursor.execute("SELECT natural_key, route_id, content_hash FROM route_fingerprints")
+        previous = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        if not previous:
+            raise DeltaNotAvailable(f"{db_path} has no route fingerprints to diff against")
+
+        cursor.execute("SELECT COALESCE(MAX(route_id), 0) FROM routes")
+        next_route_id = cursor.fetchone()[0] + 1
+
+        summary = _new_summary()
+        feed_stats = FeedStats()
+        inserter = BatchInserter(cursor)
+        dimensions = DimensionCache(cursor)
+        keyer = RouteKeyer()
+        seen = set()
+        fingerprint_updates = []
+        touched_routes = []
+
+        for item in iter_routes(json_path, feed_stats):
+            key = keyer.key(item)
+            content_hash = route_content_hash(item)
+            seen.add(key)
+
+            if key in previous:
+                route_id, previous_hash = previous[key]
+                if previous_hash == content_hash:
+                    summary['routes_unchanged'] += 1
+                    continue
+                _apply_route_change(cursor, route_id, item, dimensions, summary)
+                fingerprint_updates.append((content_hash, key))
+                touched_routes.append(route_id)
+                summary['routes_changed'] += 1
+            else:
+                route_id = next_route_id
+                next_route_id += 1
+                rows = build_route_rows(item, route_id, dimensions)
+                for table, table_rows in rows.items():
+                    for row in table_rows:
+                        inserter.add(table, row)
+                inserter.add('route_fingerprints', (key, route_id, content_hash))
+                touched_routes.append(route_id)
+                summary['routes_added'] += 1
+                summary['dates_added'] += sum(row[5] for row in rows['service_calendars'])
+                summary['prices_added'] += (len(rows['route_vessel_prices']) +
+                                            len(rows['route_accommodation_prices']))
+
+        # An empty or incomplete feed would otherwise read as every route removed
+        feed_stats.check()
+
+        inserter.flush()
+        cursor.executemany("UPDATE route_fingerprints SET content_hash = ? WHERE natural_key = ?",
+                           fingerprint_updates)
+
+        removed_ids = [route_id for key, (route_id, _) in previous.items() if key not in seen]
+        if removed_ids:
+            for table, count, column in (('service_calendars', 'SUM(day_count)', 'dates_removed'),
+                                         ('route_vessel_prices', 'COUNT(*)', 'prices_removed'),
+                                         ('route_accommodation_prices', 'COUNT(*)', 'prices_removed')):
+                # Counted in chunks to stay under SQLite's bound-parameter limit
+                for i in range(0, len(removed_ids), 500):
+                    chunk = removed_ids[i:i + 500]
+                    cursor.execute(f"SELECT COALESCE({count}, 0) FROM {table} "
+                                   f"WHERE route_id IN ({','.join('?' * len(chunk))})", chunk)
+                    summary[column] += cursor.fetchone()[0]
+            _delete_routes(cursor, removed_ids)
+            touched_routes.extend(removed_ids)
+        summary['routes_removed'] = len(removed_ids)
+
+        changed_routes = summary['routes_added'] + summary['routes_removed'] + summary['routes_changed']
+        if changed_routes == 0:
+            logger.info(f"No changes in {json_path}; keeping the live database")
+            cursor.execute("ROLLBACK")
+            summary['seconds'] = round(time.perf_counter() - started, 3)
+            return summary
+
+        # Only the departures and fare calendar rows of routes that changed are
+        # rebuilt, unless the database predates those tables or was just converted
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM departures)")
+        if cursor.fetchone()[0] and not normalized:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM fare_calendar)")
+            has_fare_calendar = cursor.fetchone()[0]
+            rebuild_departures(cursor, touched_routes)
+            if not has_fare_calendar:
+                rebuild_fare_calendar(cursor)
+        else:
+            rebuild_departures(cursor)
+
+        counts = validate_row_counts(cursor, feed_stats)
+
+        # Indexes are maintained incrementally; planner statistics only need a
+        # refresh when a sizeable share of the timetable changed
+        create_indexes(cursor)
+        if changed_routes >= ANALYZE_CHANGE_RATIO * max(len(previous), 1):
+            cursor.execute("ANALYZE")
+
+        cursor.execute("COMMIT")
+        invalidate_pool()
+
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info(f"Applied delta from {json_path}: {summary} (row counts {counts})")
+        return summary
+
+    except Exception:
+        # Nothing is written to the live file before COMMIT
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+    finally:
+        conn.close()
@@ -6,9 +6,9 @@ This script bypasses email fetching and directly uses a downloaded GTFS file.
 
 import os
 import logging
-import json
 from datetime import datetime
 from data_processor import update_ferry_data
+from gtfs_stream import validate_feed
 
 # Configure logging
 logging.basicConfig(level=logging.INFO,
@@ -16,23 +16,16 @@ logging.basicConfig(level=logging.INFO,
 logger = logging.getLogger(__name__)
 
 def validate_json_file(file_path):
-    """Validate that a file contains valid JSON data."""
+    """Validate that a file contains valid GTFS JSON data."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        is_valid, stats, error = validate_feed(file_path)
         
-        if isinstance(data, list) and len(data) > 0:
-            logger.info(f"Valid JSON file with {len(data)} items")
-            return True
-        elif isinstance(data, dict) and 'routes' in data and len(data['routes']) > 0:
-            logger.info(f"Valid JSON file with {len(data['routes'])} routes")
+        if is_valid:
+            logger.info(f"Valid JSON file with {stats.routes} routes")
             return True
         else:
-            logger.error(f"File does not contain expected data structure")
+            logger.error(error)
             return False
-    except json.JSONDecodeError as e:
-        logger.error(f"Invalid JSON file: {str(e)}")
-        return False
     except Exception as e:
         logger.error(f"Error validating file: {str(e)}")
         return False
@@ -11,7 +11,8 @@ import logging
 from datetime import datetime, timedelta
 from email.header import decode_header
 import tempfile
-import json
+
+from gtfs_stream import validate_feed
 
 # Configure logging
 logging.basicConfig(
@@ -463,59 +464,21 @@ class EmailFetcher:
             bool: True if valid, False otherwise
         """
         try:
-            # Make sure the file exists
-            if not os.path.exists(file_path):
-                logger.error(f"File {file_path} does not exist")
-                return False
-                
-            # Check if file is empty
-            if os.path.getsize(file_path) == 0:
-                logger.error(f"File {file_path} is empty")
-                return False
-                
-            # Try to load the JSON
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Support both array format and object format with routes key
-            if isinstance(data, list):
-                # Array format - ensure it's not empty and has route data
-                if not data:
-                    logger.warning(f"File {file_path} contains an empty array")
-                    return False
-                
-                # Check first item for required route fields
-                first_item = data[0]
-                required_fields = ['route_id', 'origin_port', 'destination_port']
-                if not all(field in first_item for field in required_fields):
-                    logger.warning(f"File {file_path} does not contain required route fields")
-                    return False
-                
-                logger.info(f"File {file_path} contains {len(data)} routes in array format")
-                return True
+            # Stream through the file once, validating and counting routes as we go.
+            # Both the array format and the object format with a routes key are supported.
+            is_valid, stats, error = validate_feed(file_path)
             
-            # Object format with routes key
-            elif isinstance(data, dict) and 'routes' in data:
-                route_count = len(data.get('routes', []))
-                if route_count == 0:
-                    logger.warning(f"File {file_path} contains an empty routes array")
-                    return False
-                    
-                logger.info(f"File {file_path} contains {route_count} routes in object format")
-                return True
-            
-            else:
-                logger.warning(f"File {file_path} does not contain valid GTFS data structure: {type(data)}")
+            if not is_valid:
+                logger.warning(error)
                 return False
+            
+            logger.info(f"File {file_path} contains {stats.routes} routes in {stats.layout} format")
+            return True
                 
-        except json.JSONDecodeError as e:
-            logger.error(f"File {file_path} is not valid JSON: {str(e)}")
-            return False
         except Exception as e:
             logger.error(f"Error validating GTFS data: {str(e)}")
             return False
 
-
 def decode_email_header(header):
     """Helper function to decode email headers"""
     if header is None:
@@ -0,0 +1,287 @@
+"""
+Deterministic fast path in front of the agent.
+
+Messages that name exactly two ports and ask one of a few structured questions
+are answered straight from the search functions with a templated response:
+
+- a port pair and a date: the sailings of that day;
+- a port pair and "cheapest": the cheapest sailing of that day, or the
+  cheapest day of the next MAX_DATE_WINDOW_DAYS without a date;
+- a port pair and "which dates": the dates the pair has sailings.
+
+Anything else, or a question whose search comes back empty (the agent then
+checks the historical data), falls through to the agent. Hit rate and latency
+of both paths are recorded for /api/fast-path-stats.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from config import FAST_PATH_ENABLED
+from port_directory import get_port_directory
+from tools.ferry_tools import MAX_DATE_WINDOW_DAYS, available_dates, find_departures, query_fare_calendar
+from utils import extract_date_from_text, extract_ports_from_text, format_price
+
+logger = logging.getLogger(__name__)
+
+# Sailings listed in a departures answer before summarizing the rest
+MAX_LISTED_SAILINGS = 12
+
+# Dates listed in a dates answer
+MAX_LISTED_DATES = 40
+
+# Latency samples kept per path for the percentiles
+LATENCY_SAMPLES = 1000
+
+# Qualifiers that change what is asked. The templates answer none of them, and
+# they are part of the normalized intent the answer cache is keyed on.
+QUALIFIER_PATTERN = re.compile(
+    r"\b(?:return|round[- ]?trip|back|via|through|transfers?|connections?|change|stops?|"
+    r"accommodations?|cabins?|seats?|cars?|vehicles?|pets?|dogs?|luggage|book|booking|refund|cancel\w*|"
+    r"history|historical|last year|previous|compare|weather)\b"
+)
+# Negations and references to earlier turns make a message unsafe to normalize
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|never)\b|n't\b")
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(?:same|instead|else|other|those|these|that one|what about|how about|"
+    r"the (?:first|second|third|last|previous|earlier|other) (?:one|ferry|sailing|option))\b"
+)
+# Constraints the normalized intent doesn't capture: a time window, prices,
+# companies or vessels, durations. Messages with them are neither templated nor
+# cached, as their answer depends on more than the intent.
+TIME_WINDOW_PATTERN = re.compile(
+    r"\b(?:morning|afternoon|evening|night|overnight|tonight|noon|midnight|early|earliest|late|latest|"
+    r"after|before|until|between|around|first|last|next (?:ferry|ferries|boat|sailing|departure)s?)\b|"
+    r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm|h)\b|\b\d{1,2}[:.]\d{2}\b"
+)
+DETAIL_PATTERN = re.compile(
+    r"\b(?:compan(?:y|ies)|operators?|lines?|vessels?|ships?|how long|duration|direct|non-?stop|"
+    r"high[- ]?speed|conventional|catamaran)\b"
+)
+PRICE_PATTERN = re.compile(r"\b(?:how much|prices?|costs?|fares?|euros?|budget|under|less than)\b|€")
+FASTEST_PATTERN = re.compile(r"\b(?:fastest|quickest|shortest)\b")
+CHEAPEST_PATTERN = re.compile(
+    r"\b(?:cheapest|cheaper|cheap|lowest (?:price|fare|cost)|least expensive|best (?:price|fare))\b"
+)
+# "When does ... run" asks for dates; "when does ... leave" asks for a time,
+# so the verbs of the "when" branch are the ones about days of operation
+DATES_PATTERN = re.compile(
+    r"\b(?:which|what|available)\s+(?:dates|days)\b|\bdates?\s+(?:available|of operation)\b|"
+    r"\bwhen\s+(?:do|does|are|is|can)\b.*\b(?:run\w*|operat\w*)\b"
+)
+
+class FastPathStats:
+    """Thread-safe request counts and latency samples of the fast path and the agent."""
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.intents = {}
+        self.latencies = {"fast_path": deque(maxlen=samples), "agent": deque(maxlen=samples)}
+
+    def record(self, path: str, seconds: float, intent: Optional[str] = None):
+        """Record one answered message; path is 'fast_path' or 'agent'."""
+        with self._lock:
+            self.requests += 1
+            if path == "fast_path":
+                self.hits += 1
+                self.intents[intent] = self.intents.get(intent, 0) + 1
+            self.latencies[path].append(seconds * 1000)
+
+    def stats(self) -> Dict[str, object]:
+        """Hit rate, answers per intent and latency percentiles per path."""
+        with self._lock:
+            latency = {}
+            for path, samples in self.latencies.items():
+                ordered = sorted(samples)
+                latency[path] = {
+                    "count": len(ordered),
+                    "mean_ms": round(sum(ordered) / len(ordered), 2) if ordered else None,
+                    "p50_ms": round(ordered[len(ordered) // 2], 2) if ordered else None,
+                    "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2) if ordered else None
+                }
+            return {
+                "enabled": FAST_PATH_ENABLED,
+                "requests": self.requests,
+                "fast_path_hits": self.hits,
+                "hit_rate": round(self.hits / self.requests, 3) if self.requests else 0.0,
+                "intents": dict(self.intents),
+                "latency": latency
+            }
+
+_stats = FastPathStats()
+
+def get_fast_path_stats() -> Dict[str, object]:
+    """Return the fast path hit rate and latencies."""
+    return _stats.stats()
+
+def record_agent_latency(seconds: float):
+    """Record a message answered by the agent."""
+    _stats.record("agent", seconds)
+
+def _port_name(directory, code: str) -> str:
+    port = directory.get(code)
+    return port["name"].title() if port else code
+
+def _readable_date(date: str) -> str:
+    return datetime.strptime(date, "%Y-%m-%d").strftime("%A, %B %d, %Y")
+
+def _sailing_line(route: Dict[str, object]) -> str:
+    line = f"- {route['departure_time']} → {route['arrival_time']} ({route['duration']}), {route['company']}"
+    if route.get("vessel"):
+        line += f", {route['vessel']}"
+    if route["base_price"] != format_price(0):
+        line += f", from {route['base_price']}"
+    return line
+
+def normalize_intent(text: str) -> Optional[Dict[str, object]]:
+    """
+    Reduce a self-contained route question to what it asks, so that different
+    wordings of the same question compare equal.
+
+    Returns:
+        dict with 'intent' ('departures', 'cheapest', 'fastest', 'dates' or
+        'route'), the resolved 'origin' and 'destination' codes, the absolute
+        'date' (None when not given) and the sorted 'qualifiers' it mentions;
+        None when the message doesn't name exactly two ports, negates, refers
+        back to earlier turns, or asks for something the intent doesn't
+        capture (a time window, prices, companies, vessels or durations)
+    """
+    lowered = text.lower()
+    if NEGATION_PATTERN.search(lowered) or FOLLOW_UP_PATTERN.search(lowered):
+        return None
+
+    directory = get_port_directory()
+    mentions = {code for _, _, code in directory.matcher.find_all(text)}
+    if len(mentions) != 2:
+        return None
+    origin, destination = extract_ports_from_text(text, directory.ports, directory.matcher)
+    if not origin or not destination:
+        return None
+
+    date = extract_date_from_text(text)
+    if CHEAPEST_PATTERN.search(lowered):
+        intent = "cheapest"
+    elif FASTEST_PATTERN.search(lowered):
+        intent = "fastest"
+    elif date:
+        # A question naming its day asks about that day's sailings, however it
+        # is worded ("when does the ferry leave on ...")
+        intent = "departures"
+    elif DATES_PATTERN.search(lowered):
+        intent = "dates"
+    else:
+        intent = "route"
+    # Cheapest answers are about prices, so only other intents reject price wording
+    if (TIME_WINDOW_PATTERN.search(lowered) or DETAIL_PATTERN.search(lowered) or
+            (intent != "cheapest" and PRICE_PATTERN.search(lowered))):
+        return None
+    qualifiers = sorted({re.sub(r"[^a-z]", "", match).rstrip("s") for match in QUALIFIER_PATTERN.findall(lowered)})
+    return {"intent": intent, "origin": origin, "destination": destination, "date": date,
+            "qualifiers": qualifiers}
+
+def classify(text: str) -> Optional[Dict[str, object]]:
+    """
+    Recognize a high-confidence structured question the templates can answer.
+
+    Returns:
+        The normalized intent ('departures', 'cheapest' or 'dates'), or None to
+        use the agent
+    """
+    intent = normalize_intent(text)
+    if intent is None or intent["qualifiers"] or intent["intent"] not in ANSWERS:
+        return None
+    if intent["date"] and intent["date"] < datetime.now().strftime("%Y-%m-%d"):
+        return None
+    return intent
+
+def _answer_departures(directory, origin, destination, date) -> Optional[str]:
+    routes = find_departures(origin, destination, date)
+    if not routes:
+        return None
+    lines = [f"Here are the ferries from {_port_name(directory, origin)} to {_port_name(directory, destination)} "
+             f"on {_readable_date(date)}:", ""]
+    lines.extend(_sailing_line(route) for route in routes[:MAX_LISTED_SAILINGS])
+    if len(routes) > MAX_LISTED_SAILINGS:
+        lines.append(f"- ...and {len(routes) - MAX_LISTED_SAILINGS} more sailings later in the day")
+    lines.extend(["", "Prices are indicative base fares per passenger."])
+    return "\n".join(lines)
+
+def _answer_cheapest(directory, origin, destination, date) -> Optional[str]:
+    origin_name, destination_name = _port_name(directory, origin), _port_name(directory, destination)
+    if date:
+        routes = find_departures(origin, destination, date, order="cheapest", limit=1)
+        if not routes or routes[0]["base_price"] == format_price(0):
+            return None
+        route = routes[0]
+        return (f"The cheapest ferry from {origin_name} to {destination_name} on {_readable_date(date)} "
+                f"leaves at {route['departure_time']} and arrives at {route['arrival_time']} "
+                f"({route['duration']}) with {route['company']}, from {route['base_price']}.")
+
+    start = datetime.now()
+    end = start + timedelta(days=MAX_DATE_WINDOW_DAYS - 1)
+    days = query_fare_calendar(origin, destination, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+    priced = [day for day in days if day["min_indicative_price"]]
+    if not priced:
+        return None
+    cheapest = min(priced, key=lambda day: (day["min_indicative_price"], day["date"]))
+    return (f"In the next {MAX_DATE_WINDOW_DAYS} days, the cheapest day to sail from {origin_name} to "
+            f"{destination_name} is {_readable_date(cheapest['date'])}, with fares from "
+            f"{format_price(cheapest['min_indicative_price'])} ({cheapest['sailings']} sailings, first departure "
+            f"at {cheapest['earliest_departure']}).")
+
+def _answer_dates(directory, origin, destination, date) -> Optional[str]:
+    dates = available_dates(origin, destination)
+    if not dates:
+        return None
+    months = {}
+    for value in dates[:MAX_LISTED_DATES]:
+        day = datetime.strptime(value, "%Y-%m-%d")
+        months.setdefault(day.strftime("%B %Y"), []).append(str(day.day))
+    lines = [f"Ferries from {_port_name(directory, origin)} to {_port_name(directory, destination)} run on "
+             f"{len(dates)} dates between {_readable_date(dates[0])} and {_readable_date(dates[-1])}:", ""]
+    lines.extend(f"- {month}: {', '.join(days)}" for month, days in months.items())
+    if len(dates) > MAX_LISTED_DATES:
+        lines.append(f"- ...and {len(dates) - MAX_LISTED_DATES} more dates")
+    return "\n".join(lines)
+
+ANSWERS = {
+    "departures": _answer_departures,
+    "cheapest": _answer_cheapest,
+    "dates": _answer_dates
+}
+
+def answer(text: str) -> Optional[str]:
+    """
+    Answer a message on the fast path.
+
+    Args:
+        text: The user's message
+
+    Returns:
+        The templated response, or None when the message should go to the agent
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    started = time.perf_counter()
+    try:
+        intent = classify(text)
+        if intent is None:
+            return None
+        response = ANSWERS[intent["intent"]](get_port_directory(), intent["origin"], intent["destination"],
+                                             intent["date"])
+    except Exception as e:
+        logger.error(f"Error on the fast path, falling back to the agent: {str(e)}")
+        return None
+    if response is None:
+        return None
+    elapsed = time.perf_counter() - started
+    _stats.record("fast_path", elapsed, intent["intent"])
+    logger.info(f"Answered '{text}' on the fast path ({intent['intent']}) in {elapsed * 1000:.1f} ms")
+    return response
@@ -0,0 +1,268 @@
+"""
+Content-hash registry of downloaded and imported GTFS feeds.
+
+The scheduler looks back several days of email on every run, so the same
+attachment is downloaded again and again under new timestamp-prefixed names.
+The registry identifies every feed by the SHA-256 and byte size of its payload,
+so repeated downloads can be collapsed onto one file on disk and a payload that
+is already live is skipped before it is ever parsed.
+
+The scheduler, the admin views and the data processor each open their own
+FeedRegistry, possibly in different processes. Every change therefore runs
+under a module-wide lock plus an exclusive lock on a side file
+(registry_path + '.lock'), re-reads the registry from disk, and writes it back
+through a unique temporary file.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; only the in-process lock is taken there
+    fcntl = None
+
+from config import FEED_REGISTRY_PATH
+
+logger = logging.getLogger(__name__)
+
+# Bytes hashed per read while fingerprinting a feed
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_digest(file_path):
+    """
+    Compute the SHA-256 and byte size of a file without reading it into memory.
+
+    Args:
+        file_path: Path to the file
+
+    Returns:
+        tuple: (hex digest, size in bytes)
+    """
+    sha256 = hashlib.sha256()
+    size = 0
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+            size += len(chunk)
+    return sha256.hexdigest(), size
+
+# Serializes registry changes between the threads of this process; reentrant so
+# that changes can nest (mark_live registers an unknown feed)
+_registry_lock = threading.RLock()
+_lock_depth = 0
+
+@contextmanager
+def _exclusive(registry_path):
+    """
+    Hold the registry lock of this process and, on POSIX, an exclusive lock on
+    registry_path + '.lock' shared with other processes.
+    """
+    global _lock_depth
+    with _registry_lock:
+        lock_file = None
+        if _lock_depth == 0 and fcntl is not None:
+            lock_file = open(registry_path + '.lock', 'a')
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _lock_depth += 1
+        try:
+            yield
+        finally:
+            _lock_depth -= 1
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+class FeedRegistry:
+    """
+    Registry of feed payloads keyed by content hash, persisted as a JSON file.
+
+    Each entry records the file the payload is kept in, its size, when it was
+    first and last seen, whether it passed validation, when it was imported and
+    whether it is the feed currently loaded in the database.
+    """
+
+    def __init__(self, registry_path=FEED_REGISTRY_PATH):
+        self.registry_path = registry_path
+        self.entries = self._load()
+
+    def _load(self):
+        """Load the registry from disk, starting empty if it is missing or unreadable."""
+        if not os.path.exists(self.registry_path):
+            return {}
+        try:
+            with open(self.registry_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read feed registry {self.registry_path}: {str(e)}")
+            return {}
+
+    @contextmanager
+    def _locked(self):
+        """
+        Take the registry lock and reload the entries from disk, so a change is
+        applied to the latest registry rather than to this instance's copy.
+        """
+        with _exclusive(self.registry_path):
+            self.entries = self._load()
+            yield
+
+    def _save(self):
+        """Write the registry atomically so a crash never leaves it half-written."""
+        directory = os.path.dirname(os.path.abspath(self.registry_path))
+        fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(self.registry_path) + '.', suffix='.tmp',
+                                        dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(tmp_path, self.registry_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def register(self, file_path):
+        """
+        Record a downloaded feed, collapsing it onto an existing copy of the same payload.
+
+        If the payload is already registered and its file still exists, the new
+        download is deleted and the existing entry is returned.
+
+        Args:
+            file_path: Path to the downloaded feed
+
+        Returns:
+            tuple: (entry dict, True if the payload was already registered)
+        """
+        sha256, size = file_digest(file_path)
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        with self._locked():
+            entry = self.entries.get(sha256)
+            if entry and entry['size'] == size:
+                existing = entry['path']
+                if os.path.exists(existing) and os.path.abspath(existing) != os.path.abspath(file_path):
+                    os.remove(file_path)
+                    logger.info(f"{file_path} duplicates {existing}, removed the new copy")
+                elif not os.path.exists(existing):
+                    entry['path'] = file_path
+                    entry['filename'] = os.path.basename(file_path)
+                    entry['mtime'] = os.path.getmtime(file_path)
+                entry['last_seen'] = now
+                self._save()
+                return entry, True
+
+            entry = {
+                'sha256': sha256,
+                'size': size,
+                'path': file_path,
+                'filename': os.path.basename(file_path),
+                'mtime': os.path.getmtime(file_path),
+                'first_seen': now,
+                'last_seen': now,
+                'valid': None,
+                'imported_at': None,
+                'live': False
+            }
+            self.entries[sha256] = entry
+            self._save()
+            return entry, False
+
+    def lookup(self, file_path):
+        """Return the registry entry for a file's payload, or None if it is unknown."""
+        sha256, size = file_digest(file_path)
+        entry = self.entries.get(sha256)
+        return entry if entry and entry['size'] == size else None
+
+    def set_valid(self, sha256, valid):
+        """Remember the validation result for a payload so it is not parsed again."""
+        with self._locked():
+            if sha256 in self.entries:
+                self.entries[sha256]['valid'] = valid
+                self._save()
+
+    def mark_live(self, file_path):
+        """
+        Record that a feed has been imported and is now the one loaded in the database.
+
+        Args:
+            file_path: Path to the imported feed
+
+        Returns:
+            dict: The registry entry of the live feed
+        """
+        with self._locked():
+            entry = self.lookup(file_path)
+            if entry is None:
+                entry, _ = self.register(file_path)
+            for other in self.entries.values():
+                other['live'] = False
+            entry['live'] = True
+            entry['valid'] = True
+            entry['imported_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._save()
+        return entry
+
+    def live_entry(self):
+        """Return the entry of the feed currently loaded in the database, or None."""
+        for entry in self.entries.values():
+            if entry.get('live'):
+                return entry
+        return None
+
+    def is_live(self, sha256):
+        """Check whether a payload is the one currently loaded in the database."""
+        entry = self.entries.get(sha256)
+        return bool(entry and entry.get('live'))
+
+    def collapse_duplicates(self, directory):
+        """
+        Delete files in a directory whose payload is already kept in another file.
+
+        The copy referenced by the registry is kept; among unregistered copies the
+        oldest file wins.
+
+        Args:
+            directory: Directory holding downloaded feeds
+
+        Returns:
+            list: Paths of the removed duplicates
+        """
+        if not os.path.isdir(directory):
+            return []
+
+        paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.json')]
+        paths.sort(key=os.path.getmtime)
+
+        # Files the registry already points at are not hashed again
+        known = {os.path.abspath(entry['path']): entry for entry in self.entries.values()}
+
+        removed = []
+        for path in paths:
+            entry = known.get(os.path.abspath(path))
+            if entry and entry['size'] == os.path.getsize(path) and entry.get('mtime') == os.path.getmtime(path):
+                continue
+            _, duplicate = self.register(path)
+            if duplicate and not os.path.exists(path):
+                removed.append(path)
+
+        if removed:
+            logger.info(f"Collapsed {len(removed)} duplicate feed files in {directory}")
+        return removed
+
+    def prune(self):
+        """Forget payloads whose file no longer exists, except the live one."""
+        with self._locked():
+            stale = [sha256 for sha256, entry in self.entries.items()
+                     if not entry.get('live') and not os.path.exists(entry['path'])]
+            for sha256 in stale:
+                del self.entries[sha256]
+            if stale:
+                self._save()
+        return len(stale)
@@ -1,4 +1,5 @@
 import os
+import time
 import logging
 import sqlite3
 from typing import Dict, List, Any, Optional, Union
@@ -11,11 +12,21 @@ from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 
 from prompts.system_prompt import get_system_prompt
-from config import GEMINI_API_KEY, MODEL_NAME, AGENT_TEMPERATURE
+from config import GEMINI_API_KEY, HISTORICAL_DB_PATH, MODEL_NAME, AGENT_TEMPERATURE
 from db import execute_query
+from port_directory import get_port_directory
+import caching
+import fast_path
+from session_store import create_session_store
+from tools.ferry_tools import (
+    compare_route_options, get_fare_calendar, plan_journey, search_date_range, search_round_trip
+)
 
 logger = logging.getLogger(__name__)
 
+# Ports considered per name when checking historical routes
+HISTORICAL_PORT_MATCHES = 10
+
 class FerryAgent:
     """
     An agent that handles ferry information queries using a language model (Google Gemini).
@@ -31,8 +42,9 @@ class FerryAgent:
         if not self.api_key:
             raise ValueError("GEMINI_API_KEY is not set in the environment variables.")
 
-        # Initialize chat histories for each session
-        self.chat_histories: Dict[str, List[Union[HumanMessage, AIMessage, SystemMessage]]] = {}
+        # Bounded chat history of each session, shared by the worker processes
+        # unless CONVERSATION_BACKEND is "memory"
+        self.sessions = create_session_store()
 
         # Initialize the language model
         self.llm = ChatGoogleGenerativeAI(
@@ -65,6 +77,19 @@ class FerryAgent:
             description="Check if a route was available in historical data when it's not found in current schedules."
         )
 
+        # Structured search tools, answered from the search functions and caches
+        # instead of model-written SQL
+        self.tools = [
+            self.db_query_tool,
+            self.port_info_tool,
+            self.historical_data_tool,
+            plan_journey,
+            compare_route_options,
+            search_date_range,
+            get_fare_calendar,
+            search_round_trip
+        ]
+
         # Define the prompt template for the agent with enhanced instructions
         system_prompt_content = get_system_prompt()
         # Add special emphasis on checking historical data for routes
@@ -80,14 +105,14 @@ class FerryAgent:
         # Create the agent using the language model and tools
         self.agent = create_tool_calling_agent(
             llm=self.llm,
-            tools=[self.db_query_tool, self.port_info_tool, self.historical_data_tool],
+            tools=self.tools,
             prompt=self.prompt
         )
 
         # Create the agent executor to handle queries
         self.agent_executor = AgentExecutor(
             agent=self.agent,
-            tools=[self.db_query_tool, self.port_info_tool, self.historical_data_tool],
+            tools=self.tools,
             verbose=True
         )
 
@@ -103,8 +128,8 @@ class FerryAgent:
             if any(keyword in query.upper() for keyword in forbidden_keywords):
                 return "Error: Potentially dangerous SQL query detected."
             
-            # Execute the query
-            results = execute_query(query)
+            # Execute the query; repeated queries are served from the SQL result cache
+            results = caching.cached_query(query, execute_query)
             
             if not results:
                 # Try to detect if this is a route search query
@@ -168,42 +193,35 @@ class FerryAgent:
         return all ports. Otherwise, search for the specified port.
         """
         try:
-            if port_name_or_code:
-                # Search for a specific port
-                query = """
-                SELECT DISTINCT origin_port_code as code, origin_port_name as name FROM routes
-                WHERE LOWER(origin_port_code) = LOWER(?) OR LOWER(origin_port_name) LIKE LOWER(?)
-                UNION
-                SELECT DISTINCT destination_port_code as code, destination_port_name as name FROM routes
-                WHERE LOWER(destination_port_code) = LOWER(?) OR LOWER(destination_port_name) LIKE LOWER(?)
-                ORDER BY name
-                """
-                search_pattern = f"%{port_name_or_code}%"
-                results = execute_query(query, 
-                                       (port_name_or_code, search_pattern, port_name_or_code, search_pattern))
-            else:
-                # Get all ports
-                query = """
-                SELECT DISTINCT origin_port_code as code, origin_port_name as name FROM routes
-                UNION
-                SELECT DISTINCT destination_port_code as code, destination_port_name as name FROM routes
-                ORDER BY name
-                """
-                results = execute_query(query)
+            # Served from the in-process port directory, without SQL
+            results = get_port_directory().search(port_name_or_code)
             
             if not results:
                 return "No ports found matching the criteria."
             
             # Format the results
             ports_info = []
-            for row in results:
-                ports_info.append(f"{row[0]}: {row[1]}")
+            for port in results:
+                ports_info.append(f"{port['code']}: {port['name']}")
             
             return "\n".join(ports_info)
             
         except Exception as e:
             return f"Error retrieving port information: {str(e)}"
 
+    def _session_messages(self, session_id: str) -> List[Union[HumanMessage, AIMessage, SystemMessage]]:
+        """
+        The chat history of a session as messages for the prompt: a summary of
+        the older turns, if any, followed by the recent messages.
+        """
+        summary, messages = self.sessions.history(session_id)
+        history = []
+        if summary:
+            history.append(SystemMessage(content=f"Summary of the earlier conversation:\n{summary}"))
+        for role, content in messages:
+            history.append(HumanMessage(content=content) if role == "human" else AIMessage(content=content))
+        return history
+
     def query(self, input_text: str, session_id: str = 'default') -> str:
         """
         Main method to process user queries with conversational context.
@@ -222,14 +240,25 @@ class FerryAgent:
             logger.info("Empty query received, returning default message")
             return "I'm here to help with ferry information. Please ask me a question about Greek ferry routes, schedules, or prices."
             
-        # Initialize chat history for the session if it doesn't exist
-        if session_id not in self.chat_histories:
-            logger.info(f"Initializing new chat history for session: {session_id}")
-            self.chat_histories[session_id] = []
-
-        session_history = self.chat_histories[session_id]
+        session_history = self._session_messages(session_id)
         logger.info(f"Current history length: {len(session_history)}")
 
+        # Simple structured questions are answered without the agent
+        fast_answer = fast_path.answer(input_text)
+        if fast_answer is not None:
+            self.sessions.append(session_id, input_text, fast_answer)
+            return fast_answer
+
+        # Self-contained questions asked before (in any wording) reuse the answer
+        cache_key = caching.answer_key(input_text)
+        if cache_key is not None:
+            cached_answer = caching.get_answer(cache_key)
+            if cached_answer is not None:
+                logger.info(f"Answered from the answer cache: {cache_key}")
+                self.sessions.append(session_id, input_text, cached_answer)
+                return cached_answer
+
+        started = time.perf_counter()
         try:
             logger.info("Invoking agent executor")
             # Invoke the agent executor with the input and chat history
@@ -246,10 +275,12 @@ class FerryAgent:
                 logger.info(f"Agent response length: {len(output) if output else 0}")
                 
                 # Update the chat history with the user's input and agent's response
-                session_history.append(HumanMessage(content=input_text))
-                session_history.append(AIMessage(content=output))
+                self.sessions.append(session_id, input_text, output)
                 
                 logger.info("Agent response generated successfully")
+                fast_path.record_agent_latency(time.perf_counter() - started)
+                if cache_key is not None and output:
+                    caching.store_answer(cache_key, output)
                 return output
             else:
                 logger.error(f"Invalid response format: {result}")
@@ -261,6 +292,29 @@ class FerryAgent:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return "I'm sorry, I encountered an error while processing your request. Please try asking your question in a different way or try another query about ferry routes or schedules."
 
+    def _historical_port_codes(self, conn, port: str) -> List[str]:
+        """
+        Codes of the historical ports matching a port name, code or alias.
+        
+        Uses the FTS5 trigram index of the historical database, so misspelled
+        names still resolve. All ports sharing the best score are returned, so
+        an island name matches each of its ports. Without FTS5, falls back to an
+        exact code or a name substring match.
+        """
+        from historical_data_loader import HISTORICAL_PORTS_QUERY, ensure_historical_port_search
+        from port_search import search_ports
+        
+        if ensure_historical_port_search(conn):
+            matches = search_ports(port, limit=HISTORICAL_PORT_MATCHES, conn=conn)
+            return [match["code"] for match in matches if match["score"] == matches[0]["score"]]
+        
+        rows = conn.execute(
+            f"SELECT DISTINCT code FROM ({HISTORICAL_PORTS_QUERY}) "
+            f"WHERE LOWER(code) = LOWER(?) OR LOWER(name) LIKE LOWER(?)",
+            (port, f"%{port}%")
+        ).fetchall()
+        return [row[0] for row in rows]
+
     def check_historical_routes(self, param1=None, param2=None) -> str:
         """
         Check historical data for routes between the given ports when current routes aren't found.
@@ -450,7 +504,7 @@ class FerryAgent:
             logger.info(f"Checking historical routes from {origin_port} to {destination_port}")
             
             # Connect to the historical database
-            db_path = 'previous_db.db'
+            db_path = HISTORICAL_DB_PATH
             if not os.path.exists(db_path):
                 return "Historical database does not exist. Unable to check past routes."
             
@@ -464,71 +518,42 @@ class FerryAgent:
             # Log the cleaned parameters
             logger.info(f"Cleaned parameters - origin: '{origin_port}', destination: '{destination_port}'")
             
-            # Search in the historical_date_ranges table with case-insensitive comparison
-            query = """
-            SELECT 
-                origin_name, destination_name, 
-                MIN(start_date) AS earliest_start,
-                MAX(end_date) AS latest_end, 
-                MIN(appear_date) AS first_appeared,
-                COUNT(*) AS data_points
-            FROM historical_date_ranges
-            WHERE 
-                (LOWER(origin_code) = LOWER(?) OR LOWER(origin_name) LIKE LOWER(?)) AND
-                (LOWER(destination_code) = LOWER(?) OR LOWER(destination_name) LIKE LOWER(?))
-            GROUP BY origin_name, destination_name
-            """
-            
-            # Create search patterns
-            origin_pattern = f"%{origin_port}%"
-            destination_pattern = f"%{destination_port}%"
-            
-            # Log the query parameters
-            logger.info(f"Running historical search with patterns: origin='{origin_pattern}', destination='{destination_pattern}'")
-            
-            cursor.execute(query, (origin_port, origin_pattern, destination_port, destination_pattern))
-            results = cursor.fetchall()
+            # Resolve both ports, misspellings included, with the fuzzy port index
+            origin_codes = self._historical_port_codes(conn, origin_port)
+            destination_codes = self._historical_port_codes(conn, destination_port)
+            logger.info(f"Resolved ports - origin: {origin_codes}, destination: {destination_codes}")
+            if not origin_codes or not destination_codes:
+                conn.close()
+                return f"No historical routes found between {origin_port} and {destination_port} in either direction."
+            
+            def search(from_codes, to_codes):
+                query = f"""
+                SELECT 
+                    origin_name, destination_name, 
+                    MIN(start_date) AS earliest_start,
+                    MAX(end_date) AS latest_end, 
+                    MIN(appear_date) AS first_appeared,
+                    COUNT(*) AS data_points
+                FROM historical_date_ranges
+                WHERE 
+                    origin_code IN ({','.join('?' * len(from_codes))}) AND
+                    destination_code IN ({','.join('?' * len(to_codes))})
+                GROUP BY origin_name, destination_name
+                """
+                cursor.execute(query, list(from_codes) + list(to_codes))
+                return cursor.fetchall()
             
-            # Log the number of results found
-            logger.info(f"Found {len(results) if results else 0} results in forward direction")
+            results = search(origin_codes, destination_codes)
+            logger.info(f"Found {len(results)} results in forward direction")
             
-            if not results or len(results) == 0:
+            if not results:
                 # Try the reverse direction
-                logger.info(f"Trying reverse direction search")
-                cursor.execute(query, (destination_port, destination_pattern, origin_port, origin_pattern))
-                results = cursor.fetchall()
-                
-                # Log the number of results found in reverse direction
-                logger.info(f"Found {len(results) if results else 0} results in reverse direction")
+                results = search(destination_codes, origin_codes)
+                logger.info(f"Found {len(results)} results in reverse direction")
                 
-                if not results or len(results) == 0:
-                    # Try a more fuzzy search by using just the first few characters
-                    logger.info("Trying fuzzy search with shorter patterns")
-                    
-                    # Get the first 3-4 characters of each port name for a more fuzzy search
-                    origin_fuzzy = origin_port[:min(4, len(origin_port))]
-                    dest_fuzzy = destination_port[:min(4, len(destination_port))]
-                    
-                    origin_fuzzy_pattern = f"%{origin_fuzzy}%"
-                    dest_fuzzy_pattern = f"%{dest_fuzzy}%"
-                    
-                    logger.info(f"Fuzzy patterns: origin='{origin_fuzzy_pattern}', destination='{dest_fuzzy_pattern}'")
-                    
-                    # Try forward direction with fuzzy patterns
-                    cursor.execute(query, (origin_port, origin_fuzzy_pattern, destination_port, dest_fuzzy_pattern))
-                    results = cursor.fetchall()
-                    
-                    logger.info(f"Found {len(results) if results else 0} results with fuzzy forward search")
-                    
-                    if not results or len(results) == 0:
-                        # Try reverse direction with fuzzy patterns
-                        cursor.execute(query, (destination_port, dest_fuzzy_pattern, origin_port, origin_fuzzy_pattern))
-                        results = cursor.fetchall()
-                        
-                        logger.info(f"Found {len(results) if results else 0} results with fuzzy reverse search")
-                        
-                        if not results or len(results) == 0:
-                            return f"No historical routes found between {origin_port} and {destination_port} in either direction."
+                if not results:
+                    conn.close()
+                    return f"No historical routes found between {origin_port} and {destination_port} in either direction."
             
             # Format the results
             from datetime import datetime
@@ -605,7 +630,7 @@ class FerryAgent:
             # For SQLite, we need to use a different approach to get table information
             tables_query = """
             SELECT name FROM sqlite_master 
-            WHERE type='table' AND name NOT LIKE 'sqlite_%'
+            WHERE type IN ('table', 'view') AND name NOT LIKE 'sqlite_%'
             ORDER BY name
             """
             tables = execute_query(tables_query)
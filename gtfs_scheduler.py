@@ -15,6 +15,8 @@ import threading
 import schedule
 from email_fetcher import EmailFetcher
 from data_processor import update_ferry_data
+from feed_registry import FeedRegistry
+from gtfs_stream import FEED_ERRORS
 from historical_data_loader import load_historical_data
 
 # Configure logging
@@ -289,27 +291,42 @@ class GTFSScheduler:
                 logger.info("No GTFS attachments found in emails")
                 return False
             
-            # Find the newest valid GTFS file
+            # Collapse repeated downloads of the same payload onto one file. The
+            # registry keeps the first copy, so identical attachments from emails
+            # that were already seen on earlier runs are deleted straight away.
+            registry = FeedRegistry()
+            candidates = {}
+            for file_path in sorted(all_attachments, key=os.path.getmtime, reverse=True):
+                entry, _ = registry.register(file_path)
+                candidates.setdefault(entry['sha256'], entry)
+            all_attachments = [entry['path'] for entry in candidates.values()]
+            
+            # Import the newest valid GTFS file. Candidates are tried newest first and
+            # each one is validated by the same streaming pass that loads it, so a
+            # feed is read once. Payloads already known to be invalid are skipped.
             newest_file = None
-            newest_time = None
             
-            for file_path in all_attachments:
-                if not self.email_fetcher.validate_gtfs_json(file_path):
+            for sha256, entry in candidates.items():
+                if registry.is_live(sha256):
+                    logger.info(f"Newest GTFS feed {entry['filename']} is already loaded, skipping update")
+                    return False
+                if entry['valid'] is False:
                     continue
                 
-                file_time = os.path.getmtime(file_path)
-                if newest_time is None or file_time > newest_time:
-                    newest_time = file_time
-                    newest_file = file_path
+                logger.info(f"Updating ferry data with file: {entry['path']}")
+                try:
+                    update_ferry_data(file_path=entry['path'])
+                except FEED_ERRORS as e:
+                    logger.warning(f"Skipping invalid GTFS file {entry['filename']}: {str(e)}")
+                    registry.set_valid(sha256, False)
+                    continue
+                newest_file = entry['path']
+                break
             
             if not newest_file:
                 logger.warning("No valid GTFS files found in attachments")
                 return False
             
-            # Update the ferry data
-            logger.info(f"Updating ferry data with file: {newest_file}")
-            update_result = update_ferry_data(file_path=newest_file)
-            
             # Update historical data if enabled
             if self.enable_historical:
                 historical_file = os.path.join(os.path.dirname(newest_file), "historical_data.json")
@@ -0,0 +1,288 @@
+"""
+Streaming reader for GTFS JSON feeds.
+
+Feeds come in two layouts: a top-level array of route items, or an object with
+a 'routes' key holding that array. The reader decodes one route item at a time
+from a fixed-size read buffer, so peak memory depends on the largest single
+route rather than on the size of the feed. Validation and summary statistics
+are collected while the items stream past, in the same pass that loads them.
+"""
+
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Characters read from the file per buffer refill
+READ_CHUNK_SIZE = 64 * 1024
+
+# Fields the first route item of an array feed must carry
+REQUIRED_ROUTE_FIELDS = ['route_id', 'origin_port', 'destination_port']
+
+_WHITESPACE = ' \t\n\r'
+
+# Characters that may legally follow a complete top-level value
+_DELIMITERS = _WHITESPACE + ',:]}'
+
+class FeedFormatError(ValueError):
+    """Raised when a file is not in one of the supported GTFS feed layouts."""
+
+# Exceptions raised while reading a feed that mean the file itself is unusable,
+# as opposed to a failure of the database it is being loaded into
+FEED_ERRORS = (FeedFormatError, json.JSONDecodeError, UnicodeDecodeError)
+
+class FeedStats:
+    """
+    Summary statistics for a GTFS feed, accumulated one route item at a time.
+    """
+
+    def __init__(self):
+        self.layout = None  # "array" or "object"
+        self.routes = 0
+        self.scheduled_sailings = 0
+        self.first_item_complete = None
+        self.first_date = None
+        self.last_date = None
+        self.ports = set()
+        self.vessels = set()
+        self.companies = set()
+
+    def add(self, item):
+        """Fold one route item into the statistics."""
+        if not isinstance(item, dict):
+            raise FeedFormatError(f"Route item {self.routes + 1} is not an object")
+
+        if self.routes == 0:
+            self.first_item_complete = all(field in item for field in REQUIRED_ROUTE_FIELDS)
+            # Fail before a loader tries to insert the item; the object layout only
+            # needs a non-empty 'routes' list
+            if self.layout == 'array' and not self.first_item_complete:
+                raise FeedFormatError("First route item does not contain the required route fields")
+        self.routes += 1
+
+        self.ports.add(item.get('origin_port_code') or item.get('origin_port'))
+        self.ports.add(item.get('destination_port_code') or item.get('destination_port'))
+        self.companies.add(item.get('company_code') or item.get('company'))
+
+        dates_and_vessels = item.get('dates_and_vessels') or {}
+        self.scheduled_sailings += len(dates_and_vessels)
+        self.vessels.update(dates_and_vessels.values())
+        self.vessels.update((item.get('vessels_and_indicative_prices') or {}).keys())
+
+        if dates_and_vessels:
+            first, last = min(dates_and_vessels), max(dates_and_vessels)
+            if self.first_date is None or first < self.first_date:
+                self.first_date = first
+            if self.last_date is None or last > self.last_date:
+                self.last_date = last
+
+    @property
+    def valid(self):
+        """A feed is valid when it has routes; malformed items raise while streaming."""
+        return self.routes > 0
+
+    def check(self):
+        """
+        Raise FeedFormatError if the feed is not valid. Loaders call this once the
+        last item has streamed past, before anything is committed.
+        """
+        if not self.valid:
+            raise FeedFormatError("Feed contains no routes")
+
+    def to_dict(self):
+        """Return the statistics as a JSON-serializable dictionary."""
+        return {
+            'layout': self.layout,
+            'routes': self.routes,
+            'scheduled_sailings': self.scheduled_sailings,
+            'ports': len(self.ports - {None}),
+            'vessels': len(self.vessels - {None}),
+            'companies': len(self.companies - {None}),
+            'first_date': self.first_date,
+            'last_date': self.last_date,
+            'valid': self.valid
+        }
+
+class _StreamDecoder:
+    """
+    Incremental JSON tokenizer over a text file. Only the structural characters of
+    the top-level containers are handled by hand; every value inside them is
+    decoded with json's raw_decode on the current buffer.
+    """
+
+    def __init__(self, f, chunk_size=READ_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        """Append the next chunk to the buffer. Returns False at end of file."""
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # Drop the consumed prefix so the buffer doesn't grow with the file
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at end of file."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        """Consume the given structural character or raise FeedFormatError."""
+        found = self.peek()
+        if found != char:
+            raise FeedFormatError(f"Expected '{char}' but found '{found or 'end of file'}'")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value from the stream."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely the value is cut off at the end of the buffer
+                if not self._fill():
+                    raise
+                continue
+            # A number cut off at the buffer edge decodes as a shorter number
+            # ("1.5e10" read as "1"), so make sure it is followed by a delimiter
+            truncated = end == len(self.buf) or (
+                isinstance(value, (int, float)) and self.buf[end] not in _DELIMITERS
+            )
+            if truncated and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array_items(self):
+        """Yield the items of an array whose opening '[' has been consumed."""
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            separator = self.peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise FeedFormatError(f"Expected ',' or ']' but found '{separator or 'end of file'}'")
+
+def iter_routes(json_path, stats=None, chunk_size=READ_CHUNK_SIZE):
+    """
+    Yield the route items of a GTFS feed one at a time.
+
+    Args:
+        json_path: Path to the JSON feed
+        stats: Optional FeedStats that is updated as items are yielded
+        chunk_size: Number of characters to read per buffer refill
+
+    Raises:
+        FeedFormatError: If the feed is neither an array nor an object with a 'routes' key
+        json.JSONDecodeError: If the file is not valid JSON
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        stream = _StreamDecoder(f, chunk_size)
+        first = stream.peek()
+
+        if first == '[':
+            stream.pos += 1
+            if stats is not None:
+                stats.layout = 'array'
+            for item in stream.array_items():
+                if stats is not None:
+                    stats.add(item)
+                yield item
+
+        elif first == '{':
+            stream.pos += 1
+            if stats is not None:
+                stats.layout = 'object'
+            found_routes = False
+            if stream.peek() == '}':
+                stream.pos += 1
+            else:
+                while True:
+                    key = stream.value()
+                    stream.expect(':')
+                    if key == 'routes':
+                        found_routes = True
+                        stream.expect('[')
+                        for item in stream.array_items():
+                            if stats is not None:
+                                stats.add(item)
+                            yield item
+                    else:
+                        # Metadata alongside the routes; decoded and discarded
+                        stream.value()
+                    separator = stream.peek()
+                    stream.pos += 1
+                    if separator == '}':
+                        break
+                    if separator != ',':
+                        raise FeedFormatError(f"Expected ',' or '}}' but found '{separator or 'end of file'}'")
+            if not found_routes:
+                raise FeedFormatError("Invalid data format: expected array or object with 'routes' key")
+
+        else:
+            raise FeedFormatError("Invalid data format: expected array or object with 'routes' key")
+
+        if stream.peek() != '':
+            raise FeedFormatError("Unexpected data after the end of the feed")
+
+def scan_feed(json_path):
+    """
+    Stream through a GTFS feed once and return its statistics.
+
+    Args:
+        json_path: Path to the JSON feed
+
+    Returns:
+        FeedStats: Statistics for the feed
+    """
+    stats = FeedStats()
+    for _ in iter_routes(json_path, stats):
+        pass
+    return stats
+
+def validate_feed(json_path):
+    """
+    Validate a GTFS feed in a single streaming pass.
+
+    Args:
+        json_path: Path to the JSON feed
+
+    Returns:
+        tuple: (is_valid, FeedStats or None, error message or None)
+    """
+    if not os.path.exists(json_path):
+        return False, None, f"File {json_path} does not exist"
+    if os.path.getsize(json_path) == 0:
+        return False, None, f"File {json_path} is empty"
+
+    try:
+        stats = scan_feed(json_path)
+    except json.JSONDecodeError as e:
+        return False, None, f"File {json_path} is not valid JSON: {str(e)}"
+    except (FeedFormatError, UnicodeDecodeError) as e:
+        return False, None, f"File {json_path} does not contain valid GTFS data: {str(e)}"
+
+    if not stats.valid:
+        return False, stats, f"File {json_path} contains no routes"
+    return True, stats, None
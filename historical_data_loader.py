@@ -8,6 +8,9 @@ import os
 import logging
 from datetime import datetime
 
+from caching import notify_data_change
+from port_search import create_port_search, has_port_search, rebuild_port_search
+
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -37,6 +40,45 @@ def create_historical_tables(cursor):
             appear_date TEXT
         )
     ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_historical_ports
+        ON historical_date_ranges(origin_code, destination_code)
+    ''')
+    create_port_search(cursor)
+
+# Every (code, name) port of the historical routes
+HISTORICAL_PORTS_QUERY = '''
+    SELECT origin_code AS code, origin_name AS name FROM historical_date_ranges
+    UNION
+    SELECT destination_code, destination_name FROM historical_date_ranges
+'''
+
+def index_historical_ports(cursor):
+    """
+    Rebuild the fuzzy port search index over the ports of historical_date_ranges.
+
+    Returns:
+        int: Number of terms indexed, 0 when FTS5 trigram search is unavailable
+    """
+    cursor.execute(HISTORICAL_PORTS_QUERY)
+    return rebuild_port_search(cursor, cursor.fetchall())
+
+def ensure_historical_port_search(conn):
+    """
+    Build the port search index of a historical database loaded before it existed.
+
+    Returns:
+        bool: True if the index is available
+    """
+    cursor = conn.cursor()
+    create_historical_tables(cursor)
+    if not has_port_search(cursor):
+        return False
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM port_search)")
+    if not cursor.fetchone()[0]:
+        logger.info(f"Indexed {index_historical_ports(cursor)} historical port search terms")
+        conn.commit()
+    return True
 
 def extract_port_codes(port_name_with_code):
     """
@@ -121,6 +163,7 @@ def load_historical_data(json_path='./attached_assets/GTFS appear dates.json', d
         # Insert data into the database
         logger.info("Inserting historical data into the database...")
         insert_historical_data(cursor, data)
+        index_historical_ports(cursor)
 
         # Commit the changes and close the connection
         conn.commit()
@@ -131,6 +174,7 @@ def load_historical_data(json_path='./attached_assets/GTFS appear dates.json', d
         logger.info(f"Inserted {count} historical date range records")
         
         conn.close()
+        notify_data_change("historical")
 
         logger.info("Historical data loaded successfully into the database")
         
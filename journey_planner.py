@@ -0,0 +1,458 @@
+"""
+Multi-transfer journey planning over the dated ferry timetable.
+
+The planner uses the Connection Scan Algorithm. Every dated sailing in a short
+window after the travel date becomes a connection with an absolute departure
+and arrival time. Times are normalized to UTC minutes with the route's
+departure offset, and arrivals follow from the duration, so overnight legs and
+ports in other time zones need no special cases. The connections are sorted by
+departure once and cached per data version and travel date. A single scan over
+them then yields the earliest arrival for every number of transfers up to the
+limit.
+
+Each feed item already covers every stop pair of an itinerary, so staying on
+board past an intermediate port is a single leg and does not count as a transfer.
+"""
+
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from db import execute_query, get_data_version
+
+logger = logging.getLogger(__name__)
+
+# Days after the travel date whose sailings can be part of a journey
+PLAN_HORIZON_DAYS = 2
+
+# Default limits for journey searches
+DEFAULT_MAX_TRANSFERS = 2
+DEFAULT_MIN_CONNECTION_MINUTES = 30
+
+# Timetables kept in memory, one per travel date
+TIMETABLE_CACHE_SIZE = 16
+
+# Option sets kept in memory, one per (origin, destination, date) search
+OPTIONS_CACHE_SIZE = 256
+
+_INFINITY = float('inf')
+
+class Connection:
+    """One dated sailing between two ports, with absolute UTC times in minutes."""
+
+    __slots__ = ('departure', 'arrival', 'origin', 'destination', 'day', 'departure_minute',
+                 'offset_shift', 'route_id', 'vessel_id', 'row')
+
+    def __init__(self, departure, arrival, origin, destination, day, departure_minute,
+                 offset_shift, route_id, vessel_id, row):
+        self.departure = departure
+        self.arrival = arrival
+        self.origin = origin
+        self.destination = destination
+        self.day = day
+        self.departure_minute = departure_minute
+        self.offset_shift = offset_shift
+        self.route_id = route_id
+        self.vessel_id = vessel_id
+        self.row = row
+
+    def arrival_date(self):
+        """Local arrival date, later than the departure date for overnight sailings."""
+        local_arrival = self.departure_minute + (self.arrival - self.departure) + self.offset_shift
+        departure_date = datetime.strptime(self.row[4], "%Y-%m-%d").date()
+        return (departure_date + timedelta(days=local_arrival // 1440)).strftime("%Y-%m-%d")
+
+    def to_leg(self):
+        """Return the sailing as a plain dictionary."""
+        row = self.row
+        return {
+            "route_id": self.route_id,
+            "vessel_id": self.vessel_id,
+            "origin_code": row[0],
+            "origin_port_name": row[1],
+            "destination_code": row[2],
+            "destination_port_name": row[3],
+            "date": row[4],
+            "departure_time": row[5],
+            "arrival_time": row[6],
+            "arrival_date": self.arrival_date(),
+            "duration": self.arrival - self.departure,
+            "company_name": row[7],
+            "company_code": row[8],
+            "vessel_name": row[9],
+            "indicative_price": row[10],
+            "min_accommodation_price": row[11]
+        }
+
+def _parse_minutes(time_str):
+    """Convert "HH:MM" to minutes after midnight, or None if it can't be parsed."""
+    try:
+        hours, minutes = time_str.split(':')[:2]
+        return int(hours) * 60 + int(minutes)
+    except (AttributeError, ValueError):
+        return None
+
+class Timetable:
+    """
+    Connections departing within a window of dates, sorted by departure time.
+    """
+
+    def __init__(self, start_date, days=PLAN_HORIZON_DAYS):
+        self.start_date = start_date
+        self.days = days
+        start = datetime.strptime(start_date, "%Y-%m-%d").date()
+        end_date = (start + timedelta(days=days)).strftime("%Y-%m-%d")
+
+        query = """
+        SELECT
+            d.origin_port_code,
+            d.origin_port_name,
+            d.destination_port_code,
+            d.destination_port_name,
+            d.schedule_date,
+            d.departure_time,
+            d.arrival_time,
+            d.company,
+            d.company_code,
+            d.vessel_name,
+            d.indicative_price,
+            d.min_accommodation_price,
+            d.departure_minute,
+            d.duration,
+            r.departure_offset,
+            r.arrival_offset,
+            d.route_id,
+            d.vessel_id
+        FROM
+            departures d
+        JOIN
+            routes r ON r.route_id = d.route_id
+        WHERE
+            d.schedule_date BETWEEN :start AND :end
+        """
+        connections = []
+        for row in execute_query(query, {"start": start_date, "end": end_date}):
+            departure_minute = row[12]
+            if departure_minute is None or departure_minute < 0:
+                continue
+            day = (datetime.strptime(row[4], "%Y-%m-%d").date() - start).days
+            departure = day * 1440 + departure_minute - (row[14] or 0) * 60
+
+            if row[13] is not None and row[13] >= 0:
+                arrival = departure + row[13]
+            else:
+                # No duration: use the local arrival time, rolling over midnight
+                arrival_minute = _parse_minutes(row[6])
+                if arrival_minute is None:
+                    continue
+                arrival = day * 1440 + arrival_minute - (row[15] or 0) * 60
+                while arrival < departure:
+                    arrival += 1440
+
+            offset_shift = ((row[15] or 0) - (row[14] or 0)) * 60
+            connections.append(Connection(departure, arrival, row[0], row[2], day, departure_minute,
+                                          offset_shift, row[16], row[17], row[:12]))
+
+        connections.sort(key=lambda c: (c.departure, c.arrival))
+        self.connections = connections
+
+        # Per port pair, the positions of its connections in departure order
+        self.by_pair = {}
+        for connection in connections:
+            self.by_pair.setdefault((connection.origin, connection.destination), []).append(connection)
+        self.departures_by_pair = {pair: [c.departure for c in items] for pair, items in self.by_pair.items()}
+
+    def __len__(self):
+        return len(self.connections)
+
+    def next_departure(self, origin, destination, earliest):
+        """Return the first connection between two ports departing at or after a time."""
+        departures = self.departures_by_pair.get((origin, destination))
+        if not departures:
+            return None
+        index = bisect.bisect_left(departures, earliest)
+        if index == len(departures):
+            return None
+        return self.by_pair[(origin, destination)][index]
+
+# Timetables kept in memory, and option sets for recently searched port pairs
+_timetables = OrderedDict()
+_options = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cache_get(cache, key):
+    """Return a cached value and mark it as recently used, or None."""
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _cache_put(cache, key, value, size):
+    """Store a value, evicting the least recently used entries beyond size."""
+    with _cache_lock:
+        cache[key] = value
+        while len(cache) > size:
+            cache.popitem(last=False)
+
+def get_timetable(start_date, days=PLAN_HORIZON_DAYS):
+    """
+    Return the timetable for a travel date, building it on first use.
+
+    Timetables are cached per data version, so a reload makes them rebuild.
+    """
+    key = (get_data_version(), start_date, days)
+    timetable = _cache_get(_timetables, key)
+    if timetable is None:
+        timetable = Timetable(start_date, days)
+        logger.info(f"Built timetable for {start_date} (+{days} days) with {len(timetable)} connections")
+        _cache_put(_timetables, key, timetable, TIMETABLE_CACHE_SIZE)
+    return timetable
+
+def clear_timetable_cache():
+    """Drop every cached timetable and option set."""
+    with _cache_lock:
+        _timetables.clear()
+        _options.clear()
+
+def _leg_price(connection):
+    """Fare of a sailing in cents: the indicative price, else the lowest accommodation price."""
+    price = connection.row[10] or connection.row[11]
+    return price if price and price > 0 else None
+
+def _journey(legs):
+    """Summarize a list of connections as a journey dictionary."""
+    prices = [_leg_price(leg) for leg in legs]
+    total_price = sum(prices) if None not in prices else None
+    return {
+        "legs": [leg.to_leg() for leg in legs],
+        "transfers": len(legs) - 1,
+        "departure_date": legs[0].row[4],
+        "departure_time": legs[0].row[5],
+        "arrival_date": legs[-1].arrival_date(),
+        "arrival_time": legs[-1].row[6],
+        "total_duration": legs[-1].arrival - legs[0].departure,
+        "connection_waits": [legs[i + 1].departure - legs[i].arrival for i in range(len(legs) - 1)],
+        "total_price": total_price
+    }
+
+def _scan(timetable, origin, destination, max_transfers, min_connection, after_minute):
+    """
+    Connection scan for the earliest arrival with at most max_transfers changes.
+
+    Returns:
+        list: The connections of each Pareto journey, fewest transfers first
+    """
+    rounds = max_transfers + 1
+
+    # arrival[k][port]: earliest arrival using at most k + 1 legs
+    arrival = [{} for _ in range(rounds)]
+    # parent[k][port]: (connection, previous round) that achieved it
+    parent = [{} for _ in range(rounds)]
+
+    for connection in timetable.connections:
+        # No connection departing after the slowest round's arrival can improve anything
+        target_arrivals = [arrival[k].get(destination, _INFINITY) for k in range(rounds)]
+        if connection.departure >= max(target_arrivals):
+            break
+
+        if connection.origin == origin:
+            if connection.day == 0 and connection.departure_minute < after_minute:
+                continue
+            if connection.arrival < arrival[0].get(connection.destination, _INFINITY):
+                arrival[0][connection.destination] = connection.arrival
+                parent[0][connection.destination] = (connection, None)
+            continue
+
+        for k in range(1, rounds):
+            reached = arrival[k - 1].get(connection.origin)
+            if reached is None or reached + min_connection > connection.departure:
+                continue
+            if connection.arrival < arrival[k].get(connection.destination, _INFINITY):
+                arrival[k][connection.destination] = connection.arrival
+                parent[k][connection.destination] = (connection, k - 1)
+
+    journeys = []
+    best = _INFINITY
+    for k in range(rounds):
+        reached = arrival[k].get(destination)
+        if reached is None or reached >= best:
+            continue
+        best = reached
+
+        legs = []
+        port, level = destination, k
+        while level is not None:
+            connection, previous = parent[level][port]
+            legs.append(connection)
+            port, level = connection.origin, previous
+        legs.reverse()
+        journeys.append(legs)
+
+    return journeys
+
+def earliest_arrival(origin, destination, date, max_transfers=DEFAULT_MAX_TRANSFERS,
+                     min_connection=DEFAULT_MIN_CONNECTION_MINUTES, after="00:00"):
+    """
+    Find the earliest-arriving journeys between two ports.
+
+    One journey is returned per number of transfers that arrives strictly earlier
+    than every journey with fewer transfers, so the result is the Pareto front
+    of arrival time against transfers.
+
+    Args:
+        origin: Origin port code
+        destination: Destination port code
+        date: Travel date in YYYY-MM-DD format
+        max_transfers: Maximum number of changes of ship
+        min_connection: Minimum minutes between arriving at a port and departing again
+        after: Earliest local departure time on the travel date
+
+    Returns:
+        list: Journey dictionaries, fewest transfers first
+    """
+    origin = origin.strip().upper()
+    destination = destination.strip().upper()
+    if origin == destination:
+        return []
+
+    timetable = get_timetable(date)
+    legs = _scan(timetable, origin, destination, max_transfers, min_connection, _parse_minutes(after) or 0)
+    return [_journey(journey) for journey in legs]
+
+def connections_via(origin, via, destination, date, min_connection=DEFAULT_MIN_CONNECTION_MINUTES):
+    """
+    Pair every sailing from origin to an intermediate port on the travel date with
+    the first onward sailing that can be caught, including on later days.
+
+    Args:
+        origin: Origin port code
+        via: Intermediate port code
+        destination: Final destination port code
+        date: Travel date in YYYY-MM-DD format
+        min_connection: Minimum minutes between arriving and departing again
+
+    Returns:
+        list: (first leg, second leg, wait in minutes) tuples of leg dictionaries
+    """
+    origin, via, destination = (code.strip().upper() for code in (origin, via, destination))
+    timetable = get_timetable(date)
+
+    pairs = []
+    for first in timetable.by_pair.get((origin, via), []):
+        if first.day != 0:
+            continue
+        second = timetable.next_departure(via, destination, first.arrival + min_connection)
+        if second is not None:
+            pairs.append((first.to_leg(), second.to_leg(), second.departure - first.arrival))
+    return pairs
+
+# Weight of each transfer in the best-balance score, relative to paying the
+# cheapest fare or taking the fastest journey once more
+BALANCE_TRANSFER_PENALTY = 0.5
+
+def _criteria(legs):
+    """
+    Criteria of a journey, all minimized: price in cents, duration in minutes,
+    transfers and absolute departure, so earlier sailings are preferred.
+    """
+    prices = [_leg_price(leg) for leg in legs]
+    price = sum(prices) if None not in prices else _INFINITY
+    return (price, legs[-1].arrival - legs[0].departure, len(legs) - 1, legs[0].departure)
+
+def pareto_front(candidates):
+    """
+    Return the candidates that no other candidate dominates.
+
+    Candidates are (criteria, value) pairs. After a lexicographic sort a candidate
+    can only be dominated by one before it, so one pass comparing each candidate
+    with the front built so far is enough.
+    """
+    front = []
+    for criteria, value in sorted(candidates, key=lambda candidate: candidate[0]):
+        if not any(all(f <= c for f, c in zip(kept, criteria)) for kept, _ in front):
+            front.append((criteria, value))
+    return front
+
+def _balance_scores(front):
+    """Score front members by price and duration relative to the best of each."""
+    known_prices = [criteria[0] for criteria, _ in front if criteria[0] != _INFINITY]
+    min_price = min(known_prices) if known_prices else None
+    max_price = max(known_prices) if known_prices else None
+    min_duration = max(min(criteria[1] for criteria, _ in front), 1)
+
+    scores = []
+    for price, duration, transfers, _ in (criteria for criteria, _ in front):
+        price_score = (price if price != _INFINITY else max_price) / min_price if min_price else 0
+        scores.append(price_score + duration / min_duration + BALANCE_TRANSFER_PENALTY * transfers)
+    return scores
+
+def route_options(origin, destination, date, max_transfers=DEFAULT_MAX_TRANSFERS,
+                  min_connection=DEFAULT_MIN_CONNECTION_MINUTES):
+    """
+    Find the Pareto-optimal journeys between two ports on a date.
+
+    The candidates are the direct sailings of the day, every first leg to
+    another port paired with the first onward sailing that can be caught, and
+    the earliest-arriving journeys with more transfers. They all come from the
+    cached timetable, and the result is cached too, so the cheapest, fastest and
+    best-balanced answers cost one search.
+
+    Args:
+        origin: Origin port code
+        destination: Destination port code
+        date: Travel date in YYYY-MM-DD format
+        max_transfers: Maximum number of changes of ship
+        min_connection: Minimum minutes between arriving at a port and departing again
+
+    Returns:
+        dict: "options" (the front, cheapest first) and the "cheapest", "fastest"
+        and "best_balance" options, which are None when nothing was found
+    """
+    origin = origin.strip().upper()
+    destination = destination.strip().upper()
+    key = (get_data_version(), origin, destination, date, max_transfers, min_connection)
+    result = _cache_get(_options, key)
+    if result is not None:
+        return result
+
+    timetable = get_timetable(date)
+    candidates = {}
+
+    def add(legs):
+        candidates.setdefault(tuple(id(leg) for leg in legs), legs)
+
+    if origin != destination:
+        for connection in timetable.by_pair.get((origin, destination), []):
+            if connection.day == 0:
+                add([connection])
+
+        if max_transfers >= 1:
+            for (start, via), first_legs in timetable.by_pair.items():
+                if start != origin or via == destination:
+                    continue
+                for first in first_legs:
+                    if first.day != 0:
+                        continue
+                    second = timetable.next_departure(via, destination, first.arrival + min_connection)
+                    if second is not None:
+                        add([first, second])
+
+        for legs in _scan(timetable, origin, destination, max_transfers, min_connection, 0):
+            add(legs)
+
+    front = pareto_front([(_criteria(legs), legs) for legs in candidates.values()])
+    options = [_journey(legs) for _, legs in front]
+
+    result = {"options": options, "cheapest": None, "fastest": None, "best_balance": None}
+    if options:
+        indexes = range(len(front))
+        scores = _balance_scores(front)
+        result["cheapest"] = options[min(indexes, key=lambda i: (front[i][0][0], front[i][0][1]))]
+        result["fastest"] = options[min(indexes, key=lambda i: (front[i][0][1], front[i][0][0]))]
+        result["best_balance"] = options[min(indexes, key=lambda i: scores[i])]
+
+    _cache_put(_options, key, result, OPTIONS_CACHE_SIZE)
+    return result
@@ -0,0 +1,112 @@
+"""
+In-process port directory.
+
+The ports table is read once per data version. The port list, the code index,
+searches and the port matcher used by the query extractor are then answered
+from memory, so port lookups cost no SQL after warm-up. Only searches that
+match no port by code or name fall through to the fuzzy port index. The directory is shared
+by the LangChain tools, FerryAgent.get_port_information and /api/ports.
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from db import execute_query, get_data_version
+from port_search import search_ports
+from utils import PortMatcher
+
+logger = logging.getLogger(__name__)
+
+# Read from the routes table when the database predates the ports table
+ROUTES_PORTS_QUERY = """
+SELECT DISTINCT origin_port_code as code, origin_port_name as name FROM routes
+UNION
+SELECT DISTINCT destination_port_code as code, destination_port_name as name FROM routes
+ORDER BY name
+"""
+
+class PortDirectory:
+    """
+    All ports of one data version, sorted by name.
+
+    The lists and dicts handed out are shared between callers and must not be
+    modified.
+    """
+
+    def __init__(self, rows):
+        self.ports = [{"code": code, "name": name} for code, name in rows if code and name]
+        self.by_code = {}
+        for port in self.ports:
+            self.by_code.setdefault(port["code"].lower(), []).append(port)
+        self._matcher = None
+        self._matcher_lock = threading.Lock()
+
+    @classmethod
+    def load(cls):
+        """Read the directory from the ports table, or from routes on older databases."""
+        try:
+            rows = execute_query("SELECT code, name FROM ports ORDER BY name, code")
+        except Exception as e:
+            logger.warning(f"Ports table unavailable, reading ports from routes: {str(e)}")
+            rows = None
+        if not rows:
+            rows = execute_query(ROUTES_PORTS_QUERY)
+        return cls(rows)
+
+    def __len__(self):
+        return len(self.ports)
+
+    def get(self, code: str) -> Optional[Dict[str, str]]:
+        """Return the port with a code, case-insensitively, or None."""
+        matches = self.by_code.get(code.lower()) if code else None
+        return matches[0] if matches else None
+
+    def search(self, term: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Find ports by code or name, as the SQL lookup did: an exact code match
+        or a case-insensitive substring of the name, sorted by name. When
+        nothing matches, the fuzzy port index is asked instead, best match first.
+
+        Args:
+            term: Port code or part of a port name; all ports when empty
+
+        Returns:
+            List of port dictionaries with 'code' and 'name' keys
+        """
+        if not term:
+            return self.ports
+        needle = term.lower()
+        found = [port for port in self.ports if port["code"].lower() == needle or needle in port["name"].lower()]
+        if found:
+            return found
+        return [{"code": match["code"], "name": match["name"]} for match in search_ports(term)]
+
+    @property
+    def matcher(self) -> PortMatcher:
+        """The port matcher for the query extractor, built on first use."""
+        if self._matcher is None:
+            with self._matcher_lock:
+                if self._matcher is None:
+                    self._matcher = PortMatcher(self.ports)
+        return self._matcher
+
+_directory = None
+_directory_version = None
+_directory_lock = threading.Lock()
+
+def get_port_directory() -> PortDirectory:
+    """
+    Return the port directory for the current data version, loading it on first use.
+    """
+    global _directory, _directory_version
+    version = get_data_version()
+    if _directory_version == version and _directory is not None:
+        return _directory
+
+    with _directory_lock:
+        if _directory_version != version or _directory is None:
+            _directory = PortDirectory.load()
+            _directory_version = version
+            logger.info(f"Loaded {len(_directory)} ports into the port directory")
+        return _directory
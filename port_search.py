@@ -0,0 +1,201 @@
+"""
+Fuzzy port lookup over an SQLite FTS5 trigram index.
+
+The port_search table holds one row per searchable term of a port: its name,
+its code and the other names travellers use for it (PORT_ALIASES). A lookup
+splits the search term into trigrams and asks the index for the terms sharing
+the most of them, ranked by bm25, in one query. The few candidates are then
+re-scored by trigram similarity, so misspellings such as "Santorinni" or
+"Mykonoss" still find their port while unrelated names are dropped.
+
+The same table is built in gtfs.db from the ports table and in previous_db.db
+from the ports of historical_date_ranges.
+"""
+
+import logging
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Other names of ports, by port code: English and Greek spellings, island names
+# for the main port, and former names
+PORT_ALIASES = {
+    "AEG": ["Egina"],
+    "BTH": ["Vathy", "Vathi"],
+    "CFU": ["Kerkyra", "Kerkira"],
+    "CHA": ["Hania", "Souda"],
+    "GRA": ["Patra"],
+    "GYT": ["Gytheio", "Gythion"],
+    "HER": ["Iraklio", "Iraklion", "Heraklion", "Crete"],
+    "HYD": ["Hydra", "Idra"],
+    "JMK": ["Mikonos"],
+    "JSY": ["Ermoupoli", "Siros"],
+    "JTR": ["Thira", "Fira", "Santorini", "Santorin"],
+    "JTY": ["Astipalea", "Astypalea"],
+    "KAZ": ["Megisti", "Kastelorizo"],
+    "KGS": ["Cos"],
+    "KTH": ["Cythera", "Kithira"],
+    "LAV": ["Lavrion", "Laurium"],
+    "LES": ["Lesbos", "Mytilene", "Mitilini"],
+    "LMN": ["Lemnos", "Myrina"],
+    "PAS": ["Parikia"],
+    "PIR": ["Athens", "Pireas", "Pireaus"],
+    "RHO": ["Rodos", "Rhodos"],
+    "SAM": ["Samothraki"],
+    "SKG": ["Salonica", "Salonika"],
+    "TAL": ["Tallin"],
+    "ZTH": ["Zakynthos", "Zakinthos"],
+}
+
+# Candidates fetched from the index before re-scoring
+CANDIDATE_LIMIT = 50
+
+# Minimum trigram similarity (0 to 1) for a port to be returned
+MIN_SIMILARITY = 0.3
+
+PORT_SEARCH_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS port_search USING fts5(
+    term,
+    code UNINDEXED,
+    name UNINDEXED,
+    kind UNINDEXED,
+    tokenize = 'trigram'
+)
+"""
+
+def create_port_search(cursor) -> bool:
+    """
+    Create the port_search table.
+
+    Returns:
+        bool: False when this SQLite build has no FTS5 trigram tokenizer
+    """
+    try:
+        cursor.execute(PORT_SEARCH_DDL)
+        return True
+    except sqlite3.OperationalError as e:
+        logger.warning(f"Fuzzy port search unavailable, FTS5 trigram tokenizer missing: {str(e)}")
+        return False
+
+def has_port_search(cursor) -> bool:
+    """Whether the database holds a port_search table."""
+    cursor.execute("SELECT EXISTS (SELECT 1 FROM sqlite_master WHERE name = 'port_search')")
+    return bool(cursor.fetchone()[0])
+
+def search_terms(ports: Iterable[Tuple[str, str]]) -> List[Tuple[str, str, str, str]]:
+    """
+    The (term, code, name, kind) rows indexed for a list of (code, name) ports.
+    Aliases are added for the codes in PORT_ALIASES.
+    """
+    rows = []
+    seen = set()
+    for code, name in ports:
+        if not code:
+            continue
+        name = name or code
+        terms = [(name, "name"), (code, "code")]
+        if code not in seen:
+            terms.extend((alias, "alias") for alias in PORT_ALIASES.get(code, []))
+            seen.add(code)
+        rows.extend((term, code, name, kind) for term, kind in terms)
+    return rows
+
+def rebuild_port_search(cursor, ports: Optional[Iterable[Tuple[str, str]]] = None) -> int:
+    """
+    Rebuild the port_search table.
+
+    Args:
+        cursor: Cursor on the database to index
+        ports: (code, name) pairs; read from the ports table when None
+
+    Returns:
+        int: Number of terms indexed, 0 when the table is unavailable
+    """
+    if not has_port_search(cursor):
+        return 0
+    if ports is None:
+        cursor.execute("SELECT code, name FROM ports")
+        ports = cursor.fetchall()
+    rows = search_terms(ports)
+    cursor.execute("DELETE FROM port_search")
+    cursor.executemany("INSERT INTO port_search (term, code, name, kind) VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+def trigrams(text: str) -> set:
+    """The set of lower-cased three-character substrings of a text."""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def similarity(term: str, candidate: str) -> float:
+    """
+    Trigram similarity (Jaccard) of a search term and an indexed term. Each
+    word of a longer candidate is compared too, so "Santorini" fully matches
+    "Santorini (Thira)".
+    """
+    wanted = trigrams(term)
+    if not wanted:
+        return 0.0
+    best = 0.0
+    parts = [candidate] + candidate.replace("(", " ").replace(")", " ").split()
+    for part in parts:
+        found = trigrams(part)
+        if found:
+            best = max(best, len(wanted & found) / len(wanted | found))
+    return best
+
+def match_expression(term: str) -> Optional[str]:
+    """An FTS5 query matching any trigram of a term, or None for terms under three characters."""
+    grams = sorted(trigrams(term.strip()))
+    if not grams:
+        return None
+    return " OR ".join('"' + gram.replace('"', '""') + '"' for gram in grams)
+
+PORT_SEARCH_QUERY = """
+SELECT term, code, name
+FROM port_search
+WHERE port_search MATCH ?
+ORDER BY rank
+LIMIT ?
+"""
+
+def search_ports(term: str, limit: int = 5, conn=None) -> List[Dict[str, object]]:
+    """
+    Find the ports whose name, code or alias best matches a possibly misspelled term.
+
+    Args:
+        term: Port name, code or alias as typed by the user
+        limit: Maximum number of ports to return
+        conn: Optional connection to search; the pooled ferry database when None
+
+    Returns:
+        List of dictionaries with 'code', 'name', 'matched' (the indexed term
+        that matched) and 'score' (0 to 1), best first, one per port
+    """
+    expression = match_expression(term or "")
+    if expression is None:
+        return []
+
+    try:
+        if conn is None:
+            from db import execute_query
+            rows = execute_query(PORT_SEARCH_QUERY, (expression, CANDIDATE_LIMIT))
+        else:
+            rows = conn.execute(PORT_SEARCH_QUERY, (expression, CANDIDATE_LIMIT)).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Error searching ports for '{term}': {str(e)}")
+        return []
+
+    needle = term.strip().lower()
+    best = {}
+    for rank, (matched, code, name) in enumerate(rows):
+        score = 1.0 if matched.lower() == needle else similarity(needle, matched)
+        if score < MIN_SIMILARITY:
+            continue
+        # Ties keep the bm25 order of the index
+        key = (score, -rank)
+        if code not in best or key > best[code][0]:
+            best[code] = (key, {"code": code, "name": name, "matched": matched, "score": round(score, 3)})
+
+    ranked = sorted(best.values(), key=lambda item: item[0], reverse=True)
+    return [match for _, match in ranked[:limit]]
@@ -102,6 +102,16 @@ Example response when no historical data exists:
 
 ____________________________________________
 
+#### Search Tools
+Prefer these tools over writing SQL for the questions they cover. They take port codes (use get_port_information to find them) and dates in YYYY-MM-DD format.
+- plan_journey: journeys with changes of ship between two ports, e.g. island hopping or ports with no direct ferry. Use it when a direct search finds nothing, before check_historical_routes. Example: plan_journey({"params": {"origin": "PIR", "destination": "ANA", "date": "2025-07-01", "max_transfers": 2}})
+- compare_route_options: the cheapest, fastest and best-balance ways to travel between two ports on a date, direct or with changes, from one search. Use it once to answer any of "cheapest", "fastest" or "best" for a date, and for follow-ups comparing them. Same parameters as plan_journey.
+- search_date_range: the sailings of a port pair on every day of a window of up to 31 days (number of sailings, cheapest fare, earliest departure, fastest duration, plus the cheapest and fastest day). Use it for "any day next week", "around 15 June" or "which day is cheapest" instead of querying date by date. Example: search_date_range({"params": {"origin": "PIR", "destination": "JNX", "start_date": "2025-07-10", "end_date": "2025-07-17"}})
+- get_fare_calendar: the month view of a port pair, one line per day with sailings (number of sailings, lowest base and accommodation fares, first and last departure) and the cheapest day of the month. Use it for "cheapest day in July" or "which days in August have ferries"; use search_date_range for windows that are not a calendar month. Example: get_fare_calendar({"params": {"origin": "PIR", "destination": "JNX", "month": "2025-07"}})
+- search_round_trip: outbound and return sailings paired and ranked by combined price or travel time, with the stay between them. Use it for any return or round-trip question instead of two separate searches. Give return_date, or stay_days for "back after N days"; same_company, min_stay_hours and max_stay_hours narrow the pairs, and order is "cheapest" or "fastest". Example: search_round_trip({"params": {"origin": "PIR", "destination": "JTR", "outbound_date": "2025-07-01", "return_date": "2025-07-08"}})
+
+____________________________________________
+
 Date and Vessel Information:
 dates_and_vessels: A table of specific dates to the ferry vessel operating on that date.
 id:unique identifier for the dates_and_vessels in the database (Not Meaningful for End User).
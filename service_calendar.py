@@ -0,0 +1,186 @@
+"""
+Compact service calendars for the dated timetable.
+
+A route runs a vessel on a set of dates. Instead of one row per date, a service
+calendar stores the first and last date and a bitset with one bit per day in
+between: bit i of the little-endian bitset is set when the service runs i days
+after the start date. Like a GTFS calendar, each calendar also has a weekday
+pattern. Its exceptions are the dates where the bitset departs from the pattern.
+
+The bitset is held as a Python int, so membership and range tests for many
+dates, the weekday pattern and its exceptions are shifts and masks over the
+whole calendar rather than per-date loops.
+"""
+
+from datetime import date, timedelta
+
+# Day numbers used for date IDs count from this date
+EPOCH = date(2000, 1, 1)
+
+# Weekday pattern bits, Monday first, as in a GTFS calendar
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+def parse_date(value):
+    """Convert a YYYY-MM-DD string (or a date) to a date."""
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+def day_number(value):
+    """Days from EPOCH to a date."""
+    return (parse_date(value) - EPOCH).days
+
+def _set_bits(bits):
+    """Yield the positions of the set bits of an int, lowest first."""
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+def _repeat(pattern, width, count):
+    """An int repeating the low `width` bits of pattern `count` times."""
+    return pattern * (((1 << (width * count)) - 1) // ((1 << width) - 1)) if count > 0 else 0
+
+class ServiceCalendar:
+    """
+    The operating days of one service between a start and an end date.
+    """
+
+    __slots__ = ('start', 'span', 'bits')
+
+    def __init__(self, start, span, bits):
+        self.start = start
+        self.span = span
+        self.bits = bits
+
+    @classmethod
+    def from_dates(cls, dates):
+        """Build a calendar from an iterable of dates or YYYY-MM-DD strings."""
+        days = sorted({parse_date(value) for value in dates})
+        if not days:
+            return cls(EPOCH, 0, 0)
+        start = days[0]
+        bits = 0
+        for day in days:
+            bits |= 1 << (day - start).days
+        return cls(start, (days[-1] - start).days + 1, bits)
+
+    @classmethod
+    def from_row(cls, start_date, end_date, days):
+        """Build a calendar from the start_date, end_date and days columns of service_calendars."""
+        start = parse_date(start_date)
+        return cls(start, (parse_date(end_date) - start).days + 1, int.from_bytes(days, 'little'))
+
+    def to_blob(self):
+        """Return the bitset as little-endian bytes."""
+        return self.bits.to_bytes((self.span + 7) // 8, 'little')
+
+    @property
+    def end(self):
+        """Last date of the calendar."""
+        return self.start + timedelta(days=max(self.span - 1, 0))
+
+    def __len__(self):
+        """Number of operating days."""
+        return self.bits.bit_count()
+
+    def __iter__(self):
+        """Operating dates in order."""
+        for offset in _set_bits(self.bits):
+            yield self.start + timedelta(days=offset)
+
+    def dates(self):
+        """Operating dates as YYYY-MM-DD strings."""
+        return [day.isoformat() for day in self]
+
+    def runs_on(self, value):
+        """Whether the service runs on a date."""
+        offset = (parse_date(value) - self.start).days
+        return 0 <= offset < self.span and bool(self.bits >> offset & 1)
+
+    def runs_on_many(self, values):
+        """
+        Whether the service runs on each of a list of dates: the dates are
+        gathered into one mask, tested against the bitset with a single AND.
+        """
+        offsets = [(parse_date(value) - self.start).days for value in values]
+        wanted = 0
+        for offset in offsets:
+            if 0 <= offset < self.span:
+                wanted |= 1 << offset
+        hits = self.bits & wanted
+        return [0 <= offset < self.span and bool(hits >> offset & 1) for offset in offsets]
+
+    def window(self, start_date, end_date):
+        """
+        Return the operating days between two dates, inclusive, as a calendar
+        starting at start_date. A single shift and mask over the bitset.
+        """
+        start = parse_date(start_date)
+        span = (parse_date(end_date) - start).days + 1
+        if span <= 0:
+            return ServiceCalendar(start, 0, 0)
+        offset = (start - self.start).days
+        bits = self.bits >> offset if offset >= 0 else self.bits << -offset
+        return ServiceCalendar(start, span, bits & ((1 << span) - 1))
+
+    def dates_between(self, start_date, end_date):
+        """Operating dates between two dates, inclusive, as YYYY-MM-DD strings."""
+        return self.window(start_date, end_date).dates()
+
+    def union(self, other):
+        """Return a calendar of the days either calendar runs on."""
+        if not other.bits:
+            return self
+        if not self.bits:
+            return other
+        start = min(self.start, other.start)
+        end = max(self.end, other.end)
+        bits = 0
+        for calendar in (self, other):
+            bits |= calendar.bits << (calendar.start - start).days
+        return ServiceCalendar(start, (end - start).days + 1, bits)
+
+    def pattern_bits(self, weekday_mask):
+        """
+        The bitset of the days in the calendar's span that fall on the weekdays
+        of a weekday pattern: one week of bits, repeated over the span.
+        """
+        first = self.start.weekday()
+        week = sum(1 << offset for offset in range(7) if weekday_mask >> (first + offset) % 7 & 1)
+        return _repeat(week, 7, (self.span + 6) // 7) & ((1 << self.span) - 1)
+
+    def weekday_mask(self):
+        """
+        The regular weekday pattern: bit 0 (Monday) to bit 6 (Sunday) is set for
+        the weekdays the service runs on at least half of the time.
+        """
+        mask = 0
+        for weekday in range(7):
+            days = self.pattern_bits(1 << weekday)
+            total = days.bit_count()
+            if total and (self.bits & days).bit_count() * 2 >= total:
+                mask |= 1 << weekday
+        return mask
+
+    def exceptions(self, weekday_mask=None):
+        """
+        Dates where the service departs from its weekday pattern, as in GTFS
+        calendar_dates.
+
+        Returns:
+            tuple: (added dates, removed dates) as YYYY-MM-DD strings
+        """
+        if weekday_mask is None:
+            weekday_mask = self.weekday_mask()
+        regular = self.pattern_bits(weekday_mask)
+        added = ServiceCalendar(self.start, self.span, self.bits & ~regular)
+        removed = ServiceCalendar(self.start, self.span, regular & ~self.bits)
+        return added.dates(), removed.dates()
+
+def union_all(calendars):
+    """Return a calendar of the days any of the calendars runs on."""
+    result = ServiceCalendar(EPOCH, 0, 0)
+    for calendar in calendars:
+        result = result.union(calendar)
+    return result
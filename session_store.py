@@ -0,0 +1,472 @@
+"""
+Bounded store for the conversation history of chat sessions.
+
+Sessions are kept in LRU order and expire after SESSION_TTL_SECONDS without a
+message; beyond MAX_SESSIONS the least recently used one is dropped. Each
+session keeps at most MAX_CONVERSATION_HISTORY recent messages verbatim within
+SESSION_TOKEN_BUDGET estimated tokens. Older turns are folded into a rolling
+summary, one line per turn, itself capped at SUMMARY_TOKEN_BUDGET, so the
+history sent to the model each turn stays bounded however long a chat runs.
+
+Messages are stored as (role, content) pairs, role being 'human' or 'ai'.
+
+Two interchangeable backends implement the store (history, append, clear,
+stats), chosen by config.CONVERSATION_BACKEND through create_session_store():
+
+- 'sqlite' (default): SQLiteSessionStore keeps the sessions in a WAL-mode
+  SQLite file that every worker process opens, so any worker behind a load
+  balancer can serve any conversation without sticky sessions;
+- 'memory': SessionStore keeps them in the process, for a single worker.
+"""
+
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import CONVERSATION_BACKEND, CONVERSATIONS_DB_PATH, MAX_CONVERSATION_HISTORY
+
+logger = logging.getLogger(__name__)
+
+# Sessions kept, and seconds of inactivity before one expires
+MAX_SESSIONS = 5000
+SESSION_TTL_SECONDS = 2 * 3600
+
+# Estimated tokens of the recent messages, and of the summary, per session
+SESSION_TOKEN_BUDGET = 3000
+SUMMARY_TOKEN_BUDGET = 800
+
+# Characters of a question or answer kept in its summary line
+SUMMARY_SNIPPET_CHARS = 160
+
+# Dates and prices of a turn kept in its summary line
+SUMMARY_MAX_FACTS = 4
+
+# Dates and prices as the answers write them
+ISO_DATE_PATTERN = re.compile(r"\b\d{4}-\d{2}-\d{2}\b")
+LONG_DATE_PATTERN = re.compile(r"\b(?:January|February|March|April|May|June|July|August|September|October|"
+                               r"November|December) \d{1,2},? \d{4}\b")
+PRICE_PATTERN = re.compile(r"€\s?\d+(?:[.,]\d{2})?")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a text, at about four characters per token."""
+    return len(text) // 4 + 1
+
+def _snippet(text: str) -> str:
+    """First line of a text, shortened to SUMMARY_SNIPPET_CHARS."""
+    line = text.strip().split("\n", 1)[0].strip()
+    return line if len(line) <= SUMMARY_SNIPPET_CHARS else line[:SUMMARY_SNIPPET_CHARS - 3].rstrip() + "..."
+
+def _first(values, limit=SUMMARY_MAX_FACTS):
+    """The first distinct values, in order."""
+    return list(dict.fromkeys(values))[:limit]
+
+def turn_facts(question: str, answer: str) -> str:
+    """
+    The ports, dates and prices of a turn, which later turns refer back to
+    ("the second one", "that day") after the turn itself has been folded.
+    """
+    from utils import extract_date_from_text, extract_ports_from_text
+
+    facts = []
+    try:
+        from port_directory import get_port_directory
+
+        directory = get_port_directory()
+
+        def name(code):
+            port = directory.get(code)
+            return port["name"].title() if port else code
+
+        origin, destination = extract_ports_from_text(question, directory.ports, directory.matcher)
+        if origin and destination:
+            facts.append(f"ports: {name(origin)} → {name(destination)}")
+        else:
+            codes = _first(code for _, _, code in directory.matcher.find_all(question + "\n" + answer))
+            if codes:
+                facts.append("ports: " + ", ".join(name(code) for code in codes))
+    except Exception as e:
+        logger.warning(f"Could not extract the ports of a turn for its summary: {str(e)}")
+
+    dates = [extract_date_from_text(question)] + ISO_DATE_PATTERN.findall(answer)
+    for value in LONG_DATE_PATTERN.findall(answer):
+        try:
+            dates.append(datetime.strptime(value.replace(",", ""), "%B %d %Y").strftime("%Y-%m-%d"))
+        except ValueError:
+            continue
+    dates = _first(date for date in dates if date)
+    if dates:
+        facts.append("dates: " + ", ".join(dates))
+    prices = _first(price.replace(" ", "") for price in PRICE_PATTERN.findall(answer))
+    if prices:
+        facts.append("prices: " + ", ".join(prices))
+    return "; ".join(facts)
+
+def summarize_turn(question: str, answer: str) -> str:
+    """One summary line for a question and its answer, with the turn's ports, dates and prices."""
+    line = f"- User asked: {_snippet(question)} Answer: {_snippet(answer)}"
+    facts = turn_facts(question, answer)
+    return f"{line} [{facts}]" if facts else line
+
+def compact_history(messages: List[Tuple[str, str]], summary: List[str], max_messages: int, max_tokens: int,
+                    summary_token_budget: int) -> int:
+    """
+    Fold the oldest turns of a history into its summary until the recent
+    messages fit the budgets, then drop the oldest summary lines over the
+    summary budget. Both lists are changed in place.
+
+    Returns:
+        int: Number of turns folded into the summary
+    """
+    tokens = sum(estimate_tokens(content) for _, content in messages)
+    folded = 0
+    while len(messages) > 2 and (len(messages) > max_messages or tokens > max_tokens):
+        (_, question), (_, answer) = messages[:2]
+        del messages[:2]
+        tokens -= estimate_tokens(question) + estimate_tokens(answer)
+        summary.append(summarize_turn(question, answer))
+        folded += 1
+    # The summary rolls too: its oldest lines go first
+    summary_tokens = sum(estimate_tokens(line) for line in summary)
+    while len(summary) > 1 and summary_tokens > summary_token_budget:
+        summary_tokens -= estimate_tokens(summary.pop(0))
+    return folded
+
+class Session:
+    """The recent messages and the summary of the older turns of one conversation."""
+
+    __slots__ = ('messages', 'summary', 'tokens', 'summary_tokens', 'last_used', 'turns')
+
+    def __init__(self):
+        self.messages = []  # (role, content), oldest first
+        self.summary = []  # summary lines, oldest first
+        self.tokens = 0
+        self.summary_tokens = 0
+        self.last_used = time.monotonic()
+        self.turns = 0
+
+    def footprint(self) -> int:
+        """Characters held by the session."""
+        return sum(len(content) for _, content in self.messages) + sum(len(line) for line in self.summary)
+
+class SessionStore:
+    """
+    Thread-safe LRU/TTL store of chat sessions with per-session budgets.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS, ttl_seconds: float = SESSION_TTL_SECONDS,
+                 max_messages: int = MAX_CONVERSATION_HISTORY, max_tokens: int = SESSION_TOKEN_BUDGET,
+                 summary_tokens: int = SUMMARY_TOKEN_BUDGET):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max(max_messages, 2)
+        self.max_tokens = max_tokens
+        self.summary_token_budget = summary_tokens
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.summarized_turns = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self, now: float):
+        """Drop the sessions idle for longer than the TTL; the oldest are first."""
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.ttl_seconds:
+                break
+            del self._sessions[session_id]
+            self.expirations += 1
+
+    def _get(self, session_id: str, create: bool) -> Optional[Session]:
+        now = time.monotonic()
+        self._expire(now)
+        session = self._sessions.get(session_id)
+        if session is None:
+            if not create:
+                return None
+            session = self._sessions[session_id] = Session()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        session.last_used = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def history(self, session_id: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        The history to send with the next message of a session.
+
+        Returns:
+            tuple: (summary of the older turns or None, recent (role, content) messages)
+        """
+        with self._lock:
+            session = self._get(session_id, create=False)
+            if session is None:
+                return None, []
+            return ("\n".join(session.summary) or None), list(session.messages)
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Record a question and its answer, summarizing the oldest turns over the budgets."""
+        with self._lock:
+            session = self._get(session_id, create=True)
+            session.messages.extend((("human", question), ("ai", answer)))
+            session.tokens += estimate_tokens(question) + estimate_tokens(answer)
+            session.turns += 1
+            self._compact(session)
+
+    def _compact(self, session: Session):
+        """Fold the oldest turns into the summary until the recent messages fit."""
+        self.summarized_turns += compact_history(session.messages, session.summary, self.max_messages,
+                                                 self.max_tokens, self.summary_token_budget)
+        session.tokens = sum(estimate_tokens(content) for _, content in session.messages)
+        session.summary_tokens = sum(estimate_tokens(line) for line in session.summary)
+
+    def clear(self, session_id: str):
+        """Forget a session."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counts and memory footprint."""
+        with self._lock:
+            self._expire(time.monotonic())
+            sessions = list(self._sessions.values())
+            return {
+                "backend": "memory",
+                "sessions": len(sessions),
+                "max_sessions": self.max_sessions,
+                "messages": sum(len(session.messages) for session in sessions),
+                "summary_lines": sum(len(session.summary) for session in sessions),
+                "estimated_tokens": sum(session.tokens + session.summary_tokens for session in sessions),
+                "content_chars": sum(session.footprint() for session in sessions),
+                "turns": sum(session.turns for session in sessions),
+                "summarized_turns": self.summarized_turns,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+# Seconds a writer waits for another process to release the database
+CONVERSATIONS_BUSY_TIMEOUT = 30
+
+CONVERSATIONS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL DEFAULT '',
+    tokens INTEGER NOT NULL DEFAULT 0,
+    summary_tokens INTEGER NOT NULL DEFAULT 0,
+    turns INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_last_used ON conversations(last_used);
+CREATE TABLE IF NOT EXISTS conversation_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS conversation_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+class SQLiteSessionStore:
+    """
+    Chat sessions shared by every process that opens the same SQLite file.
+
+    The database runs in WAL mode, so readers never block the writer, and each
+    append is one BEGIN IMMEDIATE transaction that reads the session, adds the
+    turn, compacts it and applies the TTL and session cap; concurrent workers
+    appending to one conversation are serialized by SQLite instead of losing
+    turns. Each thread uses its own connection. Times are wall-clock, as they
+    are compared across processes.
+    """
+
+    def __init__(self, db_path: str = CONVERSATIONS_DB_PATH, max_sessions: int = MAX_SESSIONS,
+                 ttl_seconds: float = SESSION_TTL_SECONDS, max_messages: int = MAX_CONVERSATION_HISTORY,
+                 max_tokens: int = SESSION_TOKEN_BUDGET, summary_tokens: int = SUMMARY_TOKEN_BUDGET):
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max(max_messages, 2)
+        self.max_tokens = max_tokens
+        self.summary_token_budget = summary_tokens
+        self._local = threading.local()
+        self._connection().executescript(CONVERSATIONS_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """The connection of the calling thread, opened on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; transactions are opened explicitly in _transaction
+            conn = sqlite3.connect(self.db_path, timeout=CONVERSATIONS_BUSY_TIMEOUT, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        """Run a write transaction on the thread's connection, taking the write lock up front."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _bump(self, conn, name: str, amount: int):
+        if amount:
+            conn.execute("INSERT INTO conversation_counters (name, value) VALUES (?, ?) "
+                         "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value", (name, amount))
+
+    def _delete(self, conn, where: str, params: tuple) -> int:
+        """Delete the sessions selected by a WHERE clause on conversations, with their messages."""
+        conn.execute(f"DELETE FROM conversation_messages WHERE session_id IN "
+                     f"(SELECT session_id FROM conversations WHERE {where})", params)
+        return conn.execute(f"DELETE FROM conversations WHERE {where}", params).rowcount
+
+    def _expire(self, conn, now: float):
+        """Drop the sessions idle for longer than the TTL."""
+        self._bump(conn, "expirations", self._delete(conn, "last_used <= ?", (now - self.ttl_seconds,)))
+
+    def history(self, session_id: str) -> Tuple[Optional[str], List[Tuple[str, str]]]:
+        """
+        The history to send with the next message of a session.
+
+        Returns:
+            tuple: (summary of the older turns or None, recent (role, content) messages)
+        """
+        try:
+            conn = self._connection()
+            # One read transaction, so the summary and messages are from the same append
+            conn.execute("BEGIN")
+            try:
+                row = conn.execute("SELECT summary FROM conversations WHERE session_id = ? AND last_used > ?",
+                                   (session_id, time.time() - self.ttl_seconds)).fetchone()
+                if row is None:
+                    return None, []
+                messages = conn.execute("SELECT role, content FROM conversation_messages WHERE session_id = ? "
+                                        "ORDER BY seq", (session_id,)).fetchall()
+            finally:
+                conn.execute("COMMIT")
+            return (row[0] or None), [(role, content) for role, content in messages]
+        except sqlite3.Error as e:
+            logger.error(f"Error reading conversation {session_id}: {str(e)}")
+            return None, []
+
+    def append(self, session_id: str, question: str, answer: str):
+        """Record a question and its answer, summarizing the oldest turns over the budgets."""
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                self._expire(conn, now)
+                row = conn.execute("SELECT summary, turns FROM conversations WHERE session_id = ?",
+                                   (session_id,)).fetchone()
+                if row is None:
+                    conn.execute("INSERT INTO conversations (session_id, created_at, last_used) VALUES (?, ?, ?)",
+                                 (session_id, now, now))
+                    summary, turns = [], 0
+                else:
+                    summary, turns = (row[0].split("\n") if row[0] else []), row[1]
+                rows = conn.execute("SELECT seq, role, content FROM conversation_messages WHERE session_id = ? "
+                                    "ORDER BY seq", (session_id,)).fetchall()
+                next_seq = rows[-1][0] + 1 if rows else 0
+                messages = [(role, content) for _, role, content in rows]
+                messages.extend((("human", question), ("ai", answer)))
+
+                folded = compact_history(messages, summary, self.max_messages, self.max_tokens,
+                                         self.summary_token_budget)
+                # Folded turns are always the oldest, so the kept messages are the tail
+                kept_from = next_seq + 2 - len(messages)
+                conn.execute("DELETE FROM conversation_messages WHERE session_id = ? AND seq < ?",
+                             (session_id, kept_from))
+                conn.executemany("INSERT INTO conversation_messages (session_id, seq, role, content) "
+                                 "VALUES (?, ?, ?, ?)",
+                                 [(session_id, kept_from + i, role, content)
+                                  for i, (role, content) in enumerate(messages) if kept_from + i >= next_seq])
+                conn.execute("UPDATE conversations SET summary = ?, tokens = ?, summary_tokens = ?, turns = ?, "
+                             "last_used = ? WHERE session_id = ?",
+                             ("\n".join(summary), sum(estimate_tokens(content) for _, content in messages),
+                              sum(estimate_tokens(line) for line in summary), turns + 1, now, session_id))
+                self._bump(conn, "summarized_turns", folded)
+
+                excess = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] - self.max_sessions
+                if excess > 0:
+                    evicted = self._delete(conn, "session_id IN (SELECT session_id FROM conversations "
+                                                 "ORDER BY last_used LIMIT ?)", (excess,))
+                    self._bump(conn, "evictions", evicted)
+        except sqlite3.Error as e:
+            logger.error(f"Error saving conversation {session_id}: {str(e)}")
+
+    def clear(self, session_id: str):
+        """Forget a session."""
+        try:
+            with self._transaction() as conn:
+                self._delete(conn, "session_id = ?", (session_id,))
+        except sqlite3.Error as e:
+            logger.error(f"Error clearing conversation {session_id}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Session counts and storage footprint, over all processes sharing the database."""
+        try:
+            with self._transaction() as conn:
+                self._expire(conn, time.time())
+                sessions, tokens, turns, summary_chars = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(tokens + summary_tokens), 0), COALESCE(SUM(turns), 0), "
+                    "COALESCE(SUM(LENGTH(REPLACE(summary, char(10), ''))), 0) FROM conversations").fetchone()
+                summary_lines = conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(summary) - LENGTH(REPLACE(summary, char(10), '')) + 1), 0) "
+                    "FROM conversations WHERE summary != ''").fetchone()[0]
+                messages, message_chars = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(content)), 0) FROM conversation_messages").fetchone()
+                counters = dict(conn.execute("SELECT name, value FROM conversation_counters").fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Error reading conversation stats: {str(e)}")
+            return {"backend": "sqlite", "error": str(e)}
+        return {
+            "backend": "sqlite",
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "messages": messages,
+            "summary_lines": summary_lines,
+            "estimated_tokens": tokens,
+            "content_chars": message_chars + summary_chars,
+            "turns": turns,
+            "summarized_turns": counters.get("summarized_turns", 0),
+            "evictions": counters.get("evictions", 0),
+            "expirations": counters.get("expirations", 0)
+        }
+
+# Conversation backends by CONVERSATION_BACKEND name
+BACKENDS = {
+    "memory": SessionStore,
+    "sqlite": SQLiteSessionStore,
+}
+
+def create_session_store(backend: str = CONVERSATION_BACKEND):
+    """
+    Create the conversation store configured by CONVERSATION_BACKEND, falling
+    back to the in-memory store when the backend is unknown or can't be opened.
+    """
+    store_class = BACKENDS.get(backend)
+    if store_class is None:
+        logger.warning(f"Unknown conversation backend '{backend}', keeping conversations in memory")
+        return SessionStore()
+    try:
+        return store_class()
+    except Exception as e:
+        logger.error(f"Error opening the {backend} conversation store, keeping conversations in memory: {str(e)}")
+        return SessionStore()
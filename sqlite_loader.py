@@ -4,10 +4,17 @@ Script to load ferry data from JSON file into a SQLite database.
 
 import sqlite3
 import json
+import hashlib
 import os
 import logging
+import time
 from datetime import datetime
 
+from db import invalidate_pool
+from gtfs_stream import FEED_ERRORS, FeedStats, FeedFormatError, iter_routes
+from port_search import create_port_search, has_port_search, rebuild_port_search
+from service_calendar import ServiceCalendar, day_number
+
 # Configure logging
 logging.basicConfig(level=logging.INFO,
                    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -44,37 +51,518 @@ def create_tables(cursor):
         )
     ''')
 
+    # Vessels and accommodation types arrive as "CODE___NAME" strings. Each distinct
+    # string is stored once and the timetable tables refer to it by integer ID.
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS dates_and_vessels (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
+        CREATE TABLE IF NOT EXISTS vessels (
+            vessel_id INTEGER PRIMARY KEY,
+            vessel TEXT UNIQUE NOT NULL,
+            vessel_code TEXT,
+            vessel_name TEXT
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accommodation_types (
+            accommodation_id INTEGER PRIMARY KEY,
+            accommodation_type TEXT UNIQUE NOT NULL,
+            accommodation_code TEXT,
+            accommodation_name TEXT
+        )
+    ''')
+
+    # The operating dates of each route and vessel as a service calendar: a start
+    # and end date and a bitset with one bit per day (see service_calendar.py).
+    # weekday_mask is the regular weekday pattern and day_count the number of
+    # operating days.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_calendars (
             route_id INTEGER,
-            schedule_date TEXT,
-            vessel TEXT,
-            FOREIGN KEY (route_id) REFERENCES routes(route_id)
+            vessel_id INTEGER,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            weekday_mask INTEGER NOT NULL,
+            day_count INTEGER NOT NULL,
+            days BLOB NOT NULL,
+            PRIMARY KEY (route_id, vessel_id),
+            FOREIGN KEY (route_id) REFERENCES routes(route_id),
+            FOREIGN KEY (vessel_id) REFERENCES vessels(vessel_id)
         )
     ''')
 
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vessels_and_indicative_prices (
+        CREATE TABLE IF NOT EXISTS route_vessel_prices (
             route_id INTEGER,
-            vessel TEXT,
+            vessel_id INTEGER,
             indicative_price INTEGER,
-            PRIMARY KEY (route_id, vessel),
-            FOREIGN KEY (route_id) REFERENCES routes(route_id)
+            PRIMARY KEY (route_id, vessel_id),
+            FOREIGN KEY (route_id) REFERENCES routes(route_id),
+            FOREIGN KEY (vessel_id) REFERENCES vessels(vessel_id)
         )
     ''')
 
     cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vessels_and_accommodation_prices (
+        CREATE TABLE IF NOT EXISTS route_accommodation_prices (
             route_id INTEGER,
-            vessel TEXT,
-            accommodation_type TEXT,
+            vessel_id INTEGER,
+            accommodation_id INTEGER,
             price INTEGER,
-            PRIMARY KEY (route_id, vessel, accommodation_type),
+            PRIMARY KEY (route_id, vessel_id, accommodation_id),
+            FOREIGN KEY (route_id) REFERENCES routes(route_id),
+            FOREIGN KEY (vessel_id) REFERENCES vessels(vessel_id),
+            FOREIGN KEY (accommodation_id) REFERENCES accommodation_types(accommodation_id)
+        )
+    ''')
+
+    # One row per dated sailing with everything a route search returns, clustered
+    # so that all sailings of a port pair on a date are adjacent in the b-tree.
+    # Derived from the tables above by rebuild_departures(). date_id identifies
+    # the sailing by route and day (see calendar_date_id()).
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS departures (
+            origin_port_code TEXT NOT NULL,
+            destination_port_code TEXT NOT NULL,
+            schedule_date TEXT NOT NULL,
+            departure_minute INTEGER NOT NULL,
+            date_id INTEGER NOT NULL,
+            route_id INTEGER,
+            origin_port_name TEXT,
+            destination_port_name TEXT,
+            departure_time TEXT,
+            arrival_time TEXT,
+            arrival_minute INTEGER,
+            duration INTEGER,
+            company TEXT,
+            company_code TEXT,
+            vessel_id INTEGER,
+            vessel_name TEXT,
+            indicative_price INTEGER,
+            min_accommodation_price INTEGER,
+            max_accommodation_price INTEGER,
+            PRIMARY KEY (origin_port_code, destination_port_code, schedule_date, departure_minute, date_id)
+        ) WITHOUT ROWID
+    ''')
+
+    # Per port pair and date: the sailing count, cheapest fares and first and last
+    # departure, for month-level answers. Derived from departures by
+    # rebuild_fare_calendar().
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fare_calendar (
+            origin_port_code TEXT NOT NULL,
+            destination_port_code TEXT NOT NULL,
+            schedule_date TEXT NOT NULL,
+            sailings INTEGER NOT NULL,
+            min_indicative_price INTEGER,
+            min_accommodation_price INTEGER,
+            earliest_departure TEXT,
+            latest_departure TEXT,
+            PRIMARY KEY (origin_port_code, destination_port_code, schedule_date)
+        ) WITHOUT ROWID
+    ''')
+
+    # Every port served by a route, for port lookups. Derived from routes by
+    # rebuild_ports().
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ports (
+            code TEXT NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (code, name)
+        ) WITHOUT ROWID
+    ''')
+
+    # Trigram index over port names, codes and aliases for fuzzy lookups
+    create_port_search(cursor)
+
+    # Fingerprint of every feed item as it was last loaded, used to diff updates
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS route_fingerprints (
+            natural_key TEXT PRIMARY KEY,
+            route_id INTEGER,
+            content_hash TEXT,
             FOREIGN KEY (route_id) REFERENCES routes(route_id)
         )
     ''')
 
+    create_views(cursor)
+
+# Views that keep the table and column names documented in the system prompt, so
+# SQL written against the original flat schema keeps working. The dated sailings
+# are read from departures, which is indexed by route and by date.
+VIEW_DEFINITIONS = {
+    'dates_and_vessels': '''
+        SELECT d.date_id AS id, d.route_id, d.schedule_date, v.vessel
+        FROM departures d
+        LEFT JOIN vessels v ON v.vessel_id = d.vessel_id
+    ''',
+    'vessels_and_indicative_prices': '''
+        SELECT p.route_id, v.vessel, p.indicative_price
+        FROM route_vessel_prices p
+        LEFT JOIN vessels v ON v.vessel_id = p.vessel_id
+    ''',
+    'vessels_and_accommodation_prices': '''
+        SELECT p.route_id, v.vessel, a.accommodation_type, p.price
+        FROM route_accommodation_prices p
+        LEFT JOIN vessels v ON v.vessel_id = p.vessel_id
+        LEFT JOIN accommodation_types a ON a.accommodation_id = p.accommodation_id
+    '''
+}
+
+def create_views(cursor):
+    """
+    Create the compatibility views over the normalized tables if they do not already exist.
+    """
+    for name, definition in VIEW_DEFINITIONS.items():
+        cursor.execute(f"CREATE VIEW IF NOT EXISTS {name} AS {definition}")
+
+# Secondary indexes on the timetable. They are created after the bulk load so the
+# inserts don't have to maintain them row by row. The LOWER(...) expression indexes
+# back the case-insensitive predicates the system prompt tells the LLM to use.
+INDEX_DEFINITIONS = [
+    ("idx_routes_origin_destination", "routes (origin_port_code, destination_port_code)"),
+    ("idx_routes_lower_origin_name", "routes (LOWER(origin_port_name))"),
+    ("idx_routes_lower_destination_name", "routes (LOWER(destination_port_name))"),
+    ("idx_routes_lower_origin_code", "routes (LOWER(origin_port_code))"),
+    ("idx_routes_lower_destination_code", "routes (LOWER(destination_port_code))"),
+    ("idx_routes_lower_company", "routes (LOWER(company))"),
+    ("idx_departures_route", "departures (route_id)"),
+    ("idx_departures_date", "departures (schedule_date)"),
+]
+
+def create_indexes(cursor):
+    """
+    Create the secondary indexes on the timetable tables if they do not already exist.
+    """
+    for name, definition in INDEX_DEFINITIONS:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+def _minutes_sql(column):
+    """SQL expression converting an "HH:MM" column to minutes after midnight."""
+    return (f"(CAST(substr({column}, 1, instr({column}, ':') - 1) AS INTEGER) * 60 + "
+            f"CAST(substr({column}, instr({column}, ':') + 1) AS INTEGER))")
+
+DEPARTURES_SELECT = f'''
+    SELECT
+        COALESCE(r.origin_port_code, ''),
+        COALESCE(r.destination_port_code, ''),
+        rd.schedule_date,
+        COALESCE({_minutes_sql('r.departure_time')}, -1),
+        rd.id,
+        r.route_id,
+        r.origin_port_name,
+        r.destination_port_name,
+        r.departure_time,
+        r.arrival_time,
+        {_minutes_sql('r.departure_time')} + r.duration,
+        r.duration,
+        r.company,
+        r.company_code,
+        rd.vessel_id,
+        v.vessel_name,
+        vp.indicative_price,
+        (SELECT MIN(p.price) FROM route_accommodation_prices p
+         WHERE p.route_id = rd.route_id AND p.vessel_id = rd.vessel_id AND p.price > 0),
+        (SELECT MAX(p.price) FROM route_accommodation_prices p
+         WHERE p.route_id = rd.route_id AND p.vessel_id = rd.vessel_id AND p.price > 0)
+    FROM temp.calendar_dates rd
+    JOIN routes r ON r.route_id = rd.route_id
+    LEFT JOIN vessels v ON v.vessel_id = rd.vessel_id
+    LEFT JOIN route_vessel_prices vp ON vp.route_id = rd.route_id AND vp.vessel_id = rd.vessel_id
+'''
+
+# Date IDs are route_id * DATE_ID_STRIDE + the day number of the date, so they
+# stay unique when only some routes are rebuilt
+DATE_ID_STRIDE = 100000
+
+def calendar_date_id(route_id, schedule_date):
+    """Return the date ID of a route's sailing on a date."""
+    return route_id * DATE_ID_STRIDE + day_number(schedule_date)
+
+def expand_calendars(cursor, scoped=False):
+    """
+    Expand service calendars into temp.calendar_dates, one row per dated sailing.
+    
+    Args:
+        cursor: Cursor on the database being loaded
+        scoped: Only expand the routes in temp.changed_routes
+    
+    Returns:
+        int: Number of dated sailings
+    """
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS calendar_dates (
+            id INTEGER PRIMARY KEY, route_id INTEGER, schedule_date TEXT, vessel_id INTEGER
+        )
+    """)
+    cursor.execute("DELETE FROM temp.calendar_dates")
+    
+    query = "SELECT route_id, vessel_id, start_date, end_date, days FROM service_calendars"
+    if scoped:
+        query += " WHERE route_id IN (SELECT route_id FROM temp.changed_routes)"
+    cursor.execute(query)
+    
+    rows = []
+    for route_id, vessel_id, start_date, end_date, days in cursor.fetchall():
+        for schedule_date in ServiceCalendar.from_row(start_date, end_date, days).dates():
+            rows.append((calendar_date_id(route_id, schedule_date), route_id, schedule_date, vessel_id))
+    cursor.executemany("INSERT INTO temp.calendar_dates (id, route_id, schedule_date, vessel_id) "
+                       "VALUES (?, ?, ?, ?)", rows)
+    return len(rows)
+
+def rebuild_departures(cursor, route_ids=None):
+    """
+    Rebuild the departures table from the normalized timetable tables, the
+    fare calendar rows of the port pairs it touched and the port list.
+    
+    Args:
+        cursor: Cursor on the database being loaded
+        route_ids: Optional iterable of route IDs to rebuild; all routes when None
+    
+    Returns:
+        int: Number of departure rows written
+    """
+    if route_ids is None:
+        expand_calendars(cursor)
+        cursor.execute("DELETE FROM departures")
+        cursor.execute(f"INSERT INTO departures {DEPARTURES_SELECT}")
+        written = cursor.rowcount
+        rebuild_fare_calendar(cursor)
+        rebuild_ports(cursor)
+        return written
+    
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS changed_routes (route_id INTEGER PRIMARY KEY)")
+    cursor.execute("DELETE FROM temp.changed_routes")
+    cursor.executemany("INSERT OR IGNORE INTO temp.changed_routes (route_id) VALUES (?)",
+                       [(route_id,) for route_id in route_ids])
+    
+    # Port pairs of the routes before and after the change
+    cursor.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS changed_pairs (
+            origin_port_code TEXT, destination_port_code TEXT,
+            PRIMARY KEY (origin_port_code, destination_port_code)
+        )
+    """)
+    cursor.execute("DELETE FROM temp.changed_pairs")
+    record_pairs = ("INSERT OR IGNORE INTO temp.changed_pairs "
+                    "SELECT DISTINCT origin_port_code, destination_port_code FROM departures "
+                    "WHERE route_id IN (SELECT route_id FROM temp.changed_routes)")
+    cursor.execute(record_pairs)
+    
+    expand_calendars(cursor, scoped=True)
+    cursor.execute("DELETE FROM departures WHERE route_id IN (SELECT route_id FROM temp.changed_routes)")
+    cursor.execute(f"INSERT INTO departures {DEPARTURES_SELECT}")
+    written = cursor.rowcount
+    
+    cursor.execute(record_pairs)
+    rebuild_fare_calendar(cursor, scoped=True)
+    rebuild_ports(cursor)
+    return written
+
+FARE_CALENDAR_SELECT = """
+SELECT
+    origin_port_code,
+    destination_port_code,
+    schedule_date,
+    COUNT(*),
+    MIN(CASE WHEN indicative_price > 0 THEN indicative_price END),
+    MIN(CASE WHEN min_accommodation_price > 0 THEN min_accommodation_price END),
+    CASE WHEN MAX(departure_minute) >= 0 THEN printf('%02d:%02d', MIN(NULLIF(departure_minute, -1)) / 60,
+                                                     MIN(NULLIF(departure_minute, -1)) % 60) END,
+    CASE WHEN MAX(departure_minute) >= 0 THEN printf('%02d:%02d', MAX(departure_minute) / 60,
+                                                     MAX(departure_minute) % 60) END
+FROM departures
+"""
+
+def rebuild_fare_calendar(cursor, scoped=False):
+    """
+    Rebuild the fare calendar from the departures table.
+    
+    Args:
+        cursor: Cursor on the database being loaded
+        scoped: Only rebuild the port pairs in temp.changed_pairs, as recorded
+            by a scoped rebuild_departures()
+    
+    Returns:
+        int: Number of fare calendar rows written
+    """
+    group_by = " GROUP BY origin_port_code, destination_port_code, schedule_date"
+    if not scoped:
+        cursor.execute("DELETE FROM fare_calendar")
+        cursor.execute(f"INSERT INTO fare_calendar {FARE_CALENDAR_SELECT}{group_by}")
+        return cursor.rowcount
+    
+    in_changed_pairs = ("(origin_port_code, destination_port_code) IN "
+                        "(SELECT origin_port_code, destination_port_code FROM temp.changed_pairs)")
+    cursor.execute(f"DELETE FROM fare_calendar WHERE {in_changed_pairs}")
+    cursor.execute(f"INSERT INTO fare_calendar {FARE_CALENDAR_SELECT} WHERE {in_changed_pairs}{group_by}")
+    return cursor.rowcount
+
+PORTS_SELECT = """
+SELECT origin_port_code, origin_port_name FROM routes
+WHERE origin_port_code IS NOT NULL AND origin_port_name IS NOT NULL
+UNION
+SELECT destination_port_code, destination_port_name FROM routes
+WHERE destination_port_code IS NOT NULL AND destination_port_name IS NOT NULL
+"""
+
+def rebuild_ports(cursor):
+    """
+    Rebuild the ports table from the routes table, and the fuzzy port search
+    index from it. There are few enough ports that a full rebuild is cheaper
+    than working out which ones changed.
+    
+    Returns:
+        int: Number of ports written
+    """
+    cursor.execute("DELETE FROM ports")
+    cursor.execute(f"INSERT INTO ports (code, name) {PORTS_SELECT}")
+    written = cursor.rowcount
+    rebuild_port_search(cursor)
+    return written
+
+def _store_calendars(cursor, dated_rows):
+    """Group (route_id, schedule_date, vessel_id) rows into service_calendars rows and insert them."""
+    schedules = {}
+    for route_id, schedule_date, vessel_id in dated_rows:
+        if schedule_date is not None:
+            schedules.setdefault(route_id, {})[schedule_date] = vessel_id
+    for route_id, schedule in schedules.items():
+        cursor.executemany(INSERT_STATEMENTS['service_calendars'], calendar_rows(route_id, schedule))
+
+def normalize_legacy_tables(cursor):
+    """
+    Convert the tables of older databases to the current schema:
+    
+    - the flat dates_and_vessels / vessels_and_*_prices tables become the
+      dimension and price tables and service calendars, replaced by views;
+    - the one-row-per-date route_dates table becomes service calendars.
+
+    Returns:
+        bool: True if a conversion was needed
+    """
+    converted = False
+
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'dates_and_vessels'")
+    row = cursor.fetchone()
+    if row and row[0] == 'table':
+        dimensions = DimensionCache(cursor)
+        cursor.execute("""
+            SELECT vessel FROM dates_and_vessels
+            UNION SELECT vessel FROM vessels_and_indicative_prices
+            UNION SELECT vessel FROM vessels_and_accommodation_prices
+        """)
+        for (vessel,) in cursor.fetchall():
+            dimensions.vessel_id(vessel)
+        cursor.execute("SELECT DISTINCT accommodation_type FROM vessels_and_accommodation_prices")
+        for (accommodation_type,) in cursor.fetchall():
+            dimensions.accommodation_id(accommodation_type)
+
+        cursor.execute("""
+            SELECT d.route_id, d.schedule_date, v.vessel_id
+            FROM dates_and_vessels d LEFT JOIN vessels v ON v.vessel = d.vessel
+            ORDER BY d.id
+        """)
+        _store_calendars(cursor, cursor.fetchall())
+        cursor.execute("""
+            INSERT INTO route_vessel_prices (route_id, vessel_id, indicative_price)
+            SELECT p.route_id, v.vessel_id, p.indicative_price
+            FROM vessels_and_indicative_prices p LEFT JOIN vessels v ON v.vessel = p.vessel
+        """)
+        cursor.execute("""
+            INSERT INTO route_accommodation_prices (route_id, vessel_id, accommodation_id, price)
+            SELECT p.route_id, v.vessel_id, a.accommodation_id, p.price
+            FROM vessels_and_accommodation_prices p
+            LEFT JOIN vessels v ON v.vessel = p.vessel
+            LEFT JOIN accommodation_types a ON a.accommodation_type = p.accommodation_type
+        """)
+
+        for table in VIEW_DEFINITIONS:
+            cursor.execute(f"DROP TABLE {table}")
+        converted = True
+
+    cursor.execute("SELECT type FROM sqlite_master WHERE name = 'route_dates'")
+    row = cursor.fetchone()
+    if row and row[0] == 'table':
+        cursor.execute("SELECT route_id, schedule_date, vessel_id FROM route_dates ORDER BY id")
+        _store_calendars(cursor, cursor.fetchall())
+        cursor.execute("DROP VIEW IF EXISTS dates_and_vessels")
+        cursor.execute("DROP TABLE route_dates")
+        converted = True
+
+    if converted:
+        create_views(cursor)
+    return converted
+
+def migrate_database(db_path='gtfs.db'):
+    """
+    Bring an existing database up to the current schema: move the vessel and
+    accommodation strings of older databases into dimension tables and their
+    dates into service calendars, add any missing secondary indexes and refresh
+    the query planner statistics.
+
+    Args:
+        db_path (str): Path to the SQLite database
+
+    Returns:
+        list: Names of the indexes that were created
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.cursor()
+        create_tables(cursor)
+
+        normalized = normalize_legacy_tables(cursor)
+        if normalized:
+            logger.info(f"Migrating {db_path}: moved vessels, accommodation types and dates "
+                        f"into dimension tables and service calendars")
+
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+        existing = {row[0] for row in cursor.fetchall()}
+        missing = [name for name, _ in INDEX_DEFINITIONS if name not in existing]
+
+        # Databases from before the departures table need it built once
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM departures)")
+        has_departures = cursor.fetchone()[0]
+        cursor.execute("SELECT EXISTS (SELECT 1 FROM service_calendars)")
+        rebuilt = normalized or (cursor.fetchone()[0] and not has_departures)
+        if rebuilt:
+            logger.info(f"Migrating {db_path}: building departures")
+            rebuild_departures(cursor)
+        else:
+            # Databases from before the fare calendar need it built once
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM fare_calendar)")
+            if has_departures and not cursor.fetchone()[0]:
+                logger.info(f"Migrating {db_path}: building the fare calendar")
+                rebuild_fare_calendar(cursor)
+                rebuilt = True
+
+            # Databases from before the ports table or its search index need them built once
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM ports)")
+            has_ports = cursor.fetchone()[0]
+            if has_port_search(cursor):
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM port_search)")
+                has_ports = has_ports and cursor.fetchone()[0]
+            if not has_ports:
+                logger.info(f"Migrating {db_path}: building the port list")
+                rebuild_ports(cursor)
+
+        if missing:
+            logger.info(f"Migrating {db_path}: creating indexes {', '.join(missing)}")
+            create_indexes(cursor)
+        if missing or rebuilt:
+            cursor.execute("ANALYZE")
+
+        conn.commit()
+        
+        # Older databases were switched to WAL by the readers. Pooled readers now
+        # open the file read-only, which needs the plain rollback journal.
+        cursor.execute("PRAGMA journal_mode")
+        if cursor.fetchone()[0] == 'wal':
+            logger.info(f"Migrating {db_path}: switching journal mode from WAL to DELETE")
+            cursor.execute("PRAGMA journal_mode=DELETE")
+        return missing
+    finally:
+        conn.close()
+
 def clean_text(value, to_upper=True):
     """
     Clean text values by trimming spaces, ensuring it's a string or None, 
@@ -85,19 +573,166 @@ def clean_text(value, to_upper=True):
         return value.upper() if to_upper else value
     return value
 
-def insert_data(cursor, data):
+# Number of buffered rows per table that are flushed with a single executemany
+INSERT_BATCH_SIZE = 5000
+
+# Insert statements used by the bulk loader, keyed by table name, parent table
+# (routes) first: BatchInserter flushes in this order
+INSERT_STATEMENTS = {
+    'routes': '''
+        INSERT INTO routes (
+            route_id, route_number, company, company_code, origin_port_name, origin_port_code, 
+            destination_port_name, destination_port_code, departure_time, arrival_time, 
+            origin_port_stop, destination_port_stop, departure_offset, arrival_offset, duration
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'service_calendars': '''
+        INSERT INTO service_calendars (route_id, vessel_id, start_date, end_date, weekday_mask, day_count, days)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'route_vessel_prices': '''
+        INSERT INTO route_vessel_prices (route_id, vessel_id, indicative_price)
+        VALUES (?, ?, ?)
+    ''',
+    'route_accommodation_prices': '''
+        INSERT INTO route_accommodation_prices (route_id, vessel_id, accommodation_id, price)
+        VALUES (?, ?, ?, ?)
+    ''',
+    'route_fingerprints': '''
+        INSERT INTO route_fingerprints (natural_key, route_id, content_hash)
+        VALUES (?, ?, ?)
+    '''
+}
+
+def split_key(key):
     """
-    Insert data into the database tables from the provided JSON data.
+    Split a "CODE___NAME" vessel or accommodation key into its code and name.
+    Keys without the separator are used as both.
     """
-    for item in data:
-        # Insert into the routes table
-        cursor.execute('''
-            INSERT INTO routes (
-                route_number, company, company_code, origin_port_name, origin_port_code, 
-                destination_port_name, destination_port_code, departure_time, arrival_time, 
-                origin_port_stop, destination_port_stop, departure_offset, arrival_offset, duration
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    parts = key.split("___", 1)
+    if len(parts) == 2:
+        return parts[0], parts[1]
+    return key, key
+
+class DimensionCache:
+    """
+    Maps vessel and accommodation type strings to their integer IDs, adding a
+    dimension row the first time a new string is seen.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        cursor.execute("SELECT vessel, vessel_id FROM vessels")
+        self.vessels = dict(cursor.fetchall())
+        cursor.execute("SELECT accommodation_type, accommodation_id FROM accommodation_types")
+        self.accommodations = dict(cursor.fetchall())
+
+    def vessel_id(self, vessel):
+        """Return the ID of a vessel, inserting it if it is new."""
+        if vessel is None:
+            return None
+        vessel_id = self.vessels.get(vessel)
+        if vessel_id is None:
+            code, name = split_key(vessel)
+            self.cursor.execute("INSERT INTO vessels (vessel, vessel_code, vessel_name) VALUES (?, ?, ?)",
+                                (vessel, code, name))
+            vessel_id = self.vessels[vessel] = self.cursor.lastrowid
+        return vessel_id
+
+    def accommodation_id(self, accommodation_type):
+        """Return the ID of an accommodation type, inserting it if it is new."""
+        if accommodation_type is None:
+            return None
+        accommodation_id = self.accommodations.get(accommodation_type)
+        if accommodation_id is None:
+            code, name = split_key(accommodation_type)
+            self.cursor.execute("INSERT INTO accommodation_types (accommodation_type, accommodation_code, "
+                                "accommodation_name) VALUES (?, ?, ?)", (accommodation_type, code, name))
+            accommodation_id = self.accommodations[accommodation_type] = self.cursor.lastrowid
+        return accommodation_id
+
+def route_natural_key(item):
+    """
+    Build the natural key of a feed item: the itinerary number, operator, ports
+    and stop numbers, which stay the same when only its dates or prices change.
+    """
+    return "|".join(str(part) for part in (
+        clean_text(item.get('route_id')),
+        clean_text(item.get('company_code')),
+        clean_text(item.get('origin_port_code')),
+        clean_text(item.get('destination_port_code')),
+        item.get('origin_port_stop'),
+        item.get('destination_port_stop')
+    ))
+
+class RouteKeyer:
+    """
+    Assigns natural keys to feed items, disambiguating repeated keys within one
+    feed by their order of appearance.
+    """
+
+    def __init__(self):
+        self.seen = {}
+
+    def key(self, item):
+        base = route_natural_key(item)
+        count = self.seen.get(base, 0) + 1
+        self.seen[base] = count
+        return base if count == 1 else f"{base}#{count}"
+
+def route_content_hash(item):
+    """Return a stable hash of everything a feed item contains."""
+    canonical = json.dumps(item, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+def route_schedule(item, dimensions):
+    """Return the operating dates of a feed item as {schedule_date: vessel_id}."""
+    return {
+        clean_text(schedule_date, to_upper=False): dimensions.vessel_id(clean_text(vessel))
+        for schedule_date, vessel in item.get('dates_and_vessels', {}).items()
+    }
+
+def calendar_rows(route_id, schedule):
+    """
+    Group a route's {schedule_date: vessel_id} schedule into one service_calendars
+    row per vessel.
+    """
+    dates_by_vessel = {}
+    for schedule_date, vessel_id in schedule.items():
+        dates_by_vessel.setdefault(vessel_id, []).append(schedule_date)
+    
+    rows = []
+    for vessel_id, dates in dates_by_vessel.items():
+        calendar = ServiceCalendar.from_dates(dates)
+        rows.append((route_id, vessel_id, calendar.start.strftime("%Y-%m-%d"), calendar.end.strftime("%Y-%m-%d"),
+                     calendar.weekday_mask(), len(calendar), calendar.to_blob()))
+    return rows
+
+def calendar_schedule(rows):
+    """Expand (vessel_id, start_date, end_date, days) calendar rows into {schedule_date: vessel_id}."""
+    schedule = {}
+    for vessel_id, start_date, end_date, days in rows:
+        for schedule_date in ServiceCalendar.from_row(start_date, end_date, days).dates():
+            schedule[schedule_date] = vessel_id
+    return schedule
+
+def build_route_rows(item, route_db_id, dimensions):
+    """
+    Convert one feed item into the rows it produces in each timetable table.
+    
+    Args:
+        item: Route item from the feed
+        route_db_id: Database ID assigned to the route
+        dimensions: DimensionCache resolving vessel and accommodation type IDs
+    
+    Returns:
+        dict: Table name -> list of row tuples
+    """
+    vessel_id = dimensions.vessel_id
+    accommodation_id = dimensions.accommodation_id
+    return {
+        'routes': [(
+            route_db_id,
             clean_text(item.get('route_id')),  # Route number
             clean_text(item.get('company')),  # Company name
             clean_text(item.get('company_code')),  # Company code
@@ -112,86 +747,257 @@ def insert_data(cursor, data):
             item.get('departure_offset'),
             item.get('arrival_offset'),
             item.get('duration')
-        ))
-
-        # Get the auto-generated ID for this route
-        route_db_id = cursor.lastrowid
-
-        # Insert into the dates_and_vessels table
-        for schedule_date, vessel in item.get('dates_and_vessels', {}).items():
-            cursor.execute('''
-                INSERT INTO dates_and_vessels (route_id, schedule_date, vessel)
-                VALUES (?, ?, ?)
-            ''', (route_db_id, clean_text(schedule_date, to_upper=False), clean_text(vessel)))
-
-        # Insert into the vessels_and_indicative_prices table
-        for vessel, indicative_price in item.get('vessels_and_indicative_prices', {}).items():
-            cursor.execute('''
-                INSERT INTO vessels_and_indicative_prices (route_id, vessel, indicative_price)
-                VALUES (?, ?, ?)
-            ''', (route_db_id, clean_text(vessel), indicative_price))
-
-        # Insert into the vessels_and_accommodation_prices table
-        for vessel, accommodations in item.get('vessels_and_accommodation_prices', {}).items():
-            for accommodation_type, price in accommodations.items():
-                cursor.execute('''
-                    INSERT INTO vessels_and_accommodation_prices (route_id, vessel, accommodation_type, price)
-                    VALUES (?, ?, ?, ?)
-                ''', (route_db_id, clean_text(vessel), clean_text(accommodation_type), price))
-
-def load_data(json_path='./attached_assets/GTFS_data_v5.json', db_path='gtfs.db'):
+        )],
+        'service_calendars': calendar_rows(route_db_id, route_schedule(item, dimensions)),
+        'route_vessel_prices': [
+            (route_db_id, vessel_id(clean_text(vessel)), indicative_price)
+            for vessel, indicative_price in item.get('vessels_and_indicative_prices', {}).items()
+        ],
+        'route_accommodation_prices': [
+            (route_db_id, vessel_id(clean_text(vessel)), accommodation_id(clean_text(accommodation_type)), price)
+            for vessel, accommodations in item.get('vessels_and_accommodation_prices', {}).items()
+            for accommodation_type, price in accommodations.items()
+        ]
+    }
+
+class BatchInserter:
+    """
+    Buffers rows per table and flushes them with executemany in fixed-size chunks,
+    keeping per-table row counts and insert timings for throughput reporting.
+    """
+
+    def __init__(self, cursor, batch_size=INSERT_BATCH_SIZE):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.buffers = {table: [] for table in INSERT_STATEMENTS}
+        self.row_counts = {table: 0 for table in INSERT_STATEMENTS}
+        self.seconds = {table: 0.0 for table in INSERT_STATEMENTS}
+
+    def add(self, table, row):
+        """Queue a row for insertion, flushing the table's buffer when it is full."""
+        buffer = self.buffers[table]
+        buffer.append(row)
+        if len(buffer) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table=None):
+        """
+        Write out the buffered rows for one table, or for all tables. Tables are
+        flushed in INSERT_STATEMENTS order, and a child table's flush writes the
+        buffered routes first, so child rows never precede their route.
+        """
+        tables = list(INSERT_STATEMENTS) if table is None else (['routes', table] if table != 'routes' else [table])
+        for name in tables:
+            buffer = self.buffers[name]
+            if not buffer:
+                continue
+            started = time.perf_counter()
+            self.cursor.executemany(INSERT_STATEMENTS[name], buffer)
+            self.seconds[name] += time.perf_counter() - started
+            self.row_counts[name] += len(buffer)
+            buffer.clear()
+
+    def report(self):
+        """Return rows, seconds and rows/sec for every table."""
+        stats = {}
+        for table in INSERT_STATEMENTS:
+            seconds = self.seconds[table]
+            rows = self.row_counts[table]
+            stats[table] = {
+                'rows': rows,
+                'seconds': round(seconds, 3),
+                'rows_per_sec': int(rows / seconds) if seconds > 0 else rows
+            }
+        return stats
+
+def insert_data(cursor, data, batch_size=INSERT_BATCH_SIZE):
+    """
+    Insert data into the database tables from the provided JSON data.
+    
+    Route IDs are assigned up front so the child rows can be buffered alongside
+    their route and all tables are written with batched executemany calls.
+    
+    Returns:
+        dict: Per-table row counts, insert time and rows/sec
+    """
+    cursor.execute("SELECT COALESCE(MAX(route_id), 0) FROM routes")
+    next_route_id = cursor.fetchone()[0] + 1
+    
+    inserter = BatchInserter(cursor, batch_size)
+    dimensions = DimensionCache(cursor)
+    keyer = RouteKeyer()
+    
+    for item in data:
+        route_db_id = next_route_id
+        next_route_id += 1
+        
+        for table, rows in build_route_rows(item, route_db_id, dimensions).items():
+            for row in rows:
+                inserter.add(table, row)
+        
+        # Remember what was loaded so the next update can be applied as a diff
+        inserter.add('route_fingerprints', (keyer.key(item), route_db_id, route_content_hash(item)))
+
+    inserter.flush()
+    
+    stats = inserter.report()
+    for table, table_stats in stats.items():
+        logger.info(f"Inserted {table_stats['rows']} rows into {table} in "
+                    f"{table_stats['seconds']}s ({table_stats['rows_per_sec']} rows/sec)")
+    return stats
+
+# Suffix of the side file a reload is built in before it is swapped into place
+SHADOW_SUFFIX = '.next'
+
+def remove_database_files(db_path):
+    """
+    Remove a database file together with any journal files SQLite left next to it.
+    """
+    for path in (db_path, db_path + '-journal', db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+
+def validate_row_counts(cursor, feed_stats):
+    """
+    Check that a freshly built database holds exactly what the feed contained.
+    
+    Args:
+        cursor: Cursor on the newly built database
+        feed_stats: FeedStats collected while the feed was loaded
+    
+    Returns:
+        dict: Row counts per table
+    
+    Raises:
+        ValueError: If the database is empty or doesn't match the feed
+    """
+    counts = {}
+    for table in INSERT_STATEMENTS:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cursor.fetchone()[0]
+    
+    if counts['routes'] == 0:
+        raise ValueError("Refusing to swap in a database with no routes")
+    if counts['routes'] != feed_stats.routes:
+        raise ValueError(f"Route count mismatch: feed has {feed_stats.routes}, database has {counts['routes']}")
+    
+    cursor.execute("SELECT COALESCE(SUM(day_count), 0) FROM service_calendars")
+    counts['scheduled_sailings'] = cursor.fetchone()[0]
+    if counts['scheduled_sailings'] != feed_stats.scheduled_sailings:
+        raise ValueError(f"Schedule count mismatch: feed has {feed_stats.scheduled_sailings}, "
+                         f"database has {counts['scheduled_sailings']}")
+    
+    cursor.execute("SELECT COUNT(*) FROM departures")
+    counts['departures'] = cursor.fetchone()[0]
+    if counts['departures'] != counts['scheduled_sailings']:
+        raise ValueError(f"Departures count mismatch: {counts['scheduled_sailings']} scheduled sailings, "
+                         f"{counts['departures']} departures")
+    
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(sailings), 0) FROM fare_calendar")
+    counts['fare_calendar'], calendar_sailings = cursor.fetchone()
+    if calendar_sailings != counts['departures']:
+        raise ValueError(f"Fare calendar mismatch: {counts['departures']} departures, "
+                         f"{calendar_sailings} sailings in the fare calendar")
+    
+    cursor.execute("SELECT COUNT(*) FROM ports")
+    counts['ports'] = cursor.fetchone()[0]
+    cursor.execute(f"SELECT COUNT(*) FROM ({PORTS_SELECT})")
+    expected_ports = cursor.fetchone()[0]
+    if counts['ports'] != expected_ports:
+        raise ValueError(f"Port count mismatch: routes serve {expected_ports} ports, "
+                         f"the ports table has {counts['ports']}")
+    return counts
+
+def swap_database(build_path, db_path):
+    """
+    Atomically move a fully built database file into place.
+    
+    Readers that still have the old file open keep reading it until they are
+    returned to the pool; new checkouts open the replacement.
+    """
+    # The build ran with synchronous=OFF, so flush it to disk before the rename
+    with open(build_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(build_path, db_path)
+
+def load_data(json_path='./attached_assets/GTFS_data_v5.json', db_path='gtfs.db', strict=False):
     """
     Load data from a JSON file into the SQLite database.
     
+    The new data is built in a side file (db_path + '.next'), indexed, analyzed and
+    checked against the feed, and only then renamed over the live database. Queries
+    keep running against the previous data for the whole duration of the load.
+    The feed is validated by the same streaming pass that loads it.
+    
     Args:
         json_path (str): Path to the JSON data file
         db_path (str): Path to the SQLite database
+        strict (bool): Raise instead of returning an error message when the feed
+            itself is malformed or fails validation
     
     Returns:
         str: Status message
+    
+    Raises:
+        FeedFormatError, json.JSONDecodeError, UnicodeDecodeError: With strict=True,
+            if the feed cannot be loaded
     """
+    build_path = db_path + SHADOW_SUFFIX
+    conn = None
     try:
-        logger.info(f"Loading data from {json_path} into {db_path}")
+        logger.info(f"Loading data from {json_path} into {db_path} (building in {build_path})")
         
-        # Connect to (or create) the SQLite database
-        conn = sqlite3.connect(db_path)
+        # Start from an empty side file
+        remove_database_files(build_path)
+        conn = sqlite3.connect(build_path)
         cursor = conn.cursor()
 
+        # The side file is thrown away on failure, so skip fsyncs and keep the
+        # rollback journal in memory while loading
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA journal_mode=MEMORY")
+        cursor.execute("BEGIN")
+
         # Create tables
         create_tables(cursor)
-        
-        # Clear existing data
-        logger.info("Clearing existing data...")
-        cursor.execute("DELETE FROM vessels_and_accommodation_prices")
-        cursor.execute("DELETE FROM vessels_and_indicative_prices")
-        cursor.execute("DELETE FROM dates_and_vessels")
-        cursor.execute("DELETE FROM routes")
-
-        # Load JSON data from file
-        logger.info(f"Loading JSON data from {json_path}...")
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        # Insert data into the database
-        logger.info("Inserting data into the database...")
-        
-        # Handle both array format and object format with 'routes' key
-        if isinstance(data, list):
-            # It's already in the format we want (array of routes)
-            logger.info(f"Processing array format with {len(data)} routes")
-            insert_data(cursor, data)
-        elif isinstance(data, dict) and 'routes' in data:
-            # It's in object format with 'routes' key
-            logger.info(f"Processing object format with {len(data['routes'])} routes")
-            insert_data(cursor, data['routes'])
-        else:
-            logger.error("Invalid data format: expected array or object with 'routes' key")
-            conn.close()
-            raise ValueError("Invalid data format: expected array or object with 'routes' key")
 
-        # Commit the changes and close the connection
+        # Stream route items from the JSON file straight into the database.
+        # Both the array format and the object format with a 'routes' key are
+        # handled by the reader, which also collects feed statistics on the way.
+        logger.info(f"Streaming JSON data from {json_path} into the database...")
+        feed_stats = FeedStats()
+        try:
+            insert_data(cursor, iter_routes(json_path, feed_stats))
+        except FeedFormatError as e:
+            logger.error(str(e))
+            raise
+        feed_stats.check()
+        logger.info(f"Processed {feed_stats.layout} format with {feed_stats.routes} routes "
+                    f"({feed_stats.scheduled_sailings} scheduled sailings)")
+
+        # Materialize the search table from the loaded timetable
+        departures = rebuild_departures(cursor)
+        logger.info(f"Built {departures} departures")
+
+        # Build the secondary indexes and the query planner statistics
+        logger.info("Building indexes...")
+        create_indexes(cursor)
+        cursor.execute("ANALYZE")
+
+        counts = validate_row_counts(cursor, feed_stats)
+        logger.info(f"Validated row counts: {counts}")
+
+        # Commit the changes and close the connection. The swapped-in file uses a
+        # plain rollback journal, which read-only readers and delta updates expect.
         conn.commit()
+        cursor.execute("PRAGMA journal_mode=DELETE")
         conn.close()
+        conn = None
+
+        swap_database(build_path, db_path)
+
+        # Pooled readers still hold the old file; force them to reconnect
+        invalidate_pool()
 
         logger.info("Data loaded successfully into the database")
         
@@ -203,6 +1009,15 @@ def load_data(json_path='./attached_assets/GTFS_data_v5.json', db_path='gtfs.db'
         
     except Exception as e:
         logger.error(f"Error loading data: {str(e)}", exc_info=True)
+        if conn is not None:
+            conn.close()
+        # The live database was never touched; just discard the partial build
+        try:
+            remove_database_files(build_path)
+        except OSError as cleanup_error:
+            logger.warning(f"Could not remove {build_path}: {str(cleanup_error)}")
+        if strict and isinstance(e, FEED_ERRORS):
+            raise
         return f"Error loading data: {str(e)}"
 
 if __name__ == "__main__":
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Modules open gtfs.db, data_updates.log and the other data files relative to
+# the working directory; keep them out of the repository while testing
+os.chdir(tempfile.mkdtemp(prefix="ferry-tests-"))
@@ -0,0 +1,72 @@
+"""
+Small deterministic GTFS feeds for the loader tests.
+"""
+
+import json
+import random
+from datetime import date, timedelta
+
+PORTS = [("PIR", "PIRAEUS"), ("PAS", "PAROS"), ("JNX", "NAXOS"), ("MLO", "MILOS"),
+         ("JTR", "SANTORINI (THIRA)"), ("JMK", "MYKONOS"), ("SIF", "SIFNOS")]
+VESSELS = ["00003___BLUE STAR NAXOS", "45___WORLDCHAMPION JET", "00007___BLUE STAR 1"]
+ACCOMMODATIONS = ["DECK___DECK", "EC___Economy numbered seat", "AB2___2 bed Inside cabin"]
+COMPANIES = [("BLUE STAR FERRIES", "BSF"), ("SEAJETS", "SJ")]
+
+START = date(2025, 6, 1)
+
+def sailing_dates(rng, days=40):
+    """A random operating calendar of a leg, as a dates_and_vessels mapping."""
+    return {(START + timedelta(days=offset)).isoformat(): rng.choice(VESSELS)
+            for offset in range(days) if rng.random() < 0.4}
+
+def make_feed(itineraries=6, seed=1):
+    """
+    Route items of a feed: every pair of stops of a few four-port itineraries,
+    in the array layout.
+    """
+    rng = random.Random(seed)
+    items = []
+    for number in range(itineraries):
+        stops = rng.sample(PORTS, 4)
+        departure = rng.randint(5, 18) * 60
+        company, company_code = rng.choice(COMPANIES)
+        for first in range(3):
+            for last in range(first + 1, 4):
+                leaves = departure + first * 90
+                arrives = departure + last * 90 - 10
+                items.append(make_item(f"R{number}", company, company_code, stops[first], stops[last],
+                                       leaves, arrives, first + 1, last + 1, sailing_dates(rng), rng))
+    return items
+
+def make_item(route_number, company, company_code, origin, destination, leaves, arrives,
+              origin_stop, destination_stop, dates_and_vessels, rng):
+    """One route item of a feed."""
+    vessels = sorted(set(dates_and_vessels.values()))
+    return {
+        "route_id": route_number,
+        "company": company,
+        "company_code": company_code,
+        "origin_port": origin[1],
+        "origin_port_code": origin[0],
+        "destination_port": destination[1],
+        "destination_port_code": destination[0],
+        "departure_time": f"{leaves // 60 % 24:02d}:{leaves % 60:02d}",
+        "arrival_time": f"{arrives // 60 % 24:02d}:{arrives % 60:02d}",
+        "origin_port_stop": origin_stop,
+        "destination_port_stop": destination_stop,
+        "departure_offset": 0,
+        "arrival_offset": 0,
+        "duration": arrives - leaves,
+        "dates_and_vessels": dates_and_vessels,
+        "vessels_and_indicative_prices": {vessel: rng.choice([0, 1500, 2500, 4000]) for vessel in vessels},
+        "vessels_and_accommodation_prices": {
+            vessel: {accommodation: rng.choice([0, 1000, 3000, 9000]) for accommodation in ACCOMMODATIONS}
+            for vessel in vessels
+        }
+    }
+
+def write_feed(path, items, layout="array"):
+    """Write route items as a feed file and return its path as a string."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(items if layout == "array" else {"routes": items}, f)
+    return str(path)
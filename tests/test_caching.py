@@ -0,0 +1,55 @@
+"""
+Answer cache keys, against a small in-memory port directory.
+"""
+
+import os
+
+import pytest
+
+import caching
+import fast_path
+from port_directory import PortDirectory
+
+PORTS = [("PIR", "PIRAEUS"), ("JNX", "NAXOS"), ("PAS", "PAROS")]
+
+@pytest.fixture(autouse=True)
+def directory(monkeypatch):
+    ports = PortDirectory(PORTS)
+    monkeypatch.setattr(fast_path, "get_port_directory", lambda: ports)
+    monkeypatch.setattr(caching, "get_data_version", lambda: 1)
+    return ports
+
+def test_rewordings_share_a_key():
+    assert caching.answer_key("Ferries from Piraeus to Naxos on 2099-10-20") == \
+        caching.answer_key("Show me the boats from Piraeus to Naxos on 20/10/2099")
+
+@pytest.mark.parametrize("text", [
+    "Which companies run ferries from Piraeus to Naxos?",
+    "How long does the ferry from Piraeus to Naxos take?",
+    "Is there a ferry from Piraeus to Naxos?",
+    "Evening ferries from Piraeus to Naxos on 2099-10-20",
+    "Ferries from Piraeus to Naxos after 18:00 on 2099-10-20",
+    "How much is the ferry from Piraeus to Naxos on 2099-10-20?",
+    "Direct ferries from Piraeus to Naxos on 2099-10-20",
+])
+def test_unmodelled_questions_are_not_cached(text):
+    assert caching.answer_key(text) is None
+
+def test_cacheable_intents():
+    departures = caching.answer_key("Ferries from Piraeus to Naxos on 2099-10-20")
+    cheapest = caching.answer_key("What is the cheapest price from Piraeus to Naxos on 2099-10-20?")
+    assert departures[0] == "departures" and cheapest[0] == "cheapest"
+    assert departures != cheapest
+
+def test_historical_reload_changes_the_key(tmp_path, monkeypatch):
+    historical = tmp_path / "previous_db.db"
+    historical.write_bytes(b"before")
+    monkeypatch.setattr(caching, "HISTORICAL_DB_PATH", str(historical))
+    text = "Ferries from Piraeus to Naxos on 2099-10-20"
+    before = caching.answer_key(text)
+    assert caching.answer_key(text) == before
+
+    # A reload in another process only shows up as a modified file
+    historical.write_bytes(b"after")
+    os.utime(historical, ns=(0, historical.stat().st_mtime_ns + 1))
+    assert caching.answer_key(text) != before
@@ -0,0 +1,97 @@
+"""
+Delta updates against full reloads: applying a changed feed as a diff must leave
+the database in the same state as loading that feed from scratch.
+"""
+
+import copy
+import json
+import sqlite3
+
+import pytest
+
+import delta_loader
+import sqlite_loader
+from feeds import make_feed, write_feed
+from gtfs_stream import FeedFormatError
+
+# Route columns identifying a leg independently of its route_id
+LEG = "r.route_number, r.origin_port_code, r.destination_port_code, r.origin_port_stop, r.destination_port_stop"
+
+# Every user-facing table, projected onto natural keys so surrogate ids don't matter
+QUERIES = {
+    "routes": f"SELECT {LEG}, r.company, r.departure_time, r.arrival_time, r.duration FROM routes r",
+    "dates_and_vessels": f"SELECT {LEG}, d.schedule_date, d.vessel FROM dates_and_vessels d JOIN routes r USING (route_id)",
+    "vessels_and_indicative_prices": f"SELECT {LEG}, p.vessel, p.indicative_price "
+                                     f"FROM vessels_and_indicative_prices p JOIN routes r USING (route_id)",
+    "vessels_and_accommodation_prices": f"SELECT {LEG}, p.vessel, p.accommodation_type, p.price "
+                                        f"FROM vessels_and_accommodation_prices p JOIN routes r USING (route_id)",
+    "departures": f"SELECT {LEG}, d.schedule_date, d.departure_minute, d.arrival_minute, d.vessel_name, "
+                  f"d.indicative_price, d.min_accommodation_price, d.max_accommodation_price "
+                  f"FROM departures d JOIN routes r USING (route_id)",
+    "fare_calendar": "SELECT * FROM fare_calendar",
+    "ports": "SELECT * FROM ports",
+}
+
+def snapshot(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {name: sorted(conn.execute(query).fetchall()) for name, query in QUERIES.items()}
+    finally:
+        conn.close()
+
+def load(tmp_path, name, items):
+    path = str(tmp_path / f"{name}.db")
+    result = sqlite_loader.load_data(json_path=write_feed(tmp_path / f"{name}.json", items), db_path=path)
+    assert result.startswith("Data loaded successfully"), result
+    return path
+
+def next_feed(items):
+    """The following feed: one leg rescheduled and repriced, one itinerary dropped and one added."""
+    items = copy.deepcopy(items)
+    changed = items[0]
+    dropped_date = min(changed["dates_and_vessels"])
+    del changed["dates_and_vessels"][dropped_date]
+    changed["dates_and_vessels"]["2025-07-30"] = next(iter(changed["vessels_and_indicative_prices"]))
+    for vessel in changed["vessels_and_indicative_prices"]:
+        changed["vessels_and_indicative_prices"][vessel] += 500
+
+    items = [item for item in items if item["route_id"] != "R1"]
+    added = make_feed(itineraries=1, seed=99)
+    for item in added:
+        item["route_id"] = "R99"
+    return items + added
+
+@pytest.fixture
+def items():
+    return make_feed(itineraries=6, seed=5)
+
+def test_delta_matches_a_full_reload(tmp_path, items):
+    live = load(tmp_path, "live", items)
+    updated = next_feed(items)
+
+    summary = delta_loader.apply_delta(write_feed(tmp_path / "next.json", updated), db_path=live)
+
+    assert summary["routes_changed"] == 1
+    assert summary["routes_removed"] == 6
+    assert summary["routes_added"] == 6
+    assert snapshot(live) == snapshot(load(tmp_path, "fresh", updated))
+
+def test_unchanged_feed_leaves_the_database_alone(tmp_path, items):
+    live = load(tmp_path, "live", items)
+    before = snapshot(live)
+
+    summary = delta_loader.apply_delta(write_feed(tmp_path / "same.json", items), db_path=live)
+
+    assert summary["routes_unchanged"] == len(items)
+    assert snapshot(live) == before
+
+@pytest.mark.parametrize("feed", [[], {"routes": []}])
+def test_empty_feed_is_rejected(tmp_path, items, feed):
+    live = load(tmp_path, "live", items)
+    before = snapshot(live)
+    path = tmp_path / "empty.json"
+    path.write_text(json.dumps(feed))
+
+    with pytest.raises(FeedFormatError):
+        delta_loader.apply_delta(str(path), db_path=live)
+    assert snapshot(live) == before
@@ -0,0 +1,52 @@
+"""
+Intent classification of the fast path, against a small in-memory port directory.
+"""
+
+import pytest
+
+import fast_path
+from port_directory import PortDirectory
+
+PORTS = [("PIR", "PIRAEUS"), ("JNX", "NAXOS"), ("PAS", "PAROS"), ("JTR", "SANTORINI (THIRA)")]
+
+@pytest.fixture(autouse=True)
+def directory(monkeypatch):
+    ports = PortDirectory(PORTS)
+    monkeypatch.setattr(fast_path, "get_port_directory", lambda: ports)
+    return ports
+
+def intent_of(text):
+    intent = fast_path.normalize_intent(text)
+    return intent and intent["intent"]
+
+@pytest.mark.parametrize("text", [
+    "When does the ferry from Piraeus to Naxos leave on 2099-10-20?",
+    "When is the ferry from Piraeus to Naxos on 2099-10-20?",
+    "When does the boat go from Piraeus to Naxos on 20/10/2099?",
+    "When do ferries run from Piraeus to Naxos on 2099-10-20?",
+    "Ferries from Piraeus to Naxos on 2099-10-20",
+])
+def test_explicit_date_is_a_departures_question(text):
+    intent = fast_path.classify(text)
+    assert intent is not None
+    assert intent["intent"] == "departures"
+    assert (intent["origin"], intent["destination"], intent["date"]) == ("PIR", "JNX", "2099-10-20")
+
+@pytest.mark.parametrize("text", [
+    "Which dates are available from Piraeus to Naxos?",
+    "What days does the ferry from Piraeus to Naxos run?",
+    "When do ferries operate from Piraeus to Naxos?",
+])
+def test_dates_questions(text):
+    assert intent_of(text) == "dates"
+
+def test_departure_time_without_date_goes_to_the_agent():
+    assert intent_of("When does the ferry from Piraeus to Naxos leave?") == "route"
+    assert fast_path.classify("When does the ferry from Piraeus to Naxos leave?") is None
+
+def test_cheapest_with_date():
+    intent = fast_path.classify("Cheapest ferry from Piraeus to Naxos on 2099-10-20")
+    assert intent["intent"] == "cheapest" and intent["date"] == "2099-10-20"
+
+def test_past_dates_go_to_the_agent():
+    assert fast_path.classify("Ferries from Piraeus to Naxos on 2001-10-20") is None
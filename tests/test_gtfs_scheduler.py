@@ -0,0 +1,86 @@
+"""
+Scheduled update checks, against a stubbed mailbox and a temporary database.
+"""
+
+import os
+import shutil
+import sqlite3
+import time
+
+import pytest
+
+from email_fetcher import EmailFetcher
+from feed_registry import FeedRegistry
+from gtfs_scheduler import GTFSScheduler
+from feeds import make_feed, write_feed
+
+class Mailbox(EmailFetcher):
+    """An email fetcher whose inbox holds one email with the given attachments, oldest first."""
+
+    def __init__(self, *attachments):
+        super().__init__()
+        self.attachments = attachments
+
+    def connect(self):
+        return True
+
+    def disconnect(self):
+        pass
+
+    def search_emails(self, subject_filter=None, sender_filter=None, since_date=None):
+        return [b"1"]
+
+    def fetch_attachments(self, email_id, save_dir=None, json_only=True):
+        paths = []
+        for age, attachment in enumerate(reversed(self.attachments)):
+            path = os.path.join(save_dir, os.path.basename(attachment))
+            shutil.copyfile(attachment, path)
+            mtime = time.time() - 60 * age
+            os.utime(path, (mtime, mtime))
+            paths.append(path)
+        return paths
+
+@pytest.fixture
+def scheduler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    scheduler = GTFSScheduler(config_path=str(tmp_path / "scheduler.json"))
+    scheduler.enable_historical = False
+    return scheduler
+
+def test_new_feed_is_imported_in_the_run_that_downloads_it(tmp_path, scheduler):
+    items = make_feed()
+    scheduler.email_fetcher = Mailbox(write_feed(tmp_path / "GTFS_feed.json", items))
+
+    assert scheduler.check_and_update_gtfs() is True
+
+    with sqlite3.connect("gtfs.db") as conn:
+        routes = conn.execute("SELECT COUNT(*) FROM routes").fetchone()[0]
+    assert routes == len(items)
+    live = FeedRegistry().live_entry()
+    assert live is not None and live['valid'] is True
+
+def test_loaded_feed_is_not_imported_again(tmp_path, scheduler):
+    scheduler.email_fetcher = Mailbox(write_feed(tmp_path / "GTFS_feed.json", make_feed()))
+
+    assert scheduler.check_and_update_gtfs() is True
+    assert scheduler.check_and_update_gtfs() is False
+
+def test_invalid_feed_is_not_imported(tmp_path, scheduler):
+    scheduler.email_fetcher = Mailbox(write_feed(tmp_path / "GTFS_feed.json", []))
+
+    assert scheduler.check_and_update_gtfs() is False
+    assert not os.path.exists("gtfs.db")
+    assert FeedRegistry().live_entry() is None
+
+def test_newest_valid_feed_is_imported(tmp_path, scheduler):
+    items = make_feed()
+    older = write_feed(tmp_path / "GTFS_older.json", items, layout="object")
+    newer = write_feed(tmp_path / "GTFS_newer.json", [{"route_id": "R1"}])
+    scheduler.email_fetcher = Mailbox(older, newer)
+
+    assert scheduler.check_and_update_gtfs() is True
+
+    registry = FeedRegistry()
+    assert registry.live_entry()['filename'] == "GTFS_older.json"
+    invalid = [entry for entry in registry.entries.values() if entry['valid'] is False]
+    assert [entry['filename'] for entry in invalid] == ["GTFS_newer.json"]
@@ -0,0 +1,39 @@
+"""
+Feed validation rules of the streaming reader.
+"""
+
+import json
+
+import pytest
+
+from gtfs_stream import validate_feed
+from feeds import make_feed, write_feed
+
+def write_json(path, data):
+    path.write_text(json.dumps(data))
+    return str(path)
+
+@pytest.mark.parametrize("layout", ["array", "object"])
+def test_complete_feed_is_valid(tmp_path, layout):
+    is_valid, stats, error = validate_feed(write_feed(tmp_path / "feed.json", make_feed(), layout))
+    assert is_valid and error is None
+    assert stats.layout == layout and stats.routes == len(make_feed())
+
+def test_array_feed_needs_required_fields_on_the_first_item(tmp_path):
+    is_valid, _, error = validate_feed(write_json(tmp_path / "feed.json", [{"route_id": "R1"}]))
+    assert not is_valid and "required route fields" in error
+
+def test_object_feed_only_needs_routes(tmp_path):
+    is_valid, stats, _ = validate_feed(write_json(tmp_path / "feed.json", {"routes": [{"route_id": "R1"}]}))
+    assert is_valid and stats.routes == 1
+
+@pytest.mark.parametrize("data", [[], {"routes": []}, {"schedules": [{}]}, [1, 2]])
+def test_feed_without_route_items_is_invalid(tmp_path, data):
+    is_valid, _, error = validate_feed(write_json(tmp_path / "feed.json", data))
+    assert not is_valid and error
+
+def test_truncated_feed_is_invalid(tmp_path):
+    path = tmp_path / "feed.json"
+    path.write_text(json.dumps(make_feed())[:-40])
+    is_valid, _, error = validate_feed(str(path))
+    assert not is_valid and "not valid JSON" in error
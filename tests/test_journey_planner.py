@@ -0,0 +1,125 @@
+"""
+Journey planning over a small in-memory timetable.
+"""
+
+import itertools
+
+import pytest
+
+import journey_planner
+
+DATE = "2099-06-01"
+
+_route_ids = itertools.count(1)
+
+def sailing(origin, destination, departs, duration, price=1000, date=DATE):
+    """A departures row as the timetable query returns it."""
+    hours, minutes = map(int, departs.split(":"))
+    departure_minute = hours * 60 + minutes
+    arrival_minute = (departure_minute + duration) % 1440
+    return (origin, origin, destination, destination, date, departs,
+            f"{arrival_minute // 60:02d}:{arrival_minute % 60:02d}", "COMPANY", "CO", "VESSEL",
+            price, None, departure_minute, duration, 0, 0, next(_route_ids), 1)
+
+@pytest.fixture
+def timetable(monkeypatch):
+    """Install a list of sailings as the timetable the planner reads."""
+    rows = []
+    versions = itertools.count()
+
+    def query(sql, params):
+        return [row for row in rows if params["start"] <= row[4] <= params["end"]]
+
+    monkeypatch.setattr(journey_planner, "execute_query", query)
+    # Every search reads the sailings afresh
+    monkeypatch.setattr(journey_planner, "get_data_version", lambda: next(versions))
+    journey_planner.clear_timetable_cache()
+
+    def install(*sailings):
+        rows[:] = sailings
+    return install
+
+def ports(journey):
+    return [(leg["origin_code"], leg["destination_code"], leg["departure_time"]) for leg in journey["legs"]]
+
+def test_transfer_beats_a_slower_direct_sailing(timetable):
+    timetable(sailing("PIR", "JTR", "07:00", 480),
+              sailing("PIR", "JNX", "07:30", 240),
+              sailing("JNX", "JTR", "12:00", 120))
+
+    direct, transfer = journey_planner.earliest_arrival("PIR", "JTR", DATE)
+
+    assert ports(direct) == [("PIR", "JTR", "07:00")]
+    assert ports(transfer) == [("PIR", "JNX", "07:30"), ("JNX", "JTR", "12:00")]
+    assert transfer["transfers"] == 1 and transfer["connection_waits"] == [30]
+
+def test_direct_sailing_arriving_first_dominates_transfers(timetable):
+    timetable(sailing("PIR", "JTR", "07:00", 300),
+              sailing("PIR", "JNX", "07:30", 240),
+              sailing("JNX", "JTR", "12:00", 120))
+
+    journeys = journey_planner.earliest_arrival("PIR", "JTR", DATE)
+
+    assert [ports(journey) for journey in journeys] == [[("PIR", "JTR", "07:00")]]
+
+@pytest.mark.parametrize("min_connection, onward, wait", [(30, "12:00", 30), (15, "11:50", 20)])
+def test_connections_respect_the_minimum_transfer_time(timetable, min_connection, onward, wait):
+    timetable(sailing("PIR", "JNX", "07:30", 240),
+              sailing("JNX", "JTR", "11:50", 120),
+              sailing("JNX", "JTR", "12:00", 120))
+
+    (journey,) = journey_planner.earliest_arrival("PIR", "JTR", DATE, min_connection=min_connection)
+
+    assert ports(journey)[1] == ("JNX", "JTR", onward)
+    assert journey["connection_waits"] == [wait]
+
+def test_missed_connection_waits_for_the_next_day(timetable):
+    timetable(sailing("PIR", "JNX", "07:30", 240),
+              sailing("JNX", "JTR", "11:40", 120),
+              sailing("JNX", "JTR", "09:00", 120, date="2099-06-02"))
+
+    (journey,) = journey_planner.earliest_arrival("PIR", "JTR", DATE)
+
+    assert [leg["date"] for leg in journey["legs"]] == [DATE, "2099-06-02"]
+    assert journey["connection_waits"] == [1290]
+
+def test_multi_leg_journey_within_the_transfer_limit(timetable):
+    timetable(sailing("PIR", "PAS", "07:00", 240),
+              sailing("PAS", "JNX", "12:00", 60),
+              sailing("JNX", "JTR", "14:00", 120))
+
+    assert journey_planner.earliest_arrival("PIR", "JTR", DATE, max_transfers=1) == []
+    (journey,) = journey_planner.earliest_arrival("PIR", "JTR", DATE, max_transfers=2)
+
+    assert ports(journey) == [("PIR", "PAS", "07:00"), ("PAS", "JNX", "12:00"), ("JNX", "JTR", "14:00")]
+    assert journey["total_duration"] == 9 * 60 and journey["total_price"] == 3000
+
+def test_sailings_before_the_requested_time_are_skipped(timetable):
+    timetable(sailing("PIR", "JNX", "07:30", 240),
+              sailing("PIR", "JNX", "15:00", 240))
+
+    (journey,) = journey_planner.earliest_arrival("PIR", "JNX", DATE, after="10:00")
+
+    assert ports(journey) == [("PIR", "JNX", "15:00")]
+
+def test_pareto_front_drops_dominated_candidates():
+    candidates = [((1000, 300, 0, 1), "cheap"), ((3000, 120, 0, 2), "fast"),
+                  ((3000, 300, 1, 3), "dominated"), ((1000, 300, 0, 4), "later duplicate")]
+
+    front = journey_planner.pareto_front(candidates)
+
+    assert [value for _, value in front] == ["cheap", "fast"]
+
+def test_route_options_keep_the_cheapest_and_the_fastest(timetable):
+    timetable(sailing("PIR", "JTR", "07:00", 480, price=3000),
+              sailing("PIR", "JTR", "08:00", 300, price=9000),
+              sailing("PIR", "JTR", "09:00", 480, price=5000),
+              sailing("PIR", "JNX", "07:30", 240, price=1000),
+              sailing("JNX", "JTR", "12:00", 120, price=1000))
+
+    result = journey_planner.route_options("PIR", "JTR", DATE)
+
+    # The 09:00 sailing is slower and dearer than the 07:00 one
+    assert sorted(ports(option)[0][2] for option in result["options"]) == ["07:00", "07:30", "08:00"]
+    assert ports(result["cheapest"]) == [("PIR", "JNX", "07:30"), ("JNX", "JTR", "12:00")]
+    assert ports(result["fastest"]) == [("PIR", "JTR", "08:00")]
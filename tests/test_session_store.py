@@ -0,0 +1,103 @@
+"""
+The SQLite conversation store, on a temporary database file.
+"""
+
+import sqlite3
+
+import pytest
+
+import session_store
+from session_store import SessionStore, SQLiteSessionStore
+
+class Clock:
+    """Wall clock the tests move forward by hand."""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_store.time, "time", clock)
+    return clock
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "conversations.db")
+
+def turn(number):
+    return f"Question {number}?", f"Answer {number}."
+
+def stored_messages(db_path, session_id):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT seq, role, content FROM conversation_messages WHERE session_id = ? "
+                            "ORDER BY seq", (session_id,)).fetchall()
+    finally:
+        conn.close()
+
+def test_sessions_persist_across_instances(db_path, clock):
+    first = SQLiteSessionStore(db_path)
+    first.append("chat", *turn(1))
+    first.append("chat", *turn(2))
+
+    second = SQLiteSessionStore(db_path)
+    assert second.history("chat") == (None, [("human", "Question 1?"), ("ai", "Answer 1."),
+                                             ("human", "Question 2?"), ("ai", "Answer 2.")])
+
+    second.clear("chat")
+    assert first.history("chat") == (None, [])
+
+def test_idle_sessions_expire(db_path, clock):
+    store = SQLiteSessionStore(db_path, ttl_seconds=60)
+    store.append("idle", *turn(1))
+    clock.now += 30
+    store.append("active", *turn(1))
+
+    clock.now += 45
+    assert store.history("idle") == (None, [])
+    assert store.history("active")[1]
+
+    stats = store.stats()
+    assert stats["sessions"] == 1 and stats["expirations"] == 1
+    assert stored_messages(db_path, "idle") == []
+
+def test_least_recently_used_sessions_are_evicted(db_path, clock):
+    store = SQLiteSessionStore(db_path, max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        store.append(session_id, *turn(1))
+        clock.now += 1
+
+    assert store.history("a") == (None, [])
+    assert store.history("b")[1] and store.history("c")[1]
+    assert store.stats()["evictions"] == 1
+
+def test_compaction_keeps_sequence_numbers_contiguous(db_path, clock):
+    store = SQLiteSessionStore(db_path, max_messages=4)
+    for number in range(1, 6):
+        store.append("chat", *turn(number))
+
+    # Three turns folded into the summary, the last two kept verbatim
+    assert [seq for seq, _, _ in stored_messages(db_path, "chat")] == [6, 7, 8, 9]
+    summary, messages = store.history("chat")
+    assert [line.split(" Answer:")[0] for line in summary.split("\n")] == \
+        [f"- User asked: Question {number}?" for number in (1, 2, 3)]
+    assert messages == [("human", "Question 4?"), ("ai", "Answer 4."), ("human", "Question 5?"), ("ai", "Answer 5.")]
+
+    # Another process picks up where the numbering left off
+    SQLiteSessionStore(db_path, max_messages=4).append("chat", *turn(6))
+    assert [seq for seq, _, _ in stored_messages(db_path, "chat")] == [8, 9, 10, 11]
+    assert store.stats()["summarized_turns"] == 4
+
+def test_matches_the_memory_store(db_path, clock):
+    memory, sqlite = SessionStore(max_messages=4), SQLiteSessionStore(db_path, max_messages=4)
+    for number in range(1, 8):
+        question, answer = turn(number)
+        answer += " More detail." * number * 20
+        memory.append("chat", question, answer)
+        sqlite.append("chat", question, answer)
+
+    assert sqlite.history("chat") == memory.history("chat")
@@ -0,0 +1,176 @@
+"""
+The normalized schema against the original flat tables: a fixture feed is
+loaded both ways and the compatibility views must return the legacy rows.
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+import sqlite_loader
+from gtfs_stream import FeedFormatError
+from feeds import make_feed, write_feed
+
+# The flat schema of databases written before the dimension tables
+LEGACY_SCHEMA = """
+CREATE TABLE routes (
+    route_id INTEGER PRIMARY KEY AUTOINCREMENT, route_number TEXT, company TEXT, company_code TEXT,
+    origin_port_code TEXT, origin_port_name TEXT, destination_port_code TEXT, destination_port_name TEXT,
+    departure_time TEXT, arrival_time TEXT, origin_port_stop INTEGER, destination_port_stop INTEGER,
+    departure_offset INTEGER, arrival_offset INTEGER, duration INTEGER
+);
+CREATE TABLE dates_and_vessels (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, route_id INTEGER, schedule_date TEXT, vessel TEXT
+);
+CREATE TABLE vessels_and_indicative_prices (
+    route_id INTEGER, vessel TEXT, indicative_price INTEGER, PRIMARY KEY (route_id, vessel)
+);
+CREATE TABLE vessels_and_accommodation_prices (
+    route_id INTEGER, vessel TEXT, accommodation_type TEXT, price INTEGER,
+    PRIMARY KEY (route_id, vessel, accommodation_type)
+);
+"""
+
+# Route columns identifying a leg independently of its route_id
+LEG = "r.route_number, r.origin_port_code, r.destination_port_code, r.origin_port_stop, r.destination_port_stop"
+
+LEGACY_QUERIES = {
+    "dates_and_vessels": f"SELECT {LEG}, d.schedule_date, d.vessel FROM dates_and_vessels d JOIN routes r USING (route_id)",
+    "vessels_and_indicative_prices": f"SELECT {LEG}, p.vessel, p.indicative_price "
+                                     f"FROM vessels_and_indicative_prices p JOIN routes r USING (route_id)",
+    "vessels_and_accommodation_prices": f"SELECT {LEG}, p.vessel, p.accommodation_type, p.price "
+                                        f"FROM vessels_and_accommodation_prices p JOIN routes r USING (route_id)",
+}
+
+def build_legacy_database(path, items):
+    """Write items into the flat schema the way the original loader did."""
+    clean = sqlite_loader.clean_text
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_SCHEMA)
+    for item in items:
+        cursor = conn.execute(
+            "INSERT INTO routes (route_number, company, company_code, origin_port_name, origin_port_code, "
+            "destination_port_name, destination_port_code, departure_time, arrival_time, origin_port_stop, "
+            "destination_port_stop, departure_offset, arrival_offset, duration) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (clean(item["route_id"]), clean(item["company"]), clean(item["company_code"]),
+             clean(item["origin_port"]), clean(item["origin_port_code"]), clean(item["destination_port"]),
+             clean(item["destination_port_code"]), item["departure_time"], item["arrival_time"],
+             item["origin_port_stop"], item["destination_port_stop"], item["departure_offset"],
+             item["arrival_offset"], item["duration"]))
+        route_id = cursor.lastrowid
+        conn.executemany("INSERT INTO dates_and_vessels (route_id, schedule_date, vessel) VALUES (?, ?, ?)",
+                         [(route_id, day, clean(vessel)) for day, vessel in item["dates_and_vessels"].items()])
+        conn.executemany("INSERT INTO vessels_and_indicative_prices VALUES (?, ?, ?)",
+                         [(route_id, clean(vessel), price)
+                          for vessel, price in item["vessels_and_indicative_prices"].items()])
+        conn.executemany("INSERT INTO vessels_and_accommodation_prices VALUES (?, ?, ?, ?)",
+                         [(route_id, clean(vessel), clean(accommodation), price)
+                          for vessel, prices in item["vessels_and_accommodation_prices"].items()
+                          for accommodation, price in prices.items()])
+    conn.commit()
+    conn.close()
+
+def snapshot(path, queries=LEGACY_QUERIES):
+    conn = sqlite3.connect(path)
+    try:
+        return {name: sorted(conn.execute(query).fetchall()) for name, query in queries.items()}
+    finally:
+        conn.close()
+
+@pytest.fixture
+def items():
+    return make_feed(itineraries=6, seed=3)
+
+@pytest.fixture
+def legacy_db(tmp_path, items):
+    path = str(tmp_path / "legacy.db")
+    build_legacy_database(path, items)
+    return path
+
+@pytest.fixture
+def loaded_db(tmp_path, items):
+    path = str(tmp_path / "gtfs.db")
+    result = sqlite_loader.load_data(json_path=write_feed(tmp_path / "feed.json", items), db_path=path)
+    assert result.startswith("Data loaded successfully"), result
+    return path
+
+def test_views_return_the_legacy_rows(legacy_db, loaded_db):
+    legacy = snapshot(legacy_db)
+    assert all(legacy.values())
+    assert snapshot(loaded_db) == legacy
+
+def test_departures_hold_every_dated_sailing(loaded_db, items):
+    expected = sorted((item["route_id"], item["origin_port_stop"], item["destination_port_stop"], day)
+                      for item in items for day in item["dates_and_vessels"])
+    conn = sqlite3.connect(loaded_db)
+    rows = conn.execute("""
+        SELECT r.route_number, r.origin_port_stop, r.destination_port_stop, d.schedule_date,
+               d.departure_time, d.departure_minute, d.indicative_price, p.indicative_price
+        FROM departures d
+        JOIN routes r USING (route_id)
+        LEFT JOIN route_vessel_prices p ON p.route_id = d.route_id AND p.vessel_id = d.vessel_id
+    """).fetchall()
+    conn.close()
+    assert sorted(row[:4] for row in rows) == expected
+    for row in rows:
+        hours, minutes = map(int, row[4].split(":"))
+        assert row[5] == hours * 60 + minutes
+        assert row[6] == row[7]
+
+def test_fare_calendar_summarizes_departures(loaded_db):
+    conn = sqlite3.connect(loaded_db)
+    expected = conn.execute("""
+        SELECT origin_port_code, destination_port_code, schedule_date, COUNT(*),
+               MIN(CASE WHEN indicative_price > 0 THEN indicative_price END)
+        FROM departures GROUP BY 1, 2, 3 ORDER BY 1, 2, 3
+    """).fetchall()
+    calendar = conn.execute("""
+        SELECT origin_port_code, destination_port_code, schedule_date, sailings, min_indicative_price
+        FROM fare_calendar ORDER BY 1, 2, 3
+    """).fetchall()
+    conn.close()
+    assert calendar == expected
+
+def test_migrating_a_legacy_database(legacy_db, loaded_db):
+    legacy = snapshot(legacy_db)
+    created = sqlite_loader.migrate_database(legacy_db)
+    assert created
+
+    # The flat tables became views over the normalized tables, with the same rows
+    conn = sqlite3.connect(legacy_db)
+    kinds = dict(conn.execute("SELECT name, type FROM sqlite_master WHERE name IN "
+                              "('dates_and_vessels', 'vessels_and_indicative_prices', "
+                              "'vessels_and_accommodation_prices')").fetchall())
+    counts = {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+              for table in ("departures", "fare_calendar", "ports")}
+    conn.close()
+    assert set(kinds.values()) == {"view"}
+    assert snapshot(legacy_db) == legacy
+    assert all(counts.values())
+    assert counts == {table: sqlite3.connect(loaded_db).execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                      for table in counts}
+
+def test_migration_is_idempotent(legacy_db):
+    sqlite_loader.migrate_database(legacy_db)
+    conn = sqlite3.connect(legacy_db)
+    before = list(conn.iterdump())
+    conn.close()
+
+    assert sqlite_loader.migrate_database(legacy_db) == []
+    conn = sqlite3.connect(legacy_db)
+    after = list(conn.iterdump())
+    conn.close()
+    assert after == before
+
+@pytest.mark.parametrize("feed", [[], [{"route_id": "R1"}], {"routes": []}])
+def test_invalid_feed_leaves_the_database_alone(tmp_path, loaded_db, feed):
+    before = snapshot(loaded_db)
+    path = tmp_path / "invalid.json"
+    path.write_text(json.dumps(feed))
+
+    assert sqlite_loader.load_data(json_path=str(path), db_path=loaded_db).startswith("Error")
+    with pytest.raises(FeedFormatError):
+        sqlite_loader.load_data(json_path=str(path), db_path=loaded_db, strict=True)
+    assert snapshot(loaded_db) == before
@@ -0,0 +1,272 @@
+"""
+In-process columnar timetable engine.
+
+Loads the departures table into NumPy columns once per data version and answers
+the structured searches with vectorized filters, sorts, top-k selection and
+aggregations instead of SQLite row materialization. Text columns are object
+arrays over one shared copy of each distinct string, and a row is only rebuilt
+as a tuple when it is part of a result.
+
+NumPy is optional. get_engine() returns None when NumPy is not installed or the
+engine is disabled in config, and callers fall back to SQLite.
+"""
+
+import logging
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from config import TIMETABLE_ENGINE_ENABLED
+from db import execute_query, get_data_version
+from service_calendar import day_number
+
+logger = logging.getLogger(__name__)
+
+# Stands in for NULL in the integer columns
+MISSING = -1
+
+# Slices shorter than this are fully sorted; longer ones are partitioned first
+# when only the top few rows are needed
+TOP_K_PARTITION_MIN = 64
+
+class _Interner:
+    """Keeps one shared copy of each distinct text value."""
+
+    def __init__(self):
+        self.values = {}
+
+    def __call__(self, value):
+        return self.values.setdefault(value, value)
+
+def _integer(value):
+    """Map NULL to MISSING for an integer column."""
+    return MISSING if value is None else value
+
+def _optional(value):
+    """Map MISSING back to None."""
+    return None if value == MISSING else value
+
+class TimetableEngine:
+    """
+    The departures table as NumPy columns, sorted by (origin, destination, day,
+    departure minute) so a port pair and a date window is one contiguous slice.
+    """
+
+    # Sort keys per order, most significant last as np.lexsort expects
+    ORDERS = {
+        "departure": lambda c, s: (c['date_id'][s], c['departure_minute'][s]),
+        "cheapest": lambda c, s: (c['date_id'][s], c['departure_minute'][s], c['indicative_price'][s],
+                                  c['indicative_price'][s] <= 0),
+        "fastest": lambda c, s: (c['date_id'][s], c['departure_minute'][s], c['duration'][s],
+                                 c['duration'][s] == MISSING)
+    }
+
+    # Integer columns used for filtering, sorting and aggregation
+    NUMERIC_COLUMNS = ('route_id', 'origin', 'destination', 'day', 'departure_minute', 'duration',
+                       'indicative_price', 'min_accommodation_price', 'max_accommodation_price',
+                       'vessel_id', 'date_id')
+
+    # Text columns, only read back when rows are rebuilt
+    TEXT_COLUMNS = ('origin_code', 'origin_name', 'destination_code', 'destination_name', 'departure_time',
+                    'arrival_time', 'company', 'company_code', 'vessel_name', 'schedule_date')
+
+    def __init__(self):
+        started = time.perf_counter()
+        intern = _Interner()
+        port_ids = {}
+
+        query = """
+        SELECT
+            route_id, origin_port_code, origin_port_name, destination_port_code, destination_port_name,
+            departure_time, arrival_time, duration, company, company_code, vessel_name, schedule_date,
+            indicative_price, vessel_id, min_accommodation_price, max_accommodation_price,
+            departure_minute, date_id
+        FROM departures
+        """
+        columns = {name: [] for name in self.NUMERIC_COLUMNS + self.TEXT_COLUMNS}
+        for row in execute_query(query):
+            columns['route_id'].append(row[0])
+            columns['origin'].append(port_ids.setdefault(row[1], len(port_ids)))
+            columns['destination'].append(port_ids.setdefault(row[3], len(port_ids)))
+            columns['day'].append(day_number(row[11]))
+            columns['departure_minute'].append(row[16])
+            columns['duration'].append(_integer(row[7]))
+            columns['indicative_price'].append(_integer(row[12]))
+            columns['min_accommodation_price'].append(_integer(row[14]))
+            columns['max_accommodation_price'].append(_integer(row[15]))
+            columns['vessel_id'].append(_integer(row[13]))
+            columns['date_id'].append(row[17])
+            for name, value in zip(self.TEXT_COLUMNS, (row[1], row[2], row[3], row[4], row[5], row[6],
+                                                       row[8], row[9], row[10], row[11])):
+                columns[name].append(intern(value))
+
+        self.port_ids = port_ids
+        self.columns = {name: np.array(columns[name], dtype=np.int64) for name in self.NUMERIC_COLUMNS}
+        self.columns.update({name: np.array(columns[name], dtype=object) for name in self.TEXT_COLUMNS})
+        c = self.columns
+        order = np.lexsort((c['date_id'], c['departure_minute'], c['day'], c['destination'], c['origin']))
+        for name in c:
+            c[name] = c[name][order]
+
+        # One sortable key per (origin, destination, day) for slicing with searchsorted
+        self._ports_count = max(len(port_ids), 1)
+        self.pair_day = (c['origin'] * self._ports_count + c['destination']) * 1_000_000 + c['day']
+
+        logger.info(f"Timetable engine loaded {len(self)} departures in "
+                    f"{time.perf_counter() - started:.3f}s")
+
+    def __len__(self):
+        return len(self.columns['route_id'])
+
+    def _slice(self, origin, destination, start_date, end_date):
+        """Index range of a port pair's departures between two dates, inclusive."""
+        origin_code = self.port_ids.get(origin)
+        destination_code = self.port_ids.get(destination)
+        if origin_code is None or destination_code is None:
+            return slice(0, 0)
+        pair = (origin_code * self._ports_count + destination_code) * 1_000_000
+        low = np.searchsorted(self.pair_day, pair + day_number(start_date), side='left')
+        high = np.searchsorted(self.pair_day, pair + day_number(end_date), side='right')
+        return slice(int(low), int(high))
+
+    def _rows(self, indexes):
+        """
+        Rebuild departures in the column order of tools.ferry_tools.DEPARTURE_COLUMNS.
+        Each column is gathered and converted with one call, then zipped into rows.
+        """
+        c = self.columns
+
+        def column(name):
+            return c[name][indexes].tolist()
+
+        def optional(name):
+            return [None if value == MISSING else value for value in column(name)]
+
+        return list(zip(
+            column('route_id'),
+            column('origin_code'),
+            column('origin_name'),
+            column('destination_code'),
+            column('destination_name'),
+            column('departure_time'),
+            column('arrival_time'),
+            optional('duration'),
+            column('company'),
+            column('company_code'),
+            column('vessel_name'),
+            column('schedule_date'),
+            optional('indicative_price'),
+            optional('vessel_id'),
+            optional('min_accommodation_price'),
+            optional('max_accommodation_price')
+        ))
+
+    def departures(self, origin, destination, date, order="departure", limit=None):
+        """
+        The sailings of a port pair on a date, sorted like the SQL search.
+
+        Args:
+            origin: Origin port code
+            destination: Destination port code
+            date: Date in YYYY-MM-DD format
+            order: One of ORDERS
+            limit: Optional maximum number of rows
+
+        Returns:
+            list: Departure tuples in DEPARTURE_COLUMNS order
+        """
+        window = self._slice(origin, destination, date, date)
+        if window.start == window.stop:
+            return []
+
+        if order == "departure":
+            # The columns are already sorted by departure within a pair and day
+            stop = min(window.stop, window.start + int(limit)) if limit else window.stop
+            return self._rows(slice(window.start, stop))
+
+        indexes = np.arange(window.start, window.stop)
+        if limit and limit < len(indexes) and len(indexes) > TOP_K_PARTITION_MIN:
+            # Top-k: partition on the primary key, then sort only the candidates
+            # that can still make it into the result
+            column = self.columns['indicative_price' if order == "cheapest" else 'duration'][window]
+            invalid = column <= 0 if order == "cheapest" else column == MISSING
+            primary = np.where(invalid, np.iinfo(np.int64).max, column)
+            threshold = np.partition(primary, int(limit) - 1)[int(limit) - 1]
+            indexes = indexes[primary <= threshold]
+
+        indexes = indexes[np.lexsort(self.ORDERS[order](self.columns, indexes))]
+        if limit:
+            indexes = indexes[:int(limit)]
+        return self._rows(indexes)
+
+    def day_summary(self, origin, destination, start_date, end_date):
+        """
+        Per-day aggregates of a port pair over a date window, computed with one
+        reduction per column over the contiguous slice.
+
+        Returns:
+            dict: schedule_date -> (sailings, cheapest fare, earliest departure minute,
+            fastest duration), for days with sailings
+        """
+        window = self._slice(origin, destination, start_date, end_date)
+        if window.start == window.stop:
+            return {}
+        c = self.columns
+        days = c['day'][window]
+        starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+        counts = np.diff(np.r_[starts, len(days)])
+
+        big = np.iinfo(np.int64).max
+        indicative = c['indicative_price'][window]
+        accommodation = c['min_accommodation_price'][window]
+        fares = np.where(indicative > 0, indicative, np.where(accommodation > 0, accommodation, big))
+        minutes = c['departure_minute'][window]
+        minutes = np.where(minutes >= 0, minutes, big)
+        durations = c['duration'][window]
+        durations = np.where(durations > 0, durations, big)
+
+        summary = {}
+        for schedule_date, count, fare, minute, duration in zip(
+                c['schedule_date'][window][starts].tolist(), counts.tolist(),
+                np.minimum.reduceat(fares, starts).tolist(),
+                np.minimum.reduceat(minutes, starts).tolist(),
+                np.minimum.reduceat(durations, starts).tolist()):
+            summary[schedule_date] = (count, None if fare == big else fare,
+                                      None if minute == big else minute,
+                                      None if duration == big else duration)
+        return summary
+
+_engine = None
+_engine_version = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Return the engine for the current data version, loading it on first use.
+
+    Returns:
+        TimetableEngine or None: None when NumPy is missing, the engine is
+        disabled, or loading failed
+    """
+    global _engine, _engine_version
+    if np is None or not TIMETABLE_ENGINE_ENABLED:
+        return None
+
+    # A failed load is remembered too, so it is only retried after a reload
+    version = get_data_version()
+    if _engine_version == version:
+        return _engine
+
+    with _engine_lock:
+        if _engine_version != version:
+            try:
+                _engine = TimetableEngine()
+            except Exception as e:
+                logger.error(f"Error loading the timetable engine, falling back to SQLite: {str(e)}")
+                _engine = None
+            _engine_version = version
+        return _engine
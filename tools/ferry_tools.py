@@ -1,13 +1,20 @@
 import logging
-from datetime import datetime
+import calendar
+from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from pydantic import BaseModel, Field
 
 from langchain.tools import BaseTool, StructuredTool, tool
 from db import execute_query
+from service_calendar import ServiceCalendar, union_all
+from port_directory import get_port_directory
+from timetable_engine import get_engine
+from journey_planner import (
+    DEFAULT_MAX_TRANSFERS, DEFAULT_MIN_CONNECTION_MINUTES, connections_via, earliest_arrival, route_options
+)
 from utils import (
     format_price, extract_date_from_text, extract_ports_from_text, 
-    format_schedule_response
+    format_schedule_response, calculate_travel_time
 )
 
 logger = logging.getLogger(__name__)
@@ -30,6 +37,42 @@ class MultiSegmentParams(BaseModel):
     intermediate_stop: str = Field(..., description="The intermediate port code")
     date: str = Field(..., description="The departure date in YYYY-MM-DD format")
 
+class DateRangeParams(BaseModel):
+    """Parameters for searching ferry routes over a range of dates."""
+    origin: str = Field(..., description="The origin port code")
+    destination: str = Field(..., description="The destination port code")
+    start_date: str = Field(..., description="The first date of the window in YYYY-MM-DD format")
+    end_date: str = Field(..., description="The last date of the window in YYYY-MM-DD format")
+
+class FareCalendarParams(BaseModel):
+    """Parameters for looking up the fare calendar of a port pair."""
+    origin: str = Field(..., description="The origin port code")
+    destination: str = Field(..., description="The destination port code")
+    month: str = Field(..., description="The month in YYYY-MM format")
+
+class RoundTripParams(BaseModel):
+    """Parameters for searching round trips."""
+    origin: str = Field(..., description="The origin port code")
+    destination: str = Field(..., description="The destination port code")
+    outbound_date: str = Field(..., description="The outbound date in YYYY-MM-DD format")
+    return_date: Optional[str] = Field(None, description="The return date in YYYY-MM-DD format")
+    stay_days: Optional[int] = Field(None, description="Days between outbound and return, if no return date is given")
+    same_company: bool = Field(False, description="Only pair sailings of the same company")
+    min_stay_hours: Optional[int] = Field(None, description="Minimum hours between arriving and sailing back")
+    max_stay_hours: Optional[int] = Field(None, description="Maximum hours between arriving and sailing back")
+    order: str = Field("cheapest", description="Ranking: cheapest or fastest")
+    limit: int = Field(10, description="Maximum number of pairs to return")
+
+class JourneyParams(BaseModel):
+    """Parameters for planning a journey with transfers."""
+    origin: str = Field(..., description="The origin port code")
+    destination: str = Field(..., description="The final destination port code")
+    date: str = Field(..., description="The departure date in YYYY-MM-DD format")
+    max_transfers: int = Field(DEFAULT_MAX_TRANSFERS, description="The maximum number of changes of ship")
+    min_connection_minutes: int = Field(DEFAULT_MIN_CONNECTION_MINUTES,
+                                        description="The minimum time in minutes between two legs")
+    earliest_departure: str = Field("00:00", description="The earliest departure time in HH:MM format")
+
 @tool
 def get_all_ports() -> List[Dict[str, str]]:
     """
@@ -37,16 +80,7 @@ def get_all_ports() -> List[Dict[str, str]]:
     Returns a list of dictionaries with port code and name.
     """
     try:
-        query = """
-        SELECT DISTINCT origin_port_code as code, origin_port_name as name 
-        FROM routes
-        UNION
-        SELECT DISTINCT destination_port_code as code, destination_port_name as name 
-        FROM routes
-        ORDER BY name
-        """
-        results = execute_query(query)
-        return [{"code": row[0], "name": row[1]} for row in results]
+        return [dict(port) for port in get_port_directory().ports]
     except Exception as e:
         logger.error(f"Error in get_all_ports: {str(e)}")
         return []
@@ -63,8 +97,8 @@ def extract_query_parameters(query: str) -> Dict[str, Any]:
         Dictionary with extracted origin, destination, and date
     """
     try:
-        # Get the list of ports to help with extraction
-        ports = get_all_ports()
+        # The port directory holds the port list and its matcher
+        directory = get_port_directory()
         
         # Extract date
         date = extract_date_from_text(query)
@@ -73,7 +107,7 @@ def extract_query_parameters(query: str) -> Dict[str, Any]:
             date = datetime.now().strftime('%Y-%m-%d')
         
         # Extract origin and destination ports
-        origin, destination = extract_ports_from_text(query, ports)
+        origin, destination = extract_ports_from_text(query, directory.ports, directory.matcher)
         
         return {
             "origin": origin,
@@ -84,6 +118,158 @@ def extract_query_parameters(query: str) -> Dict[str, Any]:
         logger.error(f"Error in extract_query_parameters: {str(e)}")
         return {"origin": None, "destination": None, "date": None}
 
+# Columns read from the departures table, in the order _departure_to_route_data expects
+DEPARTURE_COLUMNS = """
+    route_id,
+    origin_port_code,
+    origin_port_name,
+    destination_port_code,
+    destination_port_name,
+    departure_time,
+    arrival_time,
+    duration,
+    company,
+    company_code,
+    vessel_name,
+    schedule_date,
+    indicative_price,
+    vessel_id,
+    min_accommodation_price,
+    max_accommodation_price
+"""
+
+# Sort orders for departure lookups. Sailings without a known price sort after
+# priced ones when looking for the cheapest.
+DEPARTURE_ORDERS = {
+    "departure": "departure_minute",
+    "cheapest": "(indicative_price IS NULL OR indicative_price <= 0), indicative_price, departure_minute",
+    "fastest": "duration IS NULL, duration, departure_minute"
+}
+
+def query_departures(origin: str, destination: str, date: str,
+                     order: str = "departure", limit: Optional[int] = None) -> List[tuple]:
+    """
+    Read the dated sailings of a port pair from the departures table.
+    
+    The table is clustered on (origin, destination, date), so this is a single
+    index range scan regardless of the sort order. When the timetable engine is
+    enabled the rows come from its in-memory columns instead.
+    
+    Args:
+        origin: The origin port code
+        destination: The destination port code
+        date: The departure date in YYYY-MM-DD format
+        order: One of the keys of DEPARTURE_ORDERS
+        limit: Optional maximum number of rows
+        
+    Returns:
+        List of departure rows in DEPARTURE_COLUMNS order
+    """
+    engine = get_engine()
+    if engine is not None:
+        return engine.departures(origin, destination, date, order, limit)
+    
+    query = f"""
+    SELECT {DEPARTURE_COLUMNS}
+    FROM departures
+    WHERE origin_port_code = :origin
+      AND destination_port_code = :destination
+      AND schedule_date = :date
+    ORDER BY {DEPARTURE_ORDERS[order]}
+    """
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    
+    return execute_query(query, {
+        "origin": origin,
+        "destination": destination,
+        "date": date
+    })
+
+def _departure_to_route_data(row: tuple) -> Dict[str, Any]:
+    """Convert a departures row into the route_data dict format_schedule_response expects."""
+    return {
+        "route_id": row[0],
+        "origin_code": row[1],
+        "origin_port_name": row[2],
+        "destination_code": row[3],
+        "destination_port_name": row[4],
+        "departure_time": row[5],
+        "arrival_time": row[6],
+        "duration": row[7] or 0,
+        "company_name": row[8],
+        "company_code": row[9],
+        "vessel_name": row[10],
+        "date": row[11],
+        "indicative_price": row[12] or 0,
+        "vessel_id": row[13],
+        "min_accommodation_price": row[14],
+        "max_accommodation_price": row[15]
+    }
+
+# (route_id, vessel_id) pairs looked up per accommodation query; keeps the
+# number of bound parameters well under SQLite's limit
+ACCOMMODATION_BATCH_SIZE = 400
+
+def get_accommodations(pairs: List[tuple]) -> Dict[tuple, List[Dict[str, Any]]]:
+    """
+    Get the accommodation codes, names and prices for many (route_id, vessel_id)
+    pairs with one set-based query, grouped per pair in memory.
+    
+    Args:
+        pairs: (route_id, vessel_id) tuples
+        
+    Returns:
+        Dictionary mapping each pair to its list of accommodations
+    """
+    unique_pairs = list(dict.fromkeys(pair for pair in pairs if pair[1] is not None))
+    accommodations = {pair: [] for pair in pairs}
+    
+    for i in range(0, len(unique_pairs), ACCOMMODATION_BATCH_SIZE):
+        batch = unique_pairs[i:i + ACCOMMODATION_BATCH_SIZE]
+        values = ", ".join("(?, ?)" for _ in batch)
+        acc_query = f"""
+        WITH pairs(route_id, vessel_id) AS (VALUES {values})
+        SELECT
+            p.route_id,
+            p.vessel_id,
+            a.accommodation_code as code,
+            a.accommodation_name as name,
+            p.price
+        FROM
+            pairs
+        JOIN
+            route_accommodation_prices p ON p.route_id = pairs.route_id AND p.vessel_id = pairs.vessel_id
+        JOIN
+            accommodation_types a ON a.accommodation_id = p.accommodation_id
+        ORDER BY
+            p.route_id, p.vessel_id, p.accommodation_id
+        """
+        
+        params = [value for pair in batch for value in pair]
+        for row in execute_query(acc_query, params):
+            accommodations[(row[0], row[1])].append({"code": row[2], "name": row[3], "price": row[4]})
+    
+    return accommodations
+
+def find_departures(origin: str, destination: str, date: str,
+                    order: str = "departure", limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Look up the sailings of a port pair on a date, formatted for the response.
+    
+    Plain function behind the search tools, so they can share it without
+    calling one another. Costs two queries however many sailings there are:
+    one for the departures and one for all of their accommodations.
+    """
+    departures = [_departure_to_route_data(row) for row in query_departures(origin, destination, date, order, limit)]
+    accommodations = get_accommodations([(route["route_id"], route["vessel_id"]) for route in departures])
+    
+    routes = []
+    for route_data in departures:
+        route_data["accommodations"] = accommodations[(route_data["route_id"], route_data["vessel_id"])]
+        routes.append(format_schedule_response(route_data))
+    return routes
+
 @tool
 def search_ferry_routes(params: FerrySearchParams) -> List[Dict[str, Any]]:
     """
@@ -96,88 +282,210 @@ def search_ferry_routes(params: FerrySearchParams) -> List[Dict[str, Any]]:
         List of matching ferry routes with schedule and pricing information
     """
     try:
-        query = """
-        SELECT
-            r.route_id,
-            r.origin_port_code as origin_code,
-            r.origin_port_name as origin_name,
-            r.destination_port_code as destination_code,
-            r.destination_port_name as destination_name,
-            r.departure_time,
-            r.arrival_time,
-            r.duration,
-            r.company as company_name,
-            r.company_code as company_code,
-            substr(dv.vessel, instr(dv.vessel, '___') + 3) as vessel_name,
-            dv.schedule_date as date,
-            vip.indicative_price
-        FROM
-            routes r
-        JOIN
-            dates_and_vessels dv ON r.route_id = dv.route_id
-        LEFT JOIN
-            vessels_and_indicative_prices vip ON r.route_id = vip.route_id AND vip.vessel = dv.vessel
-        WHERE
-            r.origin_port_code = :origin
-            AND r.destination_port_code = :destination
-            AND dv.schedule_date = :date
-        ORDER BY
-            r.departure_time
-        """
+        return find_departures(params.origin, params.destination, params.date)
+    except Exception as e:
+        logger.error(f"Error in search_ferry_routes: {str(e)}")
+        return []
+
+# Longest date window search_date_range accepts
+MAX_DATE_WINDOW_DAYS = 31
+
+def sailings_by_day(origin: str, destination: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    """
+    Summarize the sailings of a port pair for every day of a date window.
+    
+    One range scan of the departures primary key, aggregated per date in SQL,
+    or one slice of the timetable engine's columns when it is enabled. Days
+    without sailings are included so the grid has no gaps.
+    
+    Args:
+        origin: The origin port code
+        destination: The destination port code
+        start_date: First date of the window in YYYY-MM-DD format
+        end_date: Last date of the window in YYYY-MM-DD format
         
+    Returns:
+        One dict per day with the number of sailings, the cheapest fare in cents,
+        the earliest departure and the fastest duration in minutes
+    """
+    query = """
+    SELECT
+        schedule_date,
+        COUNT(*) as sailings,
+        MIN(CASE
+            WHEN indicative_price > 0 THEN indicative_price
+            WHEN min_accommodation_price > 0 THEN min_accommodation_price
+        END) as cheapest_fare,
+        MIN(CASE WHEN departure_minute >= 0 THEN departure_minute END) as earliest_departure,
+        MIN(CASE WHEN duration > 0 THEN duration END) as fastest_duration
+    FROM departures
+    WHERE origin_port_code = :origin
+      AND destination_port_code = :destination
+      AND schedule_date BETWEEN :start_date AND :end_date
+    GROUP BY schedule_date
+    """
+    engine = get_engine()
+    if engine is not None:
+        by_date = engine.day_summary(origin, destination, start_date, end_date)
+    else:
         results = execute_query(query, {
+            "origin": origin,
+            "destination": destination,
+            "start_date": start_date,
+            "end_date": end_date
+        })
+        by_date = {row[0]: row[1:] for row in results}
+    
+    days = []
+    day = datetime.strptime(start_date, "%Y-%m-%d").date()
+    last = datetime.strptime(end_date, "%Y-%m-%d").date()
+    while day <= last:
+        date = day.isoformat()
+        sailings, cheapest_fare, earliest_departure, fastest_duration = by_date.get(date, (0, None, None, None))
+        days.append({
+            "date": date,
+            "weekday": day.strftime("%a"),
+            "sailings": sailings,
+            "cheapest_fare": cheapest_fare,
+            "earliest_departure": earliest_departure,
+            "fastest_duration": fastest_duration
+        })
+        day += timedelta(days=1)
+    return days
+
+@tool
+def search_date_range(params: DateRangeParams) -> Dict[str, Any]:
+    """
+    Search ferry routes between origin and destination over a range of dates, for
+    questions like "any day next week" or "around 15 June, give or take 3 days".
+    
+    Args:
+        params: DateRangeParams containing origin, destination, start_date and end_date
+        
+    Returns:
+        A per-day calendar with the number of sailings, cheapest fare, earliest
+        departure and fastest duration, plus the cheapest and fastest days
+    """
+    try:
+        start = datetime.strptime(params.start_date, "%Y-%m-%d").date()
+        end = datetime.strptime(params.end_date, "%Y-%m-%d").date()
+        if end < start:
+            start, end = end, start
+        end = min(end, start + timedelta(days=MAX_DATE_WINDOW_DAYS - 1))
+        
+        days = sailings_by_day(params.origin, params.destination,
+                               start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+        priced = [day for day in days if day["cheapest_fare"] is not None]
+        timed = [day for day in days if day["fastest_duration"] is not None]
+        
+        return {
             "origin": params.origin,
             "destination": params.destination,
-            "date": params.date
-        })
+            "days": [{
+                "date": day["date"],
+                "weekday": day["weekday"],
+                "sailings": day["sailings"],
+                "cheapest_fare": format_price(day["cheapest_fare"]) if day["cheapest_fare"] is not None else None,
+                "earliest_departure": (f"{day['earliest_departure'] // 60:02d}:{day['earliest_departure'] % 60:02d}"
+                                       if day["earliest_departure"] is not None else None),
+                "fastest_duration": (calculate_travel_time(day["fastest_duration"])
+                                     if day["fastest_duration"] is not None else None)
+            } for day in days],
+            "cheapest_day": min(priced, key=lambda day: day["cheapest_fare"])["date"] if priced else None,
+            "fastest_day": min(timed, key=lambda day: day["fastest_duration"])["date"] if timed else None
+        }
+    except Exception as e:
+        logger.error(f"Error in search_date_range: {str(e)}")
+        return {}
+
+def month_range(month: str) -> tuple:
+    """Return the first and last date of a YYYY-MM month as YYYY-MM-DD strings."""
+    year, month_number = map(int, month.split("-")[:2])
+    last_day = calendar.monthrange(year, month_number)[1]
+    return f"{year:04d}-{month_number:02d}-01", f"{year:04d}-{month_number:02d}-{last_day:02d}"
+
+def query_fare_calendar(origin: str, destination: str, start_date: str, end_date: str) -> List[Dict[str, Any]]:
+    """
+    Read the precomputed fare calendar of a port pair for a date window: one row
+    per day with sailings, so a month costs a range scan of about 31 rows.
+    
+    Args:
+        origin: The origin port code
+        destination: The destination port code
+        start_date: First date of the window in YYYY-MM-DD format
+        end_date: Last date of the window in YYYY-MM-DD format
         
-        routes = []
-        for row in results:
-            route_data = {
-                "route_id": row[0],
-                "origin_code": row[1],
-                "origin_port_name": row[2],
-                "destination_code": row[3],
-                "destination_port_name": row[4],
-                "departure_time": row[5],
-                "arrival_time": row[6],
-                "duration": row[7],
-                "company_name": row[8],
-                "company_code": row[9],
-                "vessel_name": row[10],
-                "date": row[11].strftime('%Y-%m-%d'),
-                "indicative_price": row[12]
-            }
-            
-            # Get accommodation options
-            acc_query = """
-            SELECT
-                substr(vap.accommodation_type, 0, instr(vap.accommodation_type, '___')) as code,
-                substr(vap.accommodation_type, instr(vap.accommodation_type, '___') + 3) as name,
-                vap.price
-            FROM
-                vessels_and_accommodation_prices vap
-            WHERE
-                vap.route_id = :route_id
-                AND vap.vessel LIKE '%' || :vessel_name || '%'
-            """
-            
-            acc_results = execute_query(acc_query, {
-                "route_id": route_data["route_id"],
-                "vessel_name": route_data["vessel_name"]
-            })
-            
-            route_data["accommodations"] = [
-                {"code": row[0], "name": row[1], "price": row[2]}
-                for row in acc_results
-            ]
-            
-            routes.append(format_schedule_response(route_data))
+    Returns:
+        One dict per day with sailings, with prices in cents
+    """
+    query = """
+    SELECT
+        schedule_date,
+        sailings,
+        min_indicative_price,
+        min_accommodation_price,
+        earliest_departure,
+        latest_departure
+    FROM fare_calendar
+    WHERE origin_port_code = :origin
+      AND destination_port_code = :destination
+      AND schedule_date BETWEEN :start_date AND :end_date
+    ORDER BY schedule_date
+    """
+    results = execute_query(query, {
+        "origin": origin.strip().upper(),
+        "destination": destination.strip().upper(),
+        "start_date": start_date,
+        "end_date": end_date
+    })
+    return [{
+        "date": row[0],
+        "sailings": row[1],
+        "min_indicative_price": row[2],
+        "min_accommodation_price": row[3],
+        "earliest_departure": row[4],
+        "latest_departure": row[5]
+    } for row in results]
+
+@tool
+def get_fare_calendar(params: FareCalendarParams) -> Dict[str, Any]:
+    """
+    Get the month view of a port pair: for every day with sailings, the number of
+    sailings, the lowest fares and the first and last departure. Use this for
+    questions like "what's the cheapest day to go from Piraeus to Naxos in July".
+    
+    Args:
+        params: FareCalendarParams containing origin, destination and month
+        
+    Returns:
+        The days of the month with sailings and the cheapest day
+    """
+    try:
+        start_date, end_date = month_range(params.month)
+        days = query_fare_calendar(params.origin, params.destination, start_date, end_date)
         
-        return routes
+        def cheapest_fare(day):
+            return day["min_indicative_price"] or day["min_accommodation_price"]
+        
+        priced = [day for day in days if cheapest_fare(day)]
+        return {
+            "origin": params.origin,
+            "destination": params.destination,
+            "month": params.month,
+            "days": [{
+                "date": day["date"],
+                "sailings": day["sailings"],
+                "base_price": format_price(day["min_indicative_price"]) if day["min_indicative_price"] else None,
+                "lowest_accommodation_price": (format_price(day["min_accommodation_price"])
+                                               if day["min_accommodation_price"] else None),
+                "first_departure": day["earliest_departure"],
+                "last_departure": day["latest_departure"]
+            } for day in days],
+            "cheapest_day": min(priced, key=cheapest_fare)["date"] if priced else None
+        }
     except Exception as e:
-        logger.error(f"Error in search_ferry_routes: {str(e)}")
-        return []
+        logger.error(f"Error in get_fare_calendar: {str(e)}")
+        return {}
 
 @tool
 def get_cheapest_route(params: FerrySearchParams) -> Optional[Dict[str, Any]]:
@@ -191,12 +499,8 @@ def get_cheapest_route(params: FerrySearchParams) -> Optional[Dict[str, Any]]:
         The cheapest ferry route or None if no routes found
     """
     try:
-        routes = search_ferry_routes(params)
-        if not routes:
-            return None
-        
-        # Sort by price and return the cheapest
-        return min(routes, key=lambda x: float(x["base_price"].replace("€", "")))
+        routes = find_departures(params.origin, params.destination, params.date, order="cheapest", limit=1)
+        return routes[0] if routes else None
     except Exception as e:
         logger.error(f"Error in get_cheapest_route: {str(e)}")
         return None
@@ -213,96 +517,184 @@ def get_fastest_route(params: FerrySearchParams) -> Optional[Dict[str, Any]]:
         The fastest ferry route or None if no routes found
     """
     try:
-        # Get all routes
-        query = """
-        SELECT
-            r.route_id,
-            r.origin_port_code as origin_code,
-            r.origin_port_name as origin_name,
-            r.destination_port_code as destination_code,
-            r.destination_port_name as destination_name,
-            r.departure_time,
-            r.arrival_time,
-            r.duration,
-            r.company as company_name,
-            r.company_code as company_code,
-            substr(dv.vessel, instr(dv.vessel, '___') + 3) as vessel_name,
-            dv.schedule_date as date,
-            vip.indicative_price
-        FROM
-            routes r
-        JOIN
-            dates_and_vessels dv ON r.route_id = dv.route_id
-        LEFT JOIN
-            vessels_and_indicative_prices vip ON r.route_id = vip.route_id AND vip.vessel = dv.vessel
-        WHERE
-            r.origin_port_code = :origin
-            AND r.destination_port_code = :destination
-            AND dv.schedule_date = :date
-        ORDER BY
-            r.duration ASC
-        LIMIT 1
-        """
+        routes = find_departures(params.origin, params.destination, params.date, order="fastest", limit=1)
+        return routes[0] if routes else None
+    except Exception as e:
+        logger.error(f"Error in get_fastest_route: {str(e)}")
+        return None
+
+def _fare(route_data: Dict[str, Any]) -> Optional[int]:
+    """Fare of a sailing in cents: the indicative price, else the lowest accommodation price."""
+    return route_data["indicative_price"] or route_data["min_accommodation_price"] or None
+
+def _local_minutes(route_data: Dict[str, Any]) -> Optional[int]:
+    """Local departure of a sailing in minutes on an absolute day scale, or None if unknown."""
+    try:
+        hours, minutes = map(int, route_data["departure_time"].split(":")[:2])
+    except (AttributeError, ValueError):
+        return None
+    return datetime.strptime(route_data["date"], "%Y-%m-%d").toordinal() * 1440 + hours * 60 + minutes
+
+@tool
+def search_round_trip(params: RoundTripParams) -> List[Dict[str, Any]]:
+    """
+    Search round trips: pair every outbound sailing with every return sailing that
+    fits the constraints, and rank the pairs by combined price or travel time.
+    
+    Args:
+        params: RoundTripParams containing origin, destination, outbound_date, the
+            return_date or stay_days, and optional pairing constraints
         
-        results = execute_query(query, {
-            "origin": params.origin,
-            "destination": params.destination,
-            "date": params.date
-        })
+    Returns:
+        The best outbound and return pairs with their combined price, travel time and stay
+    """
+    try:
+        return_date = params.return_date
+        if not return_date:
+            if params.stay_days is None:
+                return []
+            outbound = datetime.strptime(params.outbound_date, "%Y-%m-%d")
+            return_date = (outbound + timedelta(days=params.stay_days)).strftime("%Y-%m-%d")
         
-        if not results:
-            return None
+        outbound_routes = [_departure_to_route_data(row) for row in
+                           query_departures(params.origin, params.destination, params.outbound_date)]
+        return_routes = [_departure_to_route_data(row) for row in
+                         query_departures(params.destination, params.origin, return_date)]
+        
+        pairs = []
+        for first in outbound_routes:
+            first_departure = _local_minutes(first)
+            if first_departure is None:
+                continue
+            arrival = first_departure + first["duration"]
             
-        row = results[0]
-        route_data = {
-            "route_id": row[0],
-            "origin_code": row[1],
-            "origin_port_name": row[2],
-            "destination_code": row[3],
-            "destination_port_name": row[4],
-            "departure_time": row[5],
-            "arrival_time": row[6],
-            "duration": row[7],
-            "company_name": row[8],
-            "company_code": row[9],
-            "vessel_name": row[10],
-            "date": row[11].strftime('%Y-%m-%d'),
-            "indicative_price": row[12]
-        }
+            for second in return_routes:
+                if params.same_company and first["company_code"] != second["company_code"]:
+                    continue
+                second_departure = _local_minutes(second)
+                if second_departure is None:
+                    continue
+                stay = second_departure - arrival
+                if stay < 0:
+                    continue
+                if params.min_stay_hours is not None and stay < params.min_stay_hours * 60:
+                    continue
+                if params.max_stay_hours is not None and stay > params.max_stay_hours * 60:
+                    continue
+                
+                fares = (_fare(first), _fare(second))
+                total_price = sum(fares) if None not in fares else None
+                pairs.append((total_price, first["duration"] + second["duration"], stay, first, second))
         
-        # Get accommodation options
-        acc_query = """
-        SELECT
-            substr(vap.accommodation_type, 0, instr(vap.accommodation_type, '___')) as code,
-            substr(vap.accommodation_type, instr(vap.accommodation_type, '___') + 3) as name,
-            vap.price
-        FROM
-            vessels_and_accommodation_prices vap
-        WHERE
-            vap.route_id = :route_id
-            AND vap.vessel LIKE '%' || :vessel_name || '%'
-        """
+        # Pairs without a known fare rank last
+        if params.order == "fastest":
+            pairs.sort(key=lambda pair: (pair[1], pair[0] is None, pair[0] or 0))
+        else:
+            pairs.sort(key=lambda pair: (pair[0] is None, pair[0] or 0, pair[1]))
+        pairs = pairs[:max(params.limit, 1)]
         
-        acc_results = execute_query(acc_query, {
-            "route_id": route_data["route_id"],
-            "vessel_name": route_data["vessel_name"]
-        })
+        accommodations = get_accommodations([(route["route_id"], route["vessel_id"])
+                                             for pair in pairs for route in pair[3:]])
         
-        route_data["accommodations"] = [
-            {"code": row[0], "name": row[1], "price": row[2]}
-            for row in acc_results
-        ]
+        def formatted(route_data):
+            route_data = dict(route_data)
+            route_data["accommodations"] = accommodations[(route_data["route_id"], route_data["vessel_id"])]
+            return format_schedule_response(route_data)
         
-        return format_schedule_response(route_data)
+        return [{
+            "outbound": formatted(first),
+            "return": formatted(second),
+            "stay": calculate_travel_time(stay),
+            "total_travel_time": calculate_travel_time(travel_time),
+            "total_price": format_price(total_price) if total_price is not None else None
+        } for total_price, travel_time, stay, first, second in pairs]
     except Exception as e:
-        logger.error(f"Error in get_fastest_route: {str(e)}")
-        return None
+        logger.error(f"Error in search_round_trip: {str(e)}")
+        return []
+
+def format_legs(legs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Format journey planner legs for the response, with their accommodations."""
+    accommodations = get_accommodations([(leg["route_id"], leg["vessel_id"]) for leg in legs])
+    formatted = []
+    for leg in legs:
+        route_data = dict(leg, indicative_price=leg["indicative_price"] or 0)
+        route_data["accommodations"] = accommodations[(leg["route_id"], leg["vessel_id"])]
+        formatted.append(format_schedule_response(route_data))
+    return formatted
+
+def format_journey(journey: Dict[str, Any]) -> Dict[str, Any]:
+    """Format a journey planner result for the response."""
+    return {
+        "legs": format_legs(journey["legs"]),
+        "transfers": journey["transfers"],
+        "total_duration": calculate_travel_time(journey["total_duration"]),
+        "connection_times": [calculate_travel_time(wait) for wait in journey["connection_waits"]],
+        "total_price": format_price(journey["total_price"]) if journey["total_price"] else None
+    }
+
+@tool
+def plan_journey(params: JourneyParams) -> List[Dict[str, Any]]:
+    """
+    Plan journeys between two ports with up to a given number of transfers,
+    including connections on later days and overnight sailings.
+    
+    Args:
+        params: JourneyParams containing origin, destination, date and the transfer limits
+        
+    Returns:
+        The earliest-arriving journeys, one per number of transfers that arrives
+        earlier than every journey with fewer transfers
+    """
+    try:
+        journeys = earliest_arrival(params.origin, params.destination, params.date,
+                                    max_transfers=params.max_transfers,
+                                    min_connection=params.min_connection_minutes,
+                                    after=params.earliest_departure)
+        return [format_journey(journey) for journey in journeys]
+    except Exception as e:
+        logger.error(f"Error in plan_journey: {str(e)}")
+        return []
+
+@tool
+def compare_route_options(params: JourneyParams) -> Dict[str, Any]:
+    """
+    Compare the ways to travel between two ports on a date, direct or with transfers.
+    
+    Use this to answer "cheapest", "fastest" and "best balance" questions together:
+    all three come from one search whose result is cached.
+    
+    Args:
+        params: JourneyParams containing origin, destination, date and the transfer limits
+        
+    Returns:
+        Dictionary with the cheapest, fastest and best_balance journeys, and the
+        options list of every journey not beaten on price, duration, transfers
+        and departure time at once
+    """
+    try:
+        result = route_options(params.origin, params.destination, params.date,
+                               max_transfers=params.max_transfers,
+                               min_connection=params.min_connection_minutes)
+        formatted = {id(journey): format_journey(journey) for journey in result["options"]}
+        return {
+            "cheapest": formatted.get(id(result["cheapest"])),
+            "fastest": formatted.get(id(result["fastest"])),
+            "best_balance": formatted.get(id(result["best_balance"])),
+            "options": list(formatted.values())
+        }
+    except Exception as e:
+        logger.error(f"Error in compare_route_options: {str(e)}")
+        return {}
 
 @tool
 def find_multi_segment_route(params: MultiSegmentParams) -> List[Dict[str, Any]]:
     """
     Find a multi-segment route with an intermediate stop.
     
+    Every sailing to the intermediate stop on the date is paired with the first
+    onward sailing that leaves at least the minimum connection time after it
+    arrives, which may be on a later day.
+    
     Args:
         params: MultiSegmentParams containing origin, destination, intermediate_stop, and date
         
@@ -310,54 +702,62 @@ def find_multi_segment_route(params: MultiSegmentParams) -> List[Dict[str, Any]]
         List of ferry routes forming a multi-segment journey
     """
     try:
-        # First segment: origin to intermediate
-        first_segment_params = FerrySearchParams(
-            origin=params.origin,
-            destination=params.intermediate_stop,
-            date=params.date
-        )
-        first_segment = search_ferry_routes(first_segment_params)
-        
-        if not first_segment:
+        pairs = connections_via(params.origin, params.intermediate_stop, params.destination, params.date)
+        if not pairs:
             return []
         
-        # Get the arrival date/time of the first segment to use for the second segment
-        first_arrival_date = params.date  # Assume same day for simplicity
-        
-        # Second segment: intermediate to destination
-        second_segment_params = FerrySearchParams(
-            origin=params.intermediate_stop,
-            destination=params.destination,
-            date=first_arrival_date
-        )
-        second_segment = search_ferry_routes(second_segment_params)
+        formatted = format_legs([leg for pair in pairs for leg in pair[:2]])
         
-        if not second_segment:
-            return []
-        
-        # Check if the connection is possible (enough time between segments)
         valid_connections = []
-        for first in first_segment:
-            first_arrival = first["arrival_time"]
-            
-            for second in second_segment:
-                second_departure = second["departure_time"]
-                
-                # Simple time string comparison (assuming HH:MM format)
-                if second_departure > first_arrival:
-                    valid_connections.append({
-                        "first_segment": first,
-                        "second_segment": second,
-                        "total_duration": f"Combined duration: {first['duration']} + {second['duration']}",
-                        "connection_time": f"Connection time: (arrive {first_arrival} → depart {second_departure})",
-                        "total_price": f"Total price: {format_price(int(float(first['base_price'].replace('€', '')) * 100) + int(float(second['base_price'].replace('€', '')) * 100))}"
-                    })
+        for i, (first, second, wait) in enumerate(pairs):
+            first_segment, second_segment = formatted[2 * i], formatted[2 * i + 1]
+            total_minutes = first["duration"] + wait + second["duration"]
+            total_price = (first["indicative_price"] or 0) + (second["indicative_price"] or 0)
+            valid_connections.append({
+                "first_segment": first_segment,
+                "second_segment": second_segment,
+                "total_duration": f"Total journey time: {calculate_travel_time(total_minutes)}",
+                "connection_time": f"Connection time: {calculate_travel_time(wait)} "
+                                   f"(arrive {first['arrival_time']} → depart {second['departure_time']} "
+                                   f"on {second['date']})",
+                "total_price": f"Total price: {format_price(total_price)}"
+            })
         
         return valid_connections
     except Exception as e:
         logger.error(f"Error in find_multi_segment_route: {str(e)}")
         return []
 
+def available_dates(origin: str, destination: str) -> List[str]:
+    """
+    The dates from today onwards on which a port pair has sailings.
+    
+    Plain function behind get_available_dates, for callers outside the agent.
+    """
+    query = """
+    SELECT
+        sc.start_date,
+        sc.end_date,
+        sc.days,
+        date('now')
+    FROM
+        routes r
+    JOIN
+        service_calendars sc ON r.route_id = sc.route_id
+    WHERE
+        r.origin_port_code = :origin
+        AND r.destination_port_code = :destination
+        AND sc.end_date >= date('now')
+    """
+    
+    results = execute_query(query, {"origin": origin, "destination": destination})
+    if not results:
+        return []
+    
+    # One bitwise OR per calendar, then the days from today onwards
+    operating = union_all(ServiceCalendar.from_row(row[0], row[1], row[2]) for row in results)
+    return operating.dates_between(results[0][3], operating.end)
+
 @tool
 def get_available_dates(origin: str, destination: str) -> List[str]:
     """
@@ -371,27 +771,39 @@ def get_available_dates(origin: str, destination: str) -> List[str]:
         List of dates (YYYY-MM-DD format) when ferries operate on this route
     """
     try:
-        query = """
-        SELECT DISTINCT
-            dv.schedule_date
-        FROM
-            routes r
-        JOIN
-            dates_and_vessels dv ON r.route_id = dv.route_id
-        WHERE
-            r.origin_port_code = :origin
-            AND r.destination_port_code = :destination
-            AND dv.schedule_date >= date('now')
-        ORDER BY
-            dv.schedule_date
-        """
-        
-        results = execute_query(query, {"origin": origin, "destination": destination})
-        return [row[0].strftime('%Y-%m-%d') for row in results]
+        return available_dates(origin, destination)
     except Exception as e:
         logger.error(f"Error in get_available_dates: {str(e)}")
         return []
 
+# Vessels matching a name as typed: an exact name, code or "CODE___NAME" key
+# first, then names starting with it, then names containing it
+VESSEL_LOOKUP_QUERY = """
+SELECT vessel_id, CASE
+    WHEN vessel_name = :name OR vessel_code = :name OR vessel = :name THEN 0
+    WHEN vessel_name LIKE :prefix ESCAPE '\\' THEN 1
+    ELSE 2
+END as tier
+FROM vessels
+WHERE vessel_name = :name OR vessel_code = :name OR vessel = :name
+    OR vessel_name LIKE :pattern ESCAPE '\\' OR vessel LIKE :pattern ESCAPE '\\'
+"""
+
+def resolve_vessel_ids(vessel_name: str) -> List[int]:
+    """
+    Resolve a possibly partial vessel name (e.g. "Blue Star" for "BLUE STAR DELOS")
+    to the IDs of its best-matching vessels in the vessels table.
+    """
+    name = vessel_name.strip().upper()
+    if not name:
+        return []
+    escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    rows = execute_query(VESSEL_LOOKUP_QUERY, {"name": name, "prefix": escaped + "%", "pattern": "%" + escaped + "%"})
+    if not rows:
+        return []
+    best = min(tier for _, tier in rows)
+    return [vessel_id for vessel_id, tier in rows if tier == best]
+
 @tool
 def get_available_accommodations(route_id: str, vessel_name: str) -> List[Dict[str, Any]]:
     """
@@ -399,27 +811,35 @@ def get_available_accommodations(route_id: str, vessel_name: str) -> List[Dict[s
     
     Args:
         route_id: The route ID
-        vessel_name: The vessel name
+        vessel_name: The vessel name, or the start or part of it
         
     Returns:
         List of accommodation types with prices
     """
     try:
-        query = """
+        # The vessel name is resolved against the small vessels table first; the
+        # prices are then read through the (route_id, vessel_id) primary key
+        vessel_ids = resolve_vessel_ids(vessel_name)
+        if not vessel_ids:
+            return []
+        placeholders = ", ".join("?" for _ in vessel_ids)
+        query = f"""
         SELECT
-            substr(vap.accommodation_type, 0, instr(vap.accommodation_type, '___')) as code,
-            substr(vap.accommodation_type, instr(vap.accommodation_type, '___') + 3) as name,
-            vap.price
+            a.accommodation_code as code,
+            a.accommodation_name as name,
+            p.price
         FROM
-            vessels_and_accommodation_prices vap
+            route_accommodation_prices p
+        JOIN
+            accommodation_types a ON a.accommodation_id = p.accommodation_id
         WHERE
-            vap.route_id = :route_id
-            AND vap.vessel LIKE '%' || :vessel_name || '%'
+            p.route_id = ?
+            AND p.vessel_id IN ({placeholders})
         ORDER BY
-            vap.price
+            p.price
         """
         
-        results = execute_query(query, {"route_id": route_id, "vessel_name": vessel_name})
+        results = execute_query(query, [route_id] + vessel_ids)
         return [
             {
                 "code": row[0],
@@ -438,9 +858,14 @@ def get_tools():
         get_all_ports,
         extract_query_parameters,
         search_ferry_routes,
+        search_date_range,
+        get_fare_calendar,
         get_cheapest_route,
         get_fastest_route,
+        search_round_trip,
         find_multi_segment_route,
+        plan_journey,
+        compare_route_options,
         get_available_dates,
         get_available_accommodations
     ]
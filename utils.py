@@ -84,77 +84,172 @@ def extract_date_from_text(text: str) -> Optional[str]:
     
     return None
 
-def extract_ports_from_text(text: str, ports_list: List[Dict[str, str]]) -> Tuple[Optional[str], Optional[str]]:
+# Words that mark the port after them as the origin or the destination
+ORIGIN_INDICATORS = ['from', 'starting at', 'departing from', 'leaving from']
+DEST_INDICATORS = ['to', 'going to', 'arriving at', 'arriving in', 'destination']
+
+_INDICATOR_PATTERN = re.compile(
+    r'\b(' + '|'.join(sorted(map(re.escape, ORIGIN_INDICATORS + DEST_INDICATORS), key=len, reverse=True)) + r')\b'
+)
+
+# Words of a text, as the whole-word check of PortMatcher sees them
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+class PortMatcher:
+    """
+    Aho-Corasick automaton over the lower-cased names of the ports, plus a
+    lookup of their codes.
+
+    One left-to-right pass over a text reports every occurrence of every name,
+    however many ports there are. Names match case-insensitively, but codes only
+    as upper-case words: many codes are English words (AND, HER, BAR, IOS), so
+    "Paros with her car" must not mention Heraklion. Occurrences inside a longer
+    word are dropped, and overlapping occurrences keep the leftmost, then longest
+    one, so "Agios Nikolaos" wins over "Agios".
+    """
+
+    def __init__(self, ports_list: List[Dict[str, str]]):
+        patterns = {port['name'].lower(): port['code'] for port in ports_list if port.get('name')}
+        self.code_words = {port['code'].upper(): port['code'] for port in ports_list if port.get('code')}
+
+        self.ports_list = ports_list
+        self.codes = []  # pattern index -> port code
+        self.lengths = []  # pattern index -> pattern length
+        self.goto = [{}]  # node -> {character: node}
+        self.outputs = [[]]  # node -> pattern indexes ending there, via fail links too
+        for pattern, code in patterns.items():
+            node = 0
+            for char in pattern:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.outputs.append([])
+                node = child
+            self.outputs[node].append(len(self.codes))
+            self.codes.append(code)
+            self.lengths.append(len(pattern))
+
+        # Breadth-first fail links: the longest proper suffix that is also in the trie
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+                queue.append(child)
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """
+        Find the ports mentioned in a text.
+
+        Args:
+            text: Text to scan; names match case-insensitively, codes only in upper case
+
+        Returns:
+            List of (start, end, port_code) in text order, with end exclusive,
+            as positions in text.lower()
+        """
+        lowered = text.lower()
+        goto, fail, outputs, lengths = self.goto, self.fail, self.outputs, self.lengths
+        candidates = []
+        node = 0
+        for position, char in enumerate(lowered):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in outputs[node]:
+                end = position + 1
+                start = end - lengths[index]
+                # Whole words only
+                if start > 0 and lowered[start - 1].isalnum():
+                    continue
+                if end < len(lowered) and lowered[end].isalnum():
+                    continue
+                candidates.append((start, -end, 1, self.codes[index]))
+
+        # Codes override names that spell the same, as in the original lookup map
+        for match in WORD_PATTERN.finditer(text):
+            word = match.group()
+            if word in self.code_words and word.isupper():
+                candidates.append((match.start(), -match.end(), 0, self.code_words[word]))
+
+        mentions = []
+        covered = 0
+        for start, negative_end, _, code in sorted(candidates):
+            if start >= covered:
+                mentions.append((start, -negative_end, code))
+                covered = -negative_end
+        return mentions
+
+_matcher = None
+_matcher_version = None
+
+def get_port_matcher(ports_list: List[Dict[str, str]]) -> PortMatcher:
+    """
+    Return the port matcher for the current data version, building it on first use
+    or when called with a different port list.
+    """
+    global _matcher, _matcher_version
+    from db import get_data_version
+
+    version = get_data_version()
+    matcher = _matcher
+    if (matcher is None or _matcher_version != version or
+            (matcher.ports_list is not ports_list and matcher.ports_list != ports_list)):
+        matcher = PortMatcher(ports_list)
+        _matcher, _matcher_version = matcher, version
+    return matcher
+
+def extract_ports_from_text(text: str, ports_list: List[Dict[str, str]],
+                            matcher: Optional[PortMatcher] = None) -> Tuple[Optional[str], Optional[str]]:
     """
     Extract origin and destination ports from text based on available ports.
+
+    Each port mention takes its role from the nearest origin or destination
+    indicator between it and the previous mention ("from Naxos to Paros").
+    Mentions without an indicator fill the origin first, then the destination.
     
     Args:
         text: The user's query text
         ports_list: List of port dictionaries with 'code' and 'name' keys
+        matcher: Optional prebuilt PortMatcher for ports_list, such as the one
+            of the port directory
     
     Returns:
         Tuple of (origin_code, destination_code)
     """
-    port_names = {port['name'].lower(): port['code'] for port in ports_list}
-    port_codes = {port['code'].lower(): port['code'] for port in ports_list}
-    
-    # Combined map for lookup
-    port_map = {**port_names, **port_codes}
-    
-    # Common prepositions indicating origin/destination
-    origin_indicators = ['from', 'starting at', 'departing from', 'leaving from']
-    dest_indicators = ['to', 'going to', 'arriving at', 'arriving in', 'destination']
-    
+    if matcher is None:
+        matcher = get_port_matcher(ports_list)
+    lowered = text.lower()
     origin = None
     destination = None
-    
-    # Check for ports by name or code
-    words = text.lower().split()
-    for port_name, port_code in port_map.items():
-        if port_name in text.lower():
-            # Determine if it's origin or destination based on position and context
-            port_pos = text.lower().find(port_name)
-            
-            # Check for origin indicators
-            is_origin = any(ind in text.lower()[:port_pos] for ind in origin_indicators)
-            
-            # Check for destination indicators
-            is_dest = any(ind in text.lower()[:port_pos] for ind in dest_indicators)
-            
-            if is_origin and not origin:
-                origin = port_code
-            elif is_dest and not destination:
-                destination = port_code
-            elif not origin:
-                origin = port_code
-            elif not destination:
-                destination = port_code
-    
-    # If we identified both, return them
-    if origin and destination:
-        return origin, destination
-    
-    # If we only found one, try to infer the other from common patterns
-    if origin and not destination:
-        # Look for words after "to"
-        to_index = text.lower().find(" to ")
-        if to_index > 0:
-            after_to = text[to_index+4:].split()
-            for word in after_to:
-                word = word.lower().strip(".,?!")
-                if word in port_map:
-                    destination = port_map[word]
-                    break
-    
-    if destination and not origin:
-        # Look for words after "from"
-        from_index = text.lower().find(" from ")
-        if from_index > 0:
-            after_from = text[from_index+6:].split()
-            for word in after_from:
-                word = word.lower().strip(".,?!")
-                if word in port_map:
-                    origin = port_map[word]
-                    break
-    
+
+    previous_end = 0
+    for start, end, port_code in matcher.find_all(text):
+        indicators = _INDICATOR_PATTERN.findall(lowered, previous_end, start)
+        previous_end = end
+        if port_code in (origin, destination):
+            continue
+
+        is_origin = bool(indicators) and indicators[-1] in ORIGIN_INDICATORS
+        is_dest = bool(indicators) and indicators[-1] in DEST_INDICATORS
+
+        if is_origin and not origin:
+            origin = port_code
+        elif is_dest and not destination:
+            destination = port_code
+        elif not origin:
+            origin = port_code
+        elif not destination:
+            destination = port_code
+
+        if origin and destination:
+            break
+
     return origin, destination